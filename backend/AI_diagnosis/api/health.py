@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from AI_diagnosis.resources import resources
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is up and serving its event loop."""
+    return {"status": "ok"}
+
+
+@router.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: clients created and catalogue/embedder warmed (503 until then)."""
+    status = resources.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+
+from AI_diagnosis.utils.metrics import metrics_payload
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint: stage latency histograms and cache/fallback/timeout/token counters."""
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
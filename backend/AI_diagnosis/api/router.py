@@ -1,67 +1,308 @@
-from fastapi import APIRouter, Depends, HTTPException,status
-from sqlalchemy.ext.asyncio import AsyncSession
-from AI_diagnosis.models.request_response import DiagnoseRequest, DiagnoseResponse, LLMResponse,QuickFix
-from AI_diagnosis.services.diagnosis_service import DiagnosisService
-from AI_diagnosis.db.db_engine import get_supabase
-from supabase import Client
-import logging
-
-router = APIRouter(prefix="/AI_diagnosis", tags=["diagnosis"])
-logger = logging.getLogger("api.diagnosis")
-
-
-async def get_session() -> Client:
-   
-    try:
-        return await get_supabase()
-    except Exception as e:
-        logger.exception("Failed to connect to Supabase: %s", e)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Database connection failed."
-        )
-
-
-
-@router.post("/dtc_diagnose", response_model=DiagnoseResponse)
-async def diagnose(req: DiagnoseRequest, client: Client = Depends(get_session)):
-
-    try:
-        svc = DiagnosisService(client)
-        result = await svc.run(req.dtc, req.vehicle.model_dump(), req.vehicle.pid_snapshot)
-        sources = result.get("sources", [])
-        llm_resp = result.get("llm")
-        catalogue_discussion = result.get("catalogue_links",[])
-
-        # If the LLM failed to respond or returned invalid JSON
-        if not llm_resp:
-            logger.warning("LLM returned no valid response for DTC %s", req.dtc)
-            fallback = LLMResponse(
-                dtc_code=req.dtc,
-                dtc_meaning="N/A",
-                summary="The AI model did not return a structured diagnosis.",
-                severity="LOW",
-                causes=["Incomplete context or model timeout."],
-                effects=["Unable to analyze current vehicle data."],
-                quick_fixes=[QuickFix( # FIX: Use QuickFix model with structured data
-                    step="Try again later or verify DTC code and PID snapshot.",
-                    location_tip="This is a general troubleshooting suggestion and does not apply to a specific part."
-                )],
-
-                safety_advice="If the warning light stays on or the car behaves abnormally, have it inspected by a qualified technician.",
-                technical_terms={}
-            )
-            return DiagnoseResponse(vehicle=req.vehicle, results=[fallback])
-
-        # Successful response
-        return DiagnoseResponse(vehicle=req.vehicle, results=[llm_resp],reddit_sources=sources, dtc_catalogue_links=catalogue_discussion)
-
-    except HTTPException:
-        # Already a handled FastAPI error
-        raise
-    except Exception as e:
-        logger.exception("Unexpected error in /AI_diagnosis/dtc_diagnose: %s", e)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred during diagnosis."
-        )
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from AI_diagnosis.models.request_response import BatchDiagnoseRequest, DiagnoseRequest, DiagnoseResponse, LLMResponse, MultiDiagnoseRequest, QuickFix
+from AI_diagnosis.services.diagnosis_service import DiagnosisService, fallback_llm_response, fast_path_stats
+from AI_diagnosis.services.cache_service import diagnosis_cache
+from AI_diagnosis.services.history_service import HistoryService
+from AI_diagnosis.services.llm_service import GROQ_MODEL, gateway, repair_stats
+from AI_diagnosis.db.db_engine import get_supabase
+from AI_diagnosis.db.catalogue_index import catalogue_index
+from AI_diagnosis.db.repositories import DTCCatalogueRepo
+from AI_diagnosis.utils import singleflight
+from AI_diagnosis.utils.metrics import prompt_log_stats
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+import json
+import logging
+import os
+import secrets
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+router = APIRouter(prefix="/AI_diagnosis", tags=["diagnosis"])
+logger = logging.getLogger("api.diagnosis")
+
+# shared secret for the maintenance routes (cache flush, catalogue reload); unset = those routes are off
+ADMIN_TOKEN = os.getenv("AI_DIAGNOSIS_ADMIN_TOKEN", "")
+
+
+async def get_session() -> "Client":
+   
+    try:
+        return await get_supabase()
+    except Exception as e:
+        logger.exception("Failed to connect to Supabase: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database connection failed."
+        )
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """403 unless the X-Admin-Token header matches AI_DIAGNOSIS_ADMIN_TOKEN."""
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required.")
+
+
+VehicleCheck = Callable[[str], Awaitable[None]]
+
+
+async def _any_vehicle(vehicle_id: str) -> None:
+    return None
+
+
+def vehicle_access() -> VehicleCheck:
+    """
+    Check for the routes that read a vehicle's history: `await check(vehicle_id)`
+    raises HTTPException when the caller may not see that vehicle. There are no
+    accounts here, so any vehicle goes; the backend app overrides this
+    dependency with its ownership check.
+    """
+    return _any_vehicle
+
+
+@router.post("/dtc_diagnose", response_model=DiagnoseResponse)
+async def diagnose(req: DiagnoseRequest, client: "Client" = Depends(get_session),
+                   check_vehicle: VehicleCheck = Depends(vehicle_access)):
+    if req.vehicle_id is not None:
+        await check_vehicle(str(req.vehicle_id))
+    try:
+        history = HistoryService(client) if req.vehicle_id else None
+        if history is not None and req.reuse_max_age_s is not None:
+            stored = await history.reusable(str(req.vehicle_id), req.dtc, req.reuse_max_age_s)
+            if stored is not None:
+                return DiagnoseResponse.model_validate(
+                    {**stored["response"], "history_id": stored["id"], "diagnosed_at": stored["created_at"]}
+                )
+
+        svc = DiagnosisService(client)
+        result = await svc.run(req.dtc, req.vehicle.model_dump(), req.vehicle.pid_snapshot)
+        sources = result.get("sources", [])
+        llm_resp = result.get("llm")
+        catalogue_discussion = result.get("catalogue_links",[])
+
+        # If the LLM failed to respond or returned invalid JSON
+        if not llm_resp:
+            logger.warning("LLM returned no valid response for DTC %s", req.dtc)
+            fallback = fallback_llm_response(req.dtc)
+            return DiagnoseResponse(vehicle=req.vehicle, results=[fallback])
+
+        # Successful response
+        response = DiagnoseResponse(vehicle=req.vehicle, results=[llm_resp],reddit_sources=sources, dtc_catalogue_links=catalogue_discussion,
+                                    answer_source=result.get("answer_source", "llm"),
+                                    diagnosed_at=datetime.now(timezone.utc))
+        if history is not None:
+            response.history_id = await history.record(
+                str(req.vehicle_id), req.dtc,
+                request=req.model_dump(mode="json"),
+                response=response.model_dump(mode="json", exclude={"history_id", "diagnosed_at"}),
+                model=GROQ_MODEL if response.answer_source == "llm" else "catalogue",
+                answer_source=response.answer_source,
+            )
+        return response
+
+    except HTTPException:
+        # Already a handled FastAPI error
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error in /AI_diagnosis/dtc_diagnose: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during diagnosis."
+        )
+
+
+@router.post("/dtc_diagnose/multi", response_model=DiagnoseResponse)
+async def diagnose_multi(req: MultiDiagnoseRequest, client: "Client" = Depends(get_session)):
+    """
+    Codes from the same scan (e.g. P0171 + P0174) diagnosed together in one
+    LLM call: one entry in results per code, in request order, plus a
+    joint_summary of the likely shared root cause.
+    """
+    try:
+        svc = DiagnosisService(client)
+        result = await svc.run_multi(req.dtcs, req.vehicle.model_dump(), req.vehicle.pid_snapshot)
+        answers = result.get("llm") or {}
+        if not answers:
+            logger.warning("LLM returned no valid response for DTCs %s", req.dtcs)
+            return DiagnoseResponse(vehicle=req.vehicle, results=[fallback_llm_response(dtc) for dtc in req.dtcs])
+
+        codes = list(dict.fromkeys(req.dtcs))
+        return DiagnoseResponse(
+            vehicle=req.vehicle,
+            results=[answers.get(dtc) or fallback_llm_response(dtc) for dtc in codes],
+            reddit_sources=result.get("sources", []),
+            dtc_catalogue_links=result.get("catalogue_links", []),
+            joint_summary=result.get("joint_summary") or None,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error in /AI_diagnosis/dtc_diagnose/multi: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during diagnosis."
+        )
+
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(jsonable_encoder(event), separators=(",", ":")) + "\n").encode("utf-8")
+
+
+@router.post("/dtc_diagnose/stream")
+async def diagnose_stream(req: DiagnoseRequest, client: "Client" = Depends(get_session)):
+    """
+    Same diagnosis as /dtc_diagnose, streamed as NDJSON: catalogue data and
+    reddit sources first, then one "field" event per LLMResponse field as
+    soon as it is generated, and finally a "result" event carrying the
+    full DiagnoseResponse.
+    """
+    svc = DiagnosisService(client)
+
+    async def events():
+        try:
+            async for event in svc.stream(req.dtc, req.vehicle.model_dump(), req.vehicle.pid_snapshot):
+                if event["event"] != "result":
+                    yield _ndjson(event)
+                    continue
+                llm_resp = event.get("llm")
+                if not llm_resp:
+                    logger.warning("LLM returned no valid response for DTC %s", req.dtc)
+                    response = DiagnoseResponse(vehicle=req.vehicle, results=[fallback_llm_response(req.dtc)])
+                else:
+                    response = DiagnoseResponse(
+                        vehicle=req.vehicle,
+                        results=[llm_resp],
+                        reddit_sources=event.get("sources", []),
+                        dtc_catalogue_links=event.get("catalogue_links", []),
+                        answer_source=event.get("answer_source", "llm"),
+                    )
+                yield _ndjson({"event": "result", "data": response})
+        except Exception as e:
+            logger.exception("Unexpected error in /AI_diagnosis/dtc_diagnose/stream: %s", e)
+            yield _ndjson({"event": "error", "detail": "An unexpected error occurred during diagnosis."})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.post("/dtc_diagnose/batch")
+async def diagnose_batch(batch: BatchDiagnoseRequest, client: "Client" = Depends(get_session)):
+    """
+    Fleet diagnosis: many DiagnoseRequest items in one call, streamed back as
+    NDJSON "item" events ({"index", "fallback", "data": DiagnoseResponse}) in
+    completion order, then one "done" event. Items sharing a DTC share the
+    catalogue lookup and retrieval; a failed item gets the fallback answer.
+    """
+    svc = DiagnosisService(client)
+    items = [(req.dtc, req.vehicle.model_dump(), req.vehicle.pid_snapshot) for req in batch.items]
+
+    async def events():
+        failed = 0
+        async for index, result in svc.run_batch(items):
+            req = batch.items[index]
+            llm_resp = (result or {}).get("llm")
+            if not llm_resp:
+                failed += 1
+                response = DiagnoseResponse(vehicle=req.vehicle, results=[fallback_llm_response(req.dtc)])
+            else:
+                response = DiagnoseResponse(
+                    vehicle=req.vehicle,
+                    results=[llm_resp],
+                    reddit_sources=result.get("sources", []),
+                    dtc_catalogue_links=result.get("catalogue_links", []),
+                    answer_source=result.get("answer_source", "llm"),
+                )
+            yield _ndjson({"event": "item", "index": index, "fallback": not llm_resp, "data": response})
+        yield _ndjson({"event": "done", "count": len(items), "fallbacks": failed})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.get("/history/vehicle/{vehicle_id}")
+async def diagnosis_history(
+    vehicle_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    dtc: Optional[str] = Query(None),
+    client: "Client" = Depends(get_session),
+    check_vehicle: VehicleCheck = Depends(vehicle_access),
+):
+    """A vehicle's saved diagnoses, newest first, keyset-paginated."""
+    await check_vehicle(vehicle_id)
+    try:
+        return await HistoryService(client).list(vehicle_id, limit=limit, cursor=cursor, dtc=dtc)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.exception("Failed to list diagnosis history for %s: %s", vehicle_id, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not load diagnosis history.")
+
+
+@router.get("/history/{diagnosis_id}")
+async def diagnosis_history_item(diagnosis_id: str, client: "Client" = Depends(get_session),
+                                 check_vehicle: VehicleCheck = Depends(vehicle_access)):
+    try:
+        stored = await HistoryService(client).get(diagnosis_id)
+    except Exception as e:
+        logger.exception("Failed to load diagnosis %s: %s", diagnosis_id, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not load diagnosis.")
+    if stored is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Diagnosis not found")
+    await check_vehicle(stored["vehicle_id"])
+    return stored
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {**diagnosis_cache.stats(), "fast_path": fast_path_stats}
+
+
+@router.get("/singleflight/stats")
+async def singleflight_stats():
+    return singleflight.all_stats()
+
+
+@router.get("/llm/stats")
+async def llm_stats():
+    failures = repair_stats["json_failures"]
+    return {
+        **gateway.stats(),
+        "json_repair": {**repair_stats, "repair_rate": repair_stats["repaired"] / failures if failures else None},
+        "prompt_log": prompt_log_stats,
+    }
+
+
+@router.delete("/cache/{dtc}", dependencies=[Depends(require_admin)])
+async def invalidate_cache(dtc: str):
+    removed = diagnosis_cache.invalidate_dtc(dtc)
+    return {"dtc": dtc.strip().upper(), "removed": removed}
+
+
+@router.get("/catalogue")
+async def catalogue_lookup(
+    codes: str = Query(..., description="Comma-separated DTC codes, e.g. P0171,P0174"),
+    client: "Client" = Depends(get_session),
+):
+    rows = await DTCCatalogueRepo(client).get_many(codes.split(","))
+    return {"results": rows}
+
+
+@router.get("/catalogue/family/{prefix}")
+async def catalogue_family(prefix: str, client: "Client" = Depends(get_session)):
+    rows = await DTCCatalogueRepo(client).get_family(prefix)
+    return {"prefix": prefix.strip().upper(), "results": rows}
+
+
+@router.post("/catalogue/refresh", dependencies=[Depends(require_admin)])
+async def catalogue_refresh():
+    try:
+        changed = await catalogue_index.refresh()
+    except RuntimeError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Catalogue index not started.")
+    except Exception as e:
+        logger.exception("Catalogue refresh failed: %s", e)
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Catalogue refresh failed.")
+    return {"changed": changed}
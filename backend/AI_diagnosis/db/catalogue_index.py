@@ -0,0 +1,188 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+
+from AI_diagnosis.db.db_engine import run_io
+from AI_diagnosis.utils.links import parse_discussion_links
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("db.catalogue_index")
+
+CATALOGUE_TABLE = "DTC_Catalogue"
+CATALOGUE_PAGE_SIZE = int(os.getenv("DTC_CATALOGUE_PAGE_SIZE", "1000"))
+CATALOGUE_REFRESH_S = float(os.getenv("DTC_CATALOGUE_REFRESH_S", "900"))
+
+
+def _fingerprint(row: dict) -> str:
+    raw = json.dumps(row, separators=(",", ":"), sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Snapshot:
+    """Immutable view of the catalogue; swapped atomically on refresh."""
+
+    def __init__(self, rows: Iterable[dict]):
+        self.rows: Dict[str, dict] = {}
+        self.links: Dict[str, List[Dict[str, str]]] = {}
+        self.fingerprints: Dict[str, str] = {}
+        for row in rows:
+            code = str(row.get("code") or "").strip().upper()
+            if not code:
+                continue
+            self.rows[code] = row
+            self.links[code] = parse_discussion_links(row.get("discussions", ""))
+            self.fingerprints[code] = _fingerprint(row)
+        self.sorted_codes: List[str] = sorted(self.rows)
+
+
+class DTCCatalogueIndex:
+    """
+    In-process copy of the DTC_Catalogue table.
+
+    The catalogue is small and rarely edited, so it is loaded once at
+    startup (discussion links pre-parsed) and refreshed in the background
+    every DTC_CATALOGUE_REFRESH_S seconds or when refresh() is called.
+    Listeners registered with on_change() receive every code whose row
+    was added, edited or removed.
+    """
+
+    def __init__(self, refresh_interval: float = CATALOGUE_REFRESH_S):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._client: Optional["Client"] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self._listeners: List[Callable[[str], Any]] = []
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def on_change(self, listener: Callable[[str], Any]) -> None:
+        self._listeners.append(listener)
+
+    # ---------- loading ----------
+    def fetch_rows(self, client: "Client") -> List[dict]:
+        """Read the whole table page by page (blocking)."""
+        rows: List[dict] = []
+        offset = 0
+        while True:
+            resp = (
+                client.table(CATALOGUE_TABLE)
+                .select("*")
+                .order("code")
+                .range(offset, offset + CATALOGUE_PAGE_SIZE - 1)
+                .execute()
+            )
+            page = resp.data or []
+            rows.extend(page)
+            if len(page) < CATALOGUE_PAGE_SIZE:
+                return rows
+            offset += CATALOGUE_PAGE_SIZE
+
+    async def refresh(self) -> List[str]:
+        """Reload the table; returns the codes that changed since the last load."""
+        if self._client is None:
+            raise RuntimeError("DTCCatalogueIndex.start() has not been called")
+
+        async with self._refresh_lock:
+            rows = await run_io(self.fetch_rows, self._client)
+            new = _Snapshot(rows)
+            old = self._snapshot
+            self._snapshot = new
+
+        if old is None:
+            logger.info("Loaded %s DTC catalogue rows", len(new.rows))
+            return []
+
+        changed = [
+            code
+            for code in set(old.fingerprints) | set(new.fingerprints)
+            if old.fingerprints.get(code) != new.fingerprints.get(code)
+        ]
+        if changed:
+            logger.info("DTC catalogue refresh: %s rows changed", len(changed))
+            for code in changed:
+                for listener in self._listeners:
+                    try:
+                        listener(code)
+                    except Exception as e:
+                        logger.error("Catalogue change listener failed for %s: %s", code, e)
+        return changed
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("DTC catalogue refresh failed: %s", e)
+
+    async def start(self, client: "Client") -> None:
+        self._client = client
+        try:
+            await self.refresh()
+        except Exception as e:
+            # not fatal: DTCCatalogueRepo falls back to per-request queries
+            logger.error("Initial DTC catalogue load failed: %s", e)
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---------- lookups ----------
+    def get(self, code: str) -> Optional[dict]:
+        snap = self._snapshot
+        if snap is None or not code:
+            return None
+        return snap.rows.get(code.strip().upper())
+
+    def get_links(self, code: str) -> List[Dict[str, str]]:
+        snap = self._snapshot
+        if snap is None or not code:
+            return []
+        return snap.links.get(code.strip().upper(), [])
+
+    def get_many(self, codes: Iterable[str]) -> Dict[str, dict]:
+        snap = self._snapshot
+        if snap is None:
+            return {}
+        found: Dict[str, dict] = {}
+        for code in codes:
+            key = (code or "").strip().upper()
+            if key in snap.rows:
+                found[key] = snap.rows[key]
+        return found
+
+    def family(self, prefix: str) -> List[dict]:
+        """
+        All rows whose code starts with prefix, e.g. "P03" for the misfire
+        family. Trailing 'x'/'X' placeholders ("P03xx") are ignored.
+        """
+        snap = self._snapshot
+        if snap is None:
+            return []
+        prefix = (prefix or "").strip().upper().rstrip("X")
+        start = bisect.bisect_left(snap.sorted_codes, prefix)
+        rows: List[dict] = []
+        for code in snap.sorted_codes[start:]:
+            if not code.startswith(prefix):
+                break
+            rows.append(snap.rows[code])
+        return rows
+
+
+catalogue_index = DTCCatalogueIndex()
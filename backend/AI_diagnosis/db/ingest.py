@@ -0,0 +1,418 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger("db.ingest")
+
+# sqlite file recording what has been written: chunk hashes, post digests, file offsets
+INGEST_STATE = os.getenv("INGEST_STATE", ".ingest_state.sqlite")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "1000"))
+INGEST_RETRIES = int(os.getenv("INGEST_RETRIES", "5"))
+# ~180 words stays under the embedder's 256-token window (EMBEDDER_MAX_TOKENS)
+INGEST_CHUNK_WORDS = int(os.getenv("INGEST_CHUNK_WORDS", "180"))
+INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "30"))
+INGEST_MIN_WORDS = int(os.getenv("INGEST_MIN_WORDS", "8"))
+
+EMBEDDINGS_TABLE = "reddit_embeddings"
+
+_DTC_RE = re.compile(r"\b([PBCU][0-3][0-9A-F]{3})\b", re.IGNORECASE)
+_REMOVED = {"", "[deleted]", "[removed]"}
+# keeps PostgREST URLs short for in.(...) filters
+_DELETE_SLICE = 200
+
+
+@dataclass
+class Post:
+    post_id: str
+    text: str
+    metadata: dict
+    end_offset: int
+    digest: str = ""
+    hashes: List[str] = field(default_factory=list)
+
+
+def content_hash(text: str) -> str:
+    """Hash of the whitespace/case-normalized text; the upsert key of a chunk."""
+    return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def find_dtcs(text: str) -> List[str]:
+    """DTCs mentioned in the text, most mentioned first."""
+    return [code for code, _ in Counter(c.upper() for c in _DTC_RE.findall(text)).most_common()]
+
+
+def chunk_words(text: str, size: int = INGEST_CHUNK_WORDS, overlap: int = INGEST_CHUNK_OVERLAP) -> List[str]:
+    """Overlapping windows of `size` words; short posts are a single chunk."""
+    words = text.split()
+    if len(words) <= size:
+        return [" ".join(words)]
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+def parse_post(obj: dict, end_offset: int) -> Optional[Post]:
+    """A Reddit submission or comment from a dump line (Pushshift/API field names)."""
+    is_submission = "title" in obj
+    post_id = obj.get("name") or f"{'t3' if is_submission else 't1'}_{obj.get('id', '')}"
+    if post_id.endswith("_"):
+        return None
+    body = (obj.get("selftext") if is_submission else obj.get("body")) or ""
+    body = "" if body.strip() in _REMOVED else body.strip()
+    title = (obj.get("title") or "").strip()
+    text = f"{title}\n\n{body}".strip() if title else body
+
+    permalink = obj.get("permalink")
+    url = f"https://www.reddit.com{permalink}" if permalink else obj.get("url")
+    metadata = {
+        "post_id": post_id,
+        "subreddit": obj.get("subreddit"),
+        "title": title or None,
+        "url": url,
+        "created_utc": obj.get("created_utc"),
+    }
+    return Post(post_id=post_id, text=text, metadata=metadata, end_offset=end_offset)
+
+
+def iter_posts(path: str, offset: int = 0) -> Iterator[Post]:
+    """
+    Stream posts from a .jsonl (or .jsonl.gz) dump starting at byte
+    `offset`; each post carries the offset just past its line so the
+    caller can checkpoint.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                post = parse_post(json.loads(line), offset)
+            except (ValueError, AttributeError) as e:
+                logger.warning("Skipping bad line before offset %s in %s: %s", offset, path, e)
+                continue
+            if post is not None:
+                yield post
+
+
+class IngestState:
+    """
+    What has already been written to reddit_embeddings, kept on disk so a
+    run over millions of posts needs no in-memory index:
+      chunk_posts - (content hash, post) for every stored chunk and every post
+                    containing it; a chunk is deleted once no post maps to it
+      posts       - digest of every fully ingested post (unchanged posts are skipped)
+      files       - offset reached in each dump (resume point, in uncompressed
+                    bytes) and the file's size on disk when it was recorded
+    """
+
+    def __init__(self, path: str = INGEST_STATE):
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            pragma journal_mode = wal;
+            create table if not exists chunk_posts (
+                content_hash text not null, post_id text not null, primary key (content_hash, post_id)
+            );
+            create index if not exists chunk_posts_post_idx on chunk_posts (post_id);
+            create table if not exists posts (post_id text primary key, digest text not null);
+            create table if not exists files (path text primary key, offset integer not null, size integer);
+        """)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        # state files written before chunks could belong to several posts / before files.size
+        with self.db:
+            tables = {r[0] for r in self.db.execute("select name from sqlite_master where type = 'table'")}
+            if "chunks" in tables:
+                self.db.execute("insert or ignore into chunk_posts select content_hash, post_id from chunks")
+                self.db.execute("drop table chunks")
+            if "size" not in {r[1] for r in self.db.execute("pragma table_info(files)")}:
+                self.db.execute("alter table files add column size integer")
+
+    def post_digest(self, post_id: str) -> Optional[str]:
+        row = self.db.execute("select digest from posts where post_id = ?", (post_id,)).fetchone()
+        return row[0] if row else None
+
+    def has_chunk(self, digest: str) -> bool:
+        return self.db.execute("select 1 from chunk_posts where content_hash = ?", (digest,)).fetchone() is not None
+
+    def chunks_of(self, post_id: str) -> List[str]:
+        return [r[0] for r in self.db.execute("select content_hash from chunk_posts where post_id = ?", (post_id,))]
+
+    def offset(self, path: str) -> int:
+        row = self.db.execute("select offset, size from files where path = ?", (path,)).fetchone()
+        if not row:
+            return 0
+        offset, size = row
+        # a dump rewritten in place (now smaller on disk than when we read it) is
+        # read again; compare sizes on disk, since for .gz the offset is uncompressed
+        return offset if (offset if size is None else size) <= os.path.getsize(path) else 0
+
+    def replace_chunks(self, posts: Iterable[Post], keep: Set[str]) -> List[str]:
+        """
+        Map each post to exactly its current chunks (not committed) and return
+        the hashes it dropped that no post maps to any more and are not in keep.
+        """
+        dropped = set()
+        for post in posts:
+            dropped.update(h for h in self.chunks_of(post.post_id) if h not in post.hashes)
+            self.db.execute("delete from chunk_posts where post_id = ?", (post.post_id,))
+            self.db.executemany(
+                "insert or ignore into chunk_posts (content_hash, post_id) values (?, ?)",
+                ((h, post.post_id) for h in post.hashes),
+            )
+        return sorted(h for h in dropped if h not in keep and not self.has_chunk(h))
+
+    def commit(self, posts: Iterable[Post], path: str, offset: int, size: int) -> None:
+        with self.db:
+            self.db.executemany(
+                "insert into posts (post_id, digest) values (?, ?) "
+                "on conflict (post_id) do update set digest = excluded.digest",
+                ((p.post_id, p.digest) for p in posts),
+            )
+            self.db.execute(
+                "insert into files (path, offset, size) values (?, ?, ?) "
+                "on conflict (path) do update set offset = excluded.offset, size = excluded.size",
+                (path, offset, size),
+            )
+
+
+# ---------- embedding workers ----------
+
+_worker_backend = None
+
+
+def _init_worker(backend_name: str) -> None:
+    global _worker_backend
+    from AI_diagnosis.utils.embedder import create_backend
+
+    _worker_backend = create_backend(backend_name)
+
+
+def _embed(texts: List[str]) -> List[List[float]]:
+    return _worker_backend.embed_many(texts)
+
+
+@dataclass
+class _Batch:
+    path: str
+    size: int                                     # file size on disk when reading started
+    offset: int                                   # file offset after the last finished post
+    chunks: List[Tuple[str, dict]] = field(default_factory=list)   # (post id, row)
+    posts: List[Post] = field(default_factory=list)                # posts finished in this batch
+    future: Optional[Future] = None
+
+
+class RedditIngestor:
+    """
+    Dump files -> chunks -> embeddings -> reddit_embeddings.
+
+    Posts are read one line at a time, chunked and hashed; chunks already
+    stored (same content hash) are not embedded again. New chunks are
+    embedded EMBED_BATCH at a time in a process pool (one model per worker)
+    with at most 2x workers batches in flight, then upserted WRITE_BATCH rows
+    at a time on content_hash. Batches complete in read order, so after
+    each write the state file records the posts finished so far and the
+    offset to resume from. A changed post has the chunks it no longer
+    contains deleted, unless another post still contains them.
+    """
+
+    def __init__(self, client, state: IngestState, workers: int = INGEST_WORKERS,
+                 embed_batch: int = INGEST_EMBED_BATCH, write_batch: int = INGEST_WRITE_BATCH,
+                 backend_name: Optional[str] = None):
+        from AI_diagnosis.utils.embedder import EMBEDDER_BACKEND
+
+        self.client = client
+        self.state = state
+        self.embed_batch = embed_batch
+        self.write_batch = write_batch
+        self.max_in_flight = 2 * workers
+        # spawn: workers load their own model instead of inheriting parent state
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend_name or EMBEDDER_BACKEND,),
+        )
+        self._pending: Deque[_Batch] = deque()
+        self._in_flight: set = set()
+        self._write_chunks: List[Tuple[str, dict]] = []
+        self._write_posts: List[Post] = []
+        self._write_at: Optional[Tuple[str, int, int]] = None
+        self.stats = Counter()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+        self.state.db.close()
+
+    # ---------- reading ----------
+
+    def ingest_file(self, path: str, full: bool = False) -> None:
+        path = os.path.abspath(path)
+        offset = 0 if full else self.state.offset(path)
+        if offset:
+            logger.info("Resuming %s at byte %s", path, offset)
+        size = os.path.getsize(path)
+        batch = _Batch(path=path, size=size, offset=offset)
+        for post in iter_posts(path, offset):
+            self.stats["posts"] += 1
+            batch.offset = post.end_offset
+            if len(post.text.split()) < INGEST_MIN_WORDS:
+                self.stats["too_short"] += 1
+                continue
+            post.digest = content_hash(post.text)
+            if self.state.post_digest(post.post_id) == post.digest:
+                self.stats["unchanged"] += 1
+                continue
+            self._add_post(batch, post)
+            if len(batch.chunks) >= self.embed_batch or len(batch.posts) >= self.write_batch:
+                self._submit(batch)
+                batch = _Batch(path=path, size=size, offset=batch.offset)
+        self._submit(batch)
+        self._drain()
+
+    def _add_post(self, batch: _Batch, post: Post) -> None:
+        post_dtcs = find_dtcs(post.text)
+        for index, chunk in enumerate(chunk_words(post.text)):
+            digest = content_hash(chunk)
+            if digest in post.hashes:
+                continue
+            post.hashes.append(digest)
+            if digest in self._in_flight or self.state.has_chunk(digest):
+                self.stats["duplicate_chunks"] += 1
+                continue
+            self._in_flight.add(digest)
+            dtcs = find_dtcs(chunk) or post_dtcs
+            metadata = dict(post.metadata, chunk=index, dtc=dtcs[0] if dtcs else None, dtcs=dtcs)
+            batch.chunks.append((post.post_id, {"content_hash": digest, "content": chunk, "metadata": metadata}))
+        batch.posts.append(post)
+
+    # ---------- embedding ----------
+
+    def _submit(self, batch: _Batch) -> None:
+        if batch.chunks:
+            batch.future = self.pool.submit(_embed, [row["content"] for _, row in batch.chunks])
+        self._pending.append(batch)
+        while len(self._pending) > self.max_in_flight:
+            self._collect(self._pending.popleft())
+
+    def _collect(self, batch: _Batch) -> None:
+        if batch.future is not None:
+            for (_, row), vector in zip(batch.chunks, batch.future.result()):
+                row["embedding"] = vector
+        self._write_chunks.extend(batch.chunks)
+        self._write_posts.extend(batch.posts)
+        self._write_at = (batch.path, batch.offset, batch.size)
+        if len(self._write_chunks) >= self.write_batch or len(self._write_posts) >= self.write_batch:
+            self._flush()
+
+    def _drain(self) -> None:
+        while self._pending:
+            self._collect(self._pending.popleft())
+        self._flush()
+
+    # ---------- writing ----------
+
+    def _with_retries(self, what: str, fn) -> None:
+        for attempt in range(1, INGEST_RETRIES + 1):
+            try:
+                fn()
+                return
+            except Exception as e:
+                if attempt == INGEST_RETRIES:
+                    raise
+                logger.warning("%s failed (attempt %s/%s): %s", what, attempt, INGEST_RETRIES, e)
+                time.sleep(min(30, 2 ** attempt))
+
+    def _flush(self) -> None:
+        if self._write_at is None:
+            return
+        from postgrest.types import ReturnMethod
+
+        rows = [row for _, row in self._write_chunks]
+        if rows:
+            self._with_retries("upsert", lambda: (
+                self.client.table(EMBEDDINGS_TABLE)
+                .upsert(rows, on_conflict="content_hash", returning=ReturnMethod.minimal)
+                .execute()
+            ))
+
+        # chunks a changed post no longer contains, unless another post (stored,
+        # or read but not yet written) still does
+        keep = {h for batch in self._pending for post in batch.posts for h in post.hashes}
+        try:
+            stale = self.state.replace_chunks(self._write_posts, keep)
+            for start in range(0, len(stale), _DELETE_SLICE):
+                part = stale[start:start + _DELETE_SLICE]
+                self._with_retries("delete", lambda: (
+                    self.client.table(EMBEDDINGS_TABLE)
+                    .delete(returning=ReturnMethod.minimal)
+                    .in_("content_hash", part)
+                    .execute()
+                ))
+        except Exception:
+            self.state.db.rollback()
+            raise
+
+        path, offset, size = self._write_at
+        self.state.commit(self._write_posts, path, offset, size)
+        self._in_flight.difference_update(row["content_hash"] for _, row in self._write_chunks)
+        self.stats["chunks_written"] += len(rows)
+        self.stats["posts_written"] += len(self._write_posts)
+        self.stats["chunks_deleted"] += len(stale)
+        logger.info("Wrote %s chunks (%s posts); %s at byte %s", len(rows), len(self._write_posts),
+                    os.path.basename(path), offset)
+        self._write_chunks, self._write_posts, self._write_at = [], [], None
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, int]:
+    parser = argparse.ArgumentParser(
+        prog="python -m AI_diagnosis.db.ingest",
+        description="Chunk, embed and upsert Reddit JSONL dumps into reddit_embeddings.",
+    )
+    parser.add_argument("dumps", nargs="+", help=".jsonl or .jsonl.gz files, one post/comment per line")
+    parser.add_argument("--state", default=INGEST_STATE, help="checkpoint file (sqlite)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--embed-batch", type=int, default=INGEST_EMBED_BATCH)
+    parser.add_argument("--write-batch", type=int, default=INGEST_WRITE_BATCH)
+    parser.add_argument("--full", action="store_true",
+                        help="ignore saved offsets and rescan (unchanged posts are still skipped)")
+    args = parser.parse_args(argv)
+
+    from AI_diagnosis.db.db_engine import supabase
+
+    ingestor = RedditIngestor(supabase, IngestState(args.state), workers=args.workers,
+                              embed_batch=args.embed_batch, write_batch=args.write_batch)
+    try:
+        for path in args.dumps:
+            started = time.perf_counter()
+            ingestor.ingest_file(path, full=args.full)
+            logger.info("Finished %s in %.1fs", path, time.perf_counter() - started)
+    finally:
+        ingestor.close()
+    return dict(ingestor.stats)
+
+
+if __name__ == "__main__":
+    # python -m AI_diagnosis.db.ingest dumps/MechanicAdvice_submissions.jsonl [...]
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(main(), indent=2))
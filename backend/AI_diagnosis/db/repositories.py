@@ -1,75 +1,267 @@
-from typing import List, Dict, Any
-from supabase import Client
-import logging
-import httpx
-logger = logging.getLogger("db.repositories_llm")
-class DTCCatalogueRepo:
-    def __init__(self, client: Client):
-        self.client = client
-
-    def get_by_code(self, dtc_code: str) -> dict | None:
-        if not dtc_code or not isinstance(dtc_code, str):
-            logger.warning("Invalid DTC code provided: %s", dtc_code)
-            return None
-
-        try:
-            response = (
-                self.client.table("DTC_Catalogue")
-                .select("*")
-                .eq("code", dtc_code.strip().upper())
-                .maybe_single()
-                .execute()
-            )
-
-            # Handle response object consistency
-            if not hasattr(response, "data"):
-                logger.error("Unexpected Supabase response: %s", response)
-                return None
-
-            data = response.data
-
-            if not data:
-                logger.info("No DTC entry found for code: %s", dtc_code)
-                return None
-
-            # Optional sanity checks
-            if not isinstance(data, dict):
-                logger.error("Malformed data for DTC %s: %s", dtc_code, data)
-                return None
-
-            return data
-
-        except Exception as e:
-            logger.exception("Error fetching DTC %s: %s", dtc_code, e)
-            return None
-        except httpx.ConnectError as e:
-            logger.error("Error fetching DTC %s: %s", dtc_code, e)
-            return None
-
-
-class RedditEmbeddingRepo:
-    def __init__(self, client: Client):
-        self.client = client
-
-    def similarity_search(self, embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        resp = self.client.rpc(
-            "match_reddit",
-            {"query_embedding": embedding, "match_count": top_k}
-        ).execute()
-
-        return resp.data or []
-    def search_keyword(self, dtc: str, top_k: int = 10) -> List[Dict[str, Any]]:
-        """
-        Pure keyword/structured search:
-        give me rows whose metadata->>'dtc' = dtc.
-        No embeddings, just the DTC tag in metadata.
-        """
-        resp = (
-            self.client
-            .table("reddit_embeddings")
-            .select("id, content, metadata")
-            .filter("metadata->>dtc", "eq", dtc)
-            .limit(top_k)
-            .execute()
-        )
-        return resp.data or []
\ No newline at end of file
+from typing import TYPE_CHECKING, List, Dict, Any, Iterable, Optional
+import logging
+import httpx
+from AI_diagnosis.db.db_engine import run_io
+from AI_diagnosis.db.catalogue_index import catalogue_index
+from AI_diagnosis.db.vector_index import VECTOR_BACKEND, vector_index
+from AI_diagnosis.utils.links import parse_discussion_links
+from AI_diagnosis.utils.metrics import timed
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("db.repositories_llm")
+
+class DTCCatalogueRepo:
+    def __init__(self, client: "Client", index=catalogue_index):
+        self.client = client
+        self.index = index
+
+    @timed("catalogue")
+    async def get_by_code(self, dtc_code: str) -> dict | None:
+        if not dtc_code or not isinstance(dtc_code, str):
+            logger.warning("Invalid DTC code provided: %s", dtc_code)
+            return None
+        # the in-memory index holds the whole table once loaded,
+        # so a miss there means the code is not catalogued
+        if self.index is not None and self.index.loaded:
+            return self.index.get(dtc_code)
+        return await run_io(self._fetch_by_code, dtc_code)
+
+    @timed("catalogue")
+    async def get_many(self, dtc_codes: Iterable[str]) -> Dict[str, dict]:
+        codes = sorted({c.strip().upper() for c in dtc_codes if c and isinstance(c, str)})
+        if not codes:
+            return {}
+        if self.index is not None and self.index.loaded:
+            return self.index.get_many(codes)
+
+        def _query():
+            return self.client.table("DTC_Catalogue").select("*").in_("code", codes).execute()
+
+        try:
+            resp = await run_io(_query)
+        except Exception as e:
+            logger.exception("Error fetching DTCs %s: %s", codes, e)
+            return {}
+        return {row["code"].strip().upper(): row for row in (resp.data or []) if row.get("code")}
+
+    async def get_family(self, prefix: str) -> List[dict]:
+        """All catalogued codes sharing a prefix, e.g. "P03" / "P03xx" for misfires."""
+        prefix = (prefix or "").strip().upper().rstrip("X")
+        if self.index is not None and self.index.loaded:
+            return self.index.family(prefix)
+
+        def _query():
+            return (
+                self.client.table("DTC_Catalogue")
+                .select("*")
+                .like("code", f"{prefix}%")
+                .order("code")
+                .execute()
+            )
+
+        try:
+            resp = await run_io(_query)
+        except Exception as e:
+            logger.exception("Error fetching DTC family %s: %s", prefix, e)
+            return []
+        return resp.data or []
+
+    def discussion_links(self, row: dict | None) -> List[Dict[str, str]]:
+        if not row:
+            return []
+        if self.index is not None and self.index.loaded:
+            return self.index.get_links(row.get("code", ""))
+        return parse_discussion_links(row.get("discussions", ""))
+
+    def _fetch_by_code(self, dtc_code: str) -> dict | None:
+        try:
+            response = (
+                self.client.table("DTC_Catalogue")
+                .select("*")
+                .eq("code", dtc_code.strip().upper())
+                .maybe_single()
+                .execute()
+            )
+
+            # Handle response object consistency
+            if not hasattr(response, "data"):
+                logger.error("Unexpected Supabase response: %s", response)
+                return None
+
+            data = response.data
+
+            if not data:
+                logger.info("No DTC entry found for code: %s", dtc_code)
+                return None
+
+            # Optional sanity checks
+            if not isinstance(data, dict):
+                logger.error("Malformed data for DTC %s: %s", dtc_code, data)
+                return None
+
+            return data
+
+        except Exception as e:
+            logger.exception("Error fetching DTC %s: %s", dtc_code, e)
+            return None
+        except httpx.ConnectError as e:
+            logger.error("Error fetching DTC %s: %s", dtc_code, e)
+            return None
+
+
+class RedditEmbeddingRepo:
+    def __init__(self, client: "Client", index=vector_index):
+        self.client = client
+        # local snapshot is only used when VECTOR_BACKEND=local and it has data
+        self.index = index if VECTOR_BACKEND == "local" else None
+
+    @timed("vector")
+    async def similarity_search(
+        self,
+        embedding: List[float],
+        top_k: int = 5,
+        exclude_ids: Optional[Iterable[Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k rows by cosine similarity, skipping exclude_ids.
+        Served from the local vector index when enabled, otherwise
+        through the match_reddit RPC (over-fetching to cover exclusions).
+        """
+        exclude = set(exclude_ids or ())
+        if self.index is not None and self.index.ready:
+            return await self.index.asearch(embedding, top_k=top_k, exclude_ids=exclude)
+
+        def _query():
+            return self.client.rpc(
+                "match_reddit",
+                {"query_embedding": embedding, "match_count": top_k + len(exclude)}
+            ).execute()
+
+        resp = await run_io(_query)
+        rows = [row for row in (resp.data or []) if row.get("id") not in exclude]
+        return rows[:top_k]
+
+    @timed("hybrid")
+    async def hybrid_search(self, dtc: str, embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Keyword + vector retrieval fused with reciprocal-rank fusion in one
+        RPC (match_reddit_hybrid, db/sql/002_hybrid_retrieval.sql). Returns
+        exactly top_k unique rows with id, content and a trimmed metadata.
+        """
+        def _query():
+            return self.client.rpc(
+                "match_reddit_hybrid",
+                {"query_embedding": embedding, "dtc": dtc, "match_count": top_k},
+            ).execute()
+
+        resp = await run_io(_query)
+        return resp.data or []
+
+    @timed("keyword")
+    async def search_keyword(self, dtc: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """
+        Pure keyword/structured search:
+        give me rows whose metadata->>'dtc' = dtc.
+        No embeddings, just the DTC tag in metadata.
+        """
+        def _query():
+            return (
+                self.client
+                .table("reddit_embeddings")
+                .select("id, content, metadata")
+                .filter("metadata->>dtc", "eq", dtc)
+                .limit(top_k)
+                .execute()
+            )
+
+        resp = await run_io(_query)
+        return resp.data or []
+
+
+class DiagnosisHistoryRepo:
+    """diagnosis_history table (see db/sql/001_diagnosis_history.sql)."""
+
+    # list view: enough to render a history row without pulling every stored response
+    LIST_COLUMNS = (
+        "id, vehicle_id, dtc, model, answer_source, created_at, "
+        "severity:response->results->0->>severity, summary:response->results->0->>summary"
+    )
+
+    def __init__(self, client: "Client"):
+        self.client = client
+
+    async def insert(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        def _query():
+            return self.client.table("diagnosis_history").insert(row).execute()
+
+        try:
+            resp = await run_io(_query)
+        except Exception as e:
+            logger.exception("Error saving diagnosis for vehicle %s: %s", row.get("vehicle_id"), e)
+            return None
+        return (resp.data or [None])[0]
+
+    async def get(self, diagnosis_id: str) -> Optional[Dict[str, Any]]:
+        def _query():
+            return (
+                self.client.table("diagnosis_history")
+                .select("*")
+                .eq("id", diagnosis_id)
+                .limit(1)
+                .execute()
+            )
+
+        resp = await run_io(_query)
+        return (resp.data or [None])[0]
+
+    async def list_for_vehicle(
+        self,
+        vehicle_id: str,
+        limit: int = 20,
+        after: Optional[tuple] = None,
+        dtc: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Newest first. `after` is the (created_at, id) of the last row of the
+        previous page; keyset pagination keeps every page an index range scan.
+        """
+        def _query():
+            query = (
+                self.client.table("diagnosis_history")
+                .select(self.LIST_COLUMNS)
+                .eq("vehicle_id", vehicle_id)
+            )
+            if dtc:
+                query = query.eq("dtc", dtc.strip().upper())
+            if after is not None:
+                created_at, last_id = after
+                query = query.or_(
+                    f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})'
+                )
+            return query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+
+        resp = await run_io(_query)
+        return resp.data or []
+
+    async def latest(self, vehicle_id: str, dtc: str, newer_than: str) -> Optional[Dict[str, Any]]:
+        """Newest stored diagnosis of `dtc` for the vehicle created after `newer_than` (ISO timestamp)."""
+        def _query():
+            return (
+                self.client.table("diagnosis_history")
+                .select("*")
+                .eq("vehicle_id", vehicle_id)
+                .eq("dtc", dtc.strip().upper())
+                .gte("created_at", newer_than)
+                .order("created_at", desc=True)
+                .limit(1)
+                .execute()
+            )
+
+        try:
+            resp = await run_io(_query)
+        except Exception as e:
+            logger.exception("Error reading diagnosis history for vehicle %s: %s", vehicle_id, e)
+            return None
+        return (resp.data or [None])[0]
@@ -0,0 +1,20 @@
+-- Diagnoses saved per vehicle, so reopening a code is one indexed read
+-- instead of another retrieval + LLM round trip.
+create table if not exists public.diagnosis_history (
+    id             uuid primary key default gen_random_uuid(),
+    vehicle_id     uuid not null references public.vehicles (id) on delete cascade,
+    dtc            text not null,
+    request        jsonb not null,            -- DiagnoseRequest as sent
+    response       jsonb not null,            -- DiagnoseResponse as returned
+    model          text,                      -- LLM model name, or 'catalogue' for the fast path
+    answer_source  text not null default 'llm',
+    created_at     timestamptz not null default now()
+);
+
+-- history list: WHERE vehicle_id = $1 [AND (created_at, id) < cursor] ORDER BY created_at DESC, id DESC
+create index if not exists diagnosis_history_vehicle_created_idx
+    on public.diagnosis_history (vehicle_id, created_at desc, id desc);
+
+-- "reuse if younger than X": newest entry for one vehicle + code
+create index if not exists diagnosis_history_vehicle_dtc_created_idx
+    on public.diagnosis_history (vehicle_id, dtc, created_at desc);
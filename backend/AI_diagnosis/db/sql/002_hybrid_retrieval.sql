@@ -0,0 +1,56 @@
+-- Hybrid (keyword + vector) retrieval in one round trip.
+-- Used by RAGService when RETRIEVAL_MODE=hybrid.
+
+-- search_keyword / the keyword branch below filter on metadata->>'dtc'
+create index if not exists reddit_embeddings_dtc_idx
+    on public.reddit_embeddings ((metadata->>'dtc'));
+
+-- Rows tagged with the DTC and the nearest neighbours of the query embedding,
+-- fused with reciprocal-rank fusion (score = sum of 1 / (rrf_k + rank)), so a
+-- post found by both lists ranks first. Deduplicated by id, exactly
+-- match_count rows (fewer only if the table is smaller), and only the columns
+-- the prompt and the response sources use; metadata is trimmed to url,
+-- subreddit and title so callers keep reading row["metadata"].
+create or replace function public.match_reddit_hybrid(
+    query_embedding vector(384),
+    dtc             text,
+    match_count     int default 5,
+    rrf_k           int default 60
+)
+returns table (id bigint, content text, metadata jsonb, score double precision)   -- id: reddit_embeddings.id (bigserial)
+language sql stable
+as $$
+    with keyword as (
+        select e.id,
+               row_number() over (order by e.embedding <=> query_embedding) as rank
+        from public.reddit_embeddings e
+        where e.metadata->>'dtc' = dtc
+        order by e.embedding <=> query_embedding
+        limit match_count
+    ),
+    semantic as (
+        select e.id,
+               row_number() over (order by e.embedding <=> query_embedding) as rank
+        from public.reddit_embeddings e
+        order by e.embedding <=> query_embedding
+        limit match_count
+    ),
+    fused as (
+        select coalesce(k.id, s.id) as id,
+               coalesce(1.0 / (rrf_k + k.rank), 0) + coalesce(1.0 / (rrf_k + s.rank), 0) as score
+        from keyword k
+        full outer join semantic s on s.id = k.id
+    )
+    select e.id,
+           e.content,
+           jsonb_build_object(
+               'url', coalesce(e.metadata->>'url', e.metadata->>'source_url'),
+               'subreddit', e.metadata->>'subreddit',
+               'title', e.metadata->>'title'
+           ) as metadata,
+           f.score::double precision
+    from fused f
+    join public.reddit_embeddings e on e.id = f.id
+    order by f.score desc, e.id
+    limit match_count;
+$$;
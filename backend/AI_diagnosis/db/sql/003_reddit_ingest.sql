@@ -0,0 +1,8 @@
+-- Bulk ingestion (python -m AI_diagnosis.db.ingest) upserts chunks by a hash
+-- of their normalized text, so re-runs and reposts never create duplicates.
+alter table public.reddit_embeddings
+    add column if not exists content_hash text;
+
+-- ON CONFLICT (content_hash) target; rows loaded before this column existed stay NULL
+create unique index if not exists reddit_embeddings_content_hash_key
+    on public.reddit_embeddings (content_hash);
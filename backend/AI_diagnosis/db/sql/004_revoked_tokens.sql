@@ -0,0 +1,13 @@
+-- Access tokens are verified in-process (utils/access_tokens.py); the only
+-- shared state is this list of revoked-but-unexpired token ids, which each
+-- worker re-reads every AUTH_REVOCATION_REFRESH_S seconds.
+create table if not exists public.revoked_tokens (
+    jti         text primary key,
+    user_id     uuid not null,
+    expires_at  timestamptz not null,         -- the token's exp; rows past it can be deleted
+    revoked_at  timestamptz not null default now()
+);
+
+-- refresh: WHERE expires_at > now()
+create index if not exists revoked_tokens_expires_at_idx
+    on public.revoked_tokens (expires_at);
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from AI_diagnosis.db.db_engine import run_io
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("db.vector_index")
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "rpc")            # "rpc" | "local"
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", ".vector_index")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "384"))               # all-MiniLM-L6-v2
+VECTOR_SYNC_S = float(os.getenv("VECTOR_SYNC_S", "600"))
+VECTOR_SYNC_PAGE = int(os.getenv("VECTOR_SYNC_PAGE", "500"))
+# monotonically increasing column used for delta sync (bigserial id, created_at, ...)
+VECTOR_SYNC_CURSOR = os.getenv("VECTOR_SYNC_CURSOR", "id")
+# from this many vectors on, the search matmul runs on the db-io pool instead of the event loop
+VECTOR_SEARCH_OFFLOAD_ROWS = int(os.getenv("VECTOR_SEARCH_OFFLOAD_ROWS", "20000"))
+
+EMBEDDINGS_TABLE = "reddit_embeddings"
+
+
+def _parse_vector(value: Any) -> Optional[np.ndarray]:
+    # PostgREST returns pgvector columns as the text form "[0.1,0.2,...]"
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    vec = np.asarray(value, dtype=np.float32)
+    if vec.ndim != 1:
+        return None
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0:
+        return None
+    return vec / norm
+
+
+class _Snapshot:
+    # replaced as a whole, so a search never mixes two syncs' vectors and positions
+    def __init__(self, vectors: np.ndarray, rows: List[dict], alive: np.ndarray, positions: Dict[Any, int]):
+        self.vectors = vectors
+        self.rows = rows
+        self.alive = alive
+        self.positions = positions
+
+
+class LocalVectorIndex:
+    """
+    Local copy of reddit_embeddings for top-k cosine search.
+
+    On disk (VECTOR_INDEX_DIR):
+      vectors.f32  - row-major float32 matrix of L2-normalized embeddings,
+                     opened as a read-only memmap
+      rows.jsonl   - {id, content, metadata} per vector, same order
+      state.json   - row count, dimension and the delta-sync cursor
+
+    sync() only pulls rows whose VECTOR_SYNC_CURSOR is past the stored
+    cursor and appends them; a row re-sent with a known id supersedes the
+    older slot. rebuild() discards the snapshot and pulls everything.
+    """
+
+    def __init__(self, path: str = VECTOR_INDEX_DIR, dim: int = VECTOR_DIM,
+                 cursor_column: str = VECTOR_SYNC_CURSOR):
+        self.path = path
+        self.dim = dim
+        self.cursor_column = cursor_column
+        self._snapshot: Optional[_Snapshot] = None
+        self._cursor: Any = None
+        self._rows_bytes = 0
+        self._write_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        snap = self._snapshot
+        return snap is not None and len(snap.rows) > 0
+
+    def __len__(self) -> int:
+        snap = self._snapshot
+        return int(snap.alive.sum()) if snap is not None else 0
+
+    # ---------- files ----------
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write_state(self, count: int) -> None:
+        self._rows_bytes = os.path.getsize(self._file("rows.jsonl")) if count else 0
+        state = {"count": count, "dim": self.dim, "cursor": self._cursor, "rows_bytes": self._rows_bytes}
+        tmp = self._file("state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self._file("state.json"))
+
+    def _truncate_to_state(self, count: int) -> None:
+        # drop anything an interrupted sync appended after the last saved state
+        for name, size in (("vectors.f32", count * self.dim * 4), ("rows.jsonl", self._rows_bytes)):
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def load(self) -> None:
+        """Open an existing snapshot from disk (no network)."""
+        try:
+            with open(self._file("state.json"), encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            logger.info("No local vector snapshot in %s yet", self.path)
+            return
+        if state.get("dim") != self.dim:
+            logger.warning("Vector snapshot dim %s != %s, ignoring it", state.get("dim"), self.dim)
+            return
+
+        count = int(state.get("count", 0))
+        rows: List[dict] = []
+        with open(self._file("rows.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                if len(rows) >= count:
+                    break
+                rows.append(json.loads(line))
+        with self._write_lock:
+            self._cursor = state.get("cursor")
+            self._rows_bytes = int(state.get("rows_bytes", 0))
+            self._open(rows)
+        logger.info("Loaded local vector snapshot: %s vectors", len(self))
+
+    def _open(self, rows: List[dict]) -> None:
+        count = len(rows)
+        if count:
+            vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                shape=(count, self.dim))
+        else:
+            vectors = np.zeros((0, self.dim), dtype=np.float32)
+        positions: Dict[Any, int] = {}
+        alive = np.ones(count, dtype=bool)
+        for i, row in enumerate(rows):
+            prev = positions.get(row.get("id"))
+            if prev is not None:
+                alive[prev] = False
+            positions[row.get("id")] = i
+        self._snapshot = _Snapshot(vectors, rows, alive, positions)
+
+    # ---------- sync ----------
+    def _fetch_page(self, client: "Client") -> List[dict]:
+        columns = "id, content, metadata, embedding"
+        if self.cursor_column != "id":
+            columns += f", {self.cursor_column}"
+        query = (
+            client.table(EMBEDDINGS_TABLE)
+            .select(columns)
+            .order(self.cursor_column)
+            .limit(VECTOR_SYNC_PAGE)
+        )
+        if self._cursor is not None:
+            query = query.gt(self.cursor_column, self._cursor)
+        return query.execute().data or []
+
+    def sync(self, client: "Client") -> int:
+        """Pull rows newer than the stored cursor; returns how many were added."""
+        added = 0
+        with self._write_lock:
+            os.makedirs(self.path, exist_ok=True)
+            rows = list(self._snapshot.rows) if self._snapshot is not None else []
+            self._truncate_to_state(len(rows))
+            while True:
+                page = self._fetch_page(client)
+                if not page:
+                    break
+                vectors, new_rows = [], []
+                for item in page:
+                    vec = _parse_vector(item.get("embedding"))
+                    if vec is None or vec.shape[0] != self.dim:
+                        continue
+                    vectors.append(vec)
+                    new_rows.append({
+                        "id": item.get("id"),
+                        "content": item.get("content"),
+                        "metadata": item.get("metadata") or {},
+                    })
+                if vectors:
+                    with open(self._file("vectors.f32"), "ab") as f:
+                        f.write(np.stack(vectors).astype(np.float32).tobytes())
+                    with open(self._file("rows.jsonl"), "a", encoding="utf-8") as f:
+                        for row in new_rows:
+                            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+                    rows.extend(new_rows)
+                    added += len(new_rows)
+                self._cursor = page[-1].get(self.cursor_column)
+                self._write_state(len(rows))
+                if len(page) < VECTOR_SYNC_PAGE:
+                    break
+            if added or self._snapshot is None:
+                self._open(rows)
+        if added:
+            logger.info("Vector index sync added %s rows (%s live)", added, len(self))
+        return added
+
+    def rebuild(self, client: "Client") -> int:
+        with self._write_lock:
+            for name in ("vectors.f32", "rows.jsonl", "state.json"):
+                try:
+                    os.remove(self._file(name))
+                except FileNotFoundError:
+                    pass
+            self._snapshot = None
+            self._cursor = None
+            self._rows_bytes = 0
+        return self.sync(client)
+
+    async def _sync_loop(self, client: "Client") -> None:
+        while True:
+            try:
+                await run_io(self.sync, client)
+            except Exception as e:
+                logger.error("Vector index sync failed: %s", e)
+            await asyncio.sleep(VECTOR_SYNC_S)
+
+    async def start(self, client: "Client") -> None:
+        await run_io(self.load)
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync_loop(client))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---------- search ----------
+    def search(self, embedding: List[float], top_k: int = 5,
+               exclude_ids: Optional[Iterable[Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Exact top-k cosine search. Returns rows shaped like the match_reddit
+        RPC output (id, content, metadata, similarity), already unique by id.
+        """
+        snap = self._snapshot
+        if snap is None or not snap.rows or top_k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0:
+            return []
+        scores = snap.vectors @ (query / norm)
+        scores = np.where(snap.alive, scores, -np.inf)
+        if exclude_ids:
+            for row_id in exclude_ids:
+                pos = snap.positions.get(row_id)
+                if pos is not None and pos < scores.shape[0]:
+                    scores[pos] = -np.inf
+
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results: List[Dict[str, Any]] = []
+        for pos in top:
+            if not np.isfinite(scores[pos]):
+                break
+            row = snap.rows[pos]
+            results.append({**row, "similarity": float(scores[pos])})
+        return results
+
+    async def asearch(self, embedding: List[float], top_k: int = 5,
+                      exclude_ids: Optional[Iterable[Any]] = None) -> List[Dict[str, Any]]:
+        """search() for async callers: off the event loop once the index is large."""
+        snap = self._snapshot
+        if snap is not None and len(snap.rows) >= VECTOR_SEARCH_OFFLOAD_ROWS:
+            return await run_io(self.search, embedding, top_k=top_k, exclude_ids=exclude_ids)
+        return self.search(embedding, top_k=top_k, exclude_ids=exclude_ids)
+
+
+vector_index = LocalVectorIndex()
+
+
+if __name__ == "__main__":
+    # offline snapshot build:  python -m AI_diagnosis.db.vector_index [--rebuild]
+    import sys
+    from AI_diagnosis.db.db_engine import supabase
+
+    logging.basicConfig(level=logging.INFO)
+    vector_index.load()
+    if "--rebuild" in sys.argv:
+        vector_index.rebuild(supabase)
+    else:
+        vector_index.sync(supabase)
+    print(f"{len(vector_index)} vectors in {vector_index.path}")
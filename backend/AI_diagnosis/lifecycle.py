@@ -0,0 +1,25 @@
+from contextlib import asynccontextmanager
+import logging
+
+from fastapi import FastAPI
+
+from AI_diagnosis.db.catalogue_index import catalogue_index
+from AI_diagnosis.resources import resources
+from AI_diagnosis.services.cache_service import diagnosis_cache
+
+logger = logging.getLogger("lifecycle")
+
+# a changed catalogue row makes every cached diagnosis for that code stale
+catalogue_index.on_change(diagnosis_cache.invalidate_dtc)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # clients now; catalogue, embedder and vector index warm in the background
+    # (/readyz reports when they are done)
+    resources.start()
+    app.state.resources = resources
+    try:
+        yield
+    finally:
+        await resources.close()
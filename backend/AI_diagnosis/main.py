@@ -1,22 +1,32 @@
-from fastapi import FastAPI
-from AI_diagnosis.api.router import router as ai_router
-from dotenv import load_dotenv
-import os
-from fastapi.middleware.cors import CORSMiddleware
-load_dotenv()
-
-
-app = FastAPI(title="DTC Diagnosis POC")
-origins = [
-    "*",  # for dev it's fine; later you can restrict to ["https://snack.expo.dev", "http://localhost:19006", ...]
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],   # <-- allows OPTIONS, POST, etc.
-    allow_headers=["*"],
-)
-app.include_router(ai_router)
-
+from dotenv import load_dotenv
+# before the imports below: modules read their settings from os.environ at import
+load_dotenv()
+
+from fastapi import FastAPI
+from AI_diagnosis.api.router import router as ai_router
+from AI_diagnosis.api.health import router as health_router
+from AI_diagnosis.api.metrics import router as metrics_router
+from AI_diagnosis.lifecycle import lifespan
+from AI_diagnosis.utils.metrics import ServerTimingMiddleware
+import os
+from fastapi.middleware.cors import CORSMiddleware
+
+
+app = FastAPI(title="DTC Diagnosis POC", lifespan=lifespan)
+origins = [
+    "*",  # for dev it's fine; later you can restrict to ["https://snack.expo.dev", "http://localhost:19006", ...]
+]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],   # <-- allows OPTIONS, POST, etc.
+    allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+app.add_middleware(ServerTimingMiddleware)
+app.include_router(ai_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
+
@@ -1,46 +1,77 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
-from typing import Literal
-
-class VehicleMeta(BaseModel):
-    make: str
-    model: str
-    year: Optional[int] = None
-    pid_snapshot: Dict[str, float] = Field(default_factory=dict)
-
-class DiagnoseRequest(BaseModel):
-    dtc: str = Field(pattern=r"^[PCBU]\d{3}[0-9A-Z]$")
-    vehicle: VehicleMeta
-
-# ----------  RESPONSE  --------------------
-class QuickFix(BaseModel):
-    step: str = Field(description="The action the user should take.")
-    location_tip: str = Field(description="Guidance on where the user can find the part/component mentioned in the step.")
-class LLMResponse(BaseModel):
-    dtc_code: str
-    dtc_meaning: str
-    summary: str
-    severity: Literal["LOW", "MEDIUM", "HIGH", "CRITICAL"] = Field(..., description="Severity of issue.")
-    causes: List[str] = Field(default_factory=list, description="3–6 probable root causes, ordered by likelihood.")
-    effects: List[str] = Field(default_factory=list, description="Driver-noticeable symptoms or system effects.")
-    quick_fixes: List[QuickFix] = Field(default_factory=list, description="Low-risk actions user can try before a shop visit, including location tips.")
-    safety_advice: str = Field(
-        default="No safety advice provided",
-        description="Short statement on drivability and urgency.")
-    technical_terms: Dict[str, str] = Field(default_factory=dict, description="Explanations for technical terms used in the summary, causes, and advice.")
-    
-class RedditSource(BaseModel):
-    url: str
-    title: Optional[str] = None
-    subreddit: Optional[str] = None
-class CatalogueDiscussionLink(BaseModel):
-    url: str
-    title: Optional[str] = None
-class DiagnoseResponse(BaseModel):
-    vehicle: VehicleMeta
-    results: List[LLMResponse]
-    reddit_sources: List[RedditSource] = Field(default_factory=list)
-    dtc_catalogue_links: List[CatalogueDiscussionLink] = Field(
-        default_factory=list,
-        description="Links extracted from the DTC catalogue discussion column (e.g. obd-codes forum threads).",
-    )
\ No newline at end of file
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Dict, Optional
+from typing import Literal
+from uuid import UUID
+
+DTCCode = Annotated[str, Field(pattern=r"^[PCBU]\d{3}[0-9A-Z]$")]
+
+class VehicleMeta(BaseModel):
+    make: str
+    model: str
+    year: Optional[int] = None
+    pid_snapshot: Dict[str, float] = Field(default_factory=dict)
+
+class DiagnoseRequest(BaseModel):
+    dtc: DTCCode
+    vehicle: VehicleMeta
+    vehicle_id: Optional[UUID] = Field(default=None, description="Saved vehicle; when set the diagnosis is stored in its history.")
+    reuse_max_age_s: Optional[int] = Field(
+        default=None, ge=0,
+        description="With vehicle_id: return the stored diagnosis of this code if it is at most this many seconds old.",
+    )
+
+class MultiDiagnoseRequest(BaseModel):
+    """Several codes from the same scan, diagnosed together in one LLM call."""
+    dtcs: List[DTCCode] = Field(min_length=1, max_length=8)
+    vehicle: VehicleMeta
+
+class BatchDiagnoseRequest(BaseModel):
+    items: List[DiagnoseRequest] = Field(min_length=1, max_length=500)
+
+# ----------  RESPONSE  --------------------
+class QuickFix(BaseModel):
+    step: str = Field(description="The action the user should take.")
+    location_tip: str = Field(description="Guidance on where the user can find the part/component mentioned in the step.")
+class LLMResponse(BaseModel):
+    dtc_code: str
+    dtc_meaning: str
+    summary: str
+    severity: Literal["LOW", "MEDIUM", "HIGH", "CRITICAL"] = Field(..., description="Severity of issue.")
+    causes: List[str] = Field(default_factory=list, description="3–6 probable root causes, ordered by likelihood.")
+    effects: List[str] = Field(default_factory=list, description="Driver-noticeable symptoms or system effects.")
+    quick_fixes: List[QuickFix] = Field(default_factory=list, description="Low-risk actions user can try before a shop visit, including location tips.")
+    safety_advice: str = Field(
+        default="No safety advice provided",
+        description="Short statement on drivability and urgency.")
+    technical_terms: Dict[str, str] = Field(default_factory=dict, description="Explanations for technical terms used in the summary, causes, and advice.")
+    
+class MultiLLMResponse(BaseModel):
+    joint_summary: str = Field(default="", description="Most likely shared root cause across the codes.")
+    results: List[LLMResponse] = Field(default_factory=list)
+
+class RedditSource(BaseModel):
+    url: str
+    title: Optional[str] = None
+    subreddit: Optional[str] = None
+class CatalogueDiscussionLink(BaseModel):
+    url: str
+    title: Optional[str] = None
+class DiagnoseResponse(BaseModel):
+    vehicle: VehicleMeta
+    results: List[LLMResponse]
+    reddit_sources: List[RedditSource] = Field(default_factory=list)
+    dtc_catalogue_links: List[CatalogueDiscussionLink] = Field(
+        default_factory=list,
+        description="Links extracted from the DTC catalogue discussion column (e.g. obd-codes forum threads).",
+    )
+    joint_summary: Optional[str] = Field(
+        default=None,
+        description="Shared root-cause summary, only set for multi-code diagnoses.",
+    )
+    answer_source: Literal["llm", "catalogue"] = Field(
+        default="llm",
+        description="'catalogue' when answered from the DTC catalogue without the LLM (fast path).",
+    )
+    history_id: Optional[str] = Field(default=None, description="Id in the vehicle's diagnosis history, when saved.")
+    diagnosed_at: Optional[datetime] = None
\ No newline at end of file
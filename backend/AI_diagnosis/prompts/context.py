@@ -0,0 +1,124 @@
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from AI_diagnosis.utils.tokens import count_tokens
+
+# token budget for the Reddit part of the user prompt, and per snippet
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1500"))
+PROMPT_SNIPPET_TOKENS = int(os.getenv("PROMPT_SNIPPET_TOKENS", "250"))
+# word-shingle Jaccard similarity above which two snippets count as the same post
+PROMPT_DEDUPE_THRESHOLD = float(os.getenv("PROMPT_DEDUPE_THRESHOLD", "0.7"))
+
+# catalogue columns that never help the model (discussions are links, sent as sources)
+_CATALOGUE_DROP = {"discussions", "embedding", "id", "created_at", "updated_at"}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "it", "my", "i",
+    "with", "was", "be", "at", "this", "that", "if", "not", "no", "dtc", "code",
+}
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def compact_catalogue(row: dict) -> dict:
+    """Catalogue row without bulky/irrelevant columns and empty values."""
+    return {k: v for k, v in row.items() if k not in _CATALOGUE_DROP and v not in (None, "", [], {})}
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = _words(text)
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe_snippets(snippets: Iterable[str], threshold: float = PROMPT_DEDUPE_THRESHOLD) -> List[str]:
+    """
+    Drop snippets that are near-copies of an earlier one (reposts, quoted
+    replies, the same thread chunked twice). Exact Jaccard over word
+    3-shingles; retrieval returns a dozen snippets at most, so no MinHash
+    sketching is needed.
+    """
+    kept: List[str] = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    for snippet in snippets:
+        shingles = _shingles(snippet)
+        if not shingles:
+            continue
+        duplicate = any(
+            len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(snippet)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def query_terms(*texts: str) -> Set[str]:
+    return {w for text in texts if text for w in _words(text) if w not in _STOPWORDS and len(w) > 2}
+
+
+def best_sentences(text: str, terms: Set[str], max_tokens: int = PROMPT_SNIPPET_TOKENS) -> str:
+    """Keep the sentences sharing most words with `terms`, in original order, within max_tokens."""
+    text = text.strip()
+    if count_tokens(text) <= max_tokens:
+        return text
+    text = re.sub(r"[ \t]+", " ", text)
+    sentences = list(dict.fromkeys(s.strip() for s in _SENTENCE_RE.split(text) if s.strip()))
+    scores = [len(terms.intersection(_words(sentence))) for sentence in sentences]
+    # on-topic sentences first; with nothing on topic, keep the opening of the post
+    ranked = sorted((i for i in range(len(sentences)) if scores[i]), key=lambda i: (-scores[i], i))
+    if not ranked:
+        ranked = list(range(len(sentences)))
+    chosen, used = [], 0
+    for i in ranked:
+        cost = count_tokens(sentences[i])
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    if not chosen:
+        # one huge run-on sentence: hard cut
+        return sentences[ranked[0]][: max_tokens * 4].rstrip() + " …"
+    return " … ".join(sentences[i] for i in sorted(chosen))
+
+
+def fit_snippets(
+    snippets: Iterable[str],
+    terms: Set[str],
+    budget: int = PROMPT_CONTEXT_TOKENS,
+    per_snippet: int = PROMPT_SNIPPET_TOKENS,
+) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Dedupe, trim and pack retrieved snippets (already ranked best-first)
+    into `budget` tokens. Returns the kept snippets and counters for logging.
+    """
+    snippets = [s for s in snippets if s and s.strip()]
+    unique = dedupe_snippets(snippets)
+    kept: List[str] = []
+    used = truncated = 0
+    for snippet in unique:
+        trimmed = best_sentences(snippet, terms, per_snippet)
+        truncated += trimmed != snippet.strip()
+        cost = count_tokens(trimmed)
+        if used + cost > budget:
+            continue
+        kept.append(trimmed)
+        used += cost
+    return kept, {
+        "snippets_in": len(snippets),
+        "duplicates": len(snippets) - len(unique),
+        "truncated": truncated,
+        "snippets_out": len(kept),
+        "context_tokens": used,
+    }
@@ -1,93 +1,201 @@
-import json
-
-def build_prompt(catalogue: dict, reddit: str, vehicle: dict, pid: dict) -> dict:
-   
-    system_prompt = """
-You are **AutoInsight**, a friendly yet knowledgeable vehicle assistant.
-Your job is to help everyday drivers understand what their car's Diagnostic Trouble Code (DTC)
-means — in clear, conversational, non-technical English.
-
-### Tone & Style
-- Write as if you are a service advisor calmly explaining to a customer.
-- Avoid mechanic jargon. If a technical term must appear, briefly define it in parentheses.
-- Be empathetic, confident, and educational.
-- Avoid lists of sensor names, voltages, or numeric readings unless essential.
-
-## Behavior & Guardrails
-- Always return **valid JSON only** (no prose outside JSON).
-- Use accurate automotive terminology (O₂ sensor, catalyst, fuel trim, misfire, etc.).
-- Tailor guidance to the given vehicle make, model, and year.
-- Be realistic and data-driven; list most likely causes first.
-- Do not over-prescribe parts replacement without confirming diagnostics.
-- Keep total text concise and useful.
-- No emojis, no markdown; numbers and units when helpful.
-
-Follow these strict rules:
-- Base your answer ONLY on the following:
-  1. The exact DTC catalogue row provided.
-  2. The Reddit discussion snippets provided.
-  3. The PID snapshot and vehicle metadata provided.
-- If any information is missing, respond with "Information not available."
-- Do NOT invent, infer, or guess unknown details.
-- Output must be valid JSON and match this exact schema,If you do not have data for any key, include the key with an empty string ("") or empty list ([]).
-Never omit a key.
-
-{{
-  "dtc_code": "string",
-  "dtc_meaning": "string",
-  "summary": "string",
-  "severity": "LOW"|"MEDIUM"|"HIGH"|"CRITICAL",
-  "summary": "1–2 sentence plain-English description of what the code indicates on this vehicle",
-  "causes": ["3–6 realistic probable root causes, ordered by likelihood"],
-  "effects": ["driver-noticeable symptoms or system effects"],
-  "effects": ["driver-noticeable symptoms or system effects"],
-  "quick_fixes": [
-    {{
-      "step": "string",
-      "location_tip": "string"
-    }}
-  ],
-  "safety_advice": "short statement on drivability and urgency",
-  "technical_terms": {{
-    "term1": "plain-english definition/explanation, e.g., 'PCM'",
-    "term2": "definition/explanation, e.g., 'Oxygen Sensor'"
-  }}
-}}
-### Field guidance
-- **severity**:
-  - low: monitor / minor impact
-  - moderate: service soon / emissions impact
-  - high: performance degraded / risk of damage
-  - critical: stop driving / safety risk
-- **causes**: focus on root mechanical/electrical issues; avoid vague items like "sensor failure".
-- **effects**: list observable symptoms 
-- **quick_fixes**: strictly low-risk actions (e.g., reseat connector, inspect for obvious leaks, clear ice/debris, tighten fuel cap); avoid anything unsafe or tool-intensive. For the 'location_tip', provide a clear, easy-to-understand physical location description, relative to common landmarks (e.g., "The sensor is located underneath the car, behind the engine, bolted to the exhaust pipe.").
-- **technical_terms**: Identify all key technical or component terms (e.g., PCM, O₂ sensor, Catalyst, Bank 2) used in the 'summary', 'causes', or 'quick_fixes'. The value for each term MUST be a clear, non-technical explanation that **explicitly mentions where that component is physically located in the vehicle** (e.g., "The sensor is usually screwed into the exhaust pipe before the main muffler.").
-    """.strip()
-
-    vehicle_info = f"{vehicle.get('make', 'Unknown')} {vehicle.get('model', '')} ({vehicle.get('year', 'N/A')})"
-    pid_json = json.dumps(pid or {}, indent=2)
-
-    user_prompt = f"""
-Analyze the following diagnostic context:
-
-DTC Catalogue Entry:
-{json.dumps(catalogue, indent=2)}
-
-Reddit Discussions (relevant snippets):
-{reddit.strip() or 'No Reddit context retrieved.'}
-
-Vehicle Information:
-{vehicle_info}
-
-Sensor Data (PID Snapshot):
-{pid_json}
-
-Return ONLY the JSON object described above, strictly adhering to the schema.
-Do not include any text outside the JSON object.
-    """.strip()
-
-    return {
-        "system": system_prompt,
-        "user": user_prompt
-    }
+import logging
+from functools import lru_cache
+from typing import List
+
+from AI_diagnosis.prompts.context import compact_catalogue, compact_json, fit_snippets, query_terms
+from AI_diagnosis.utils.tokens import count_tokens
+
+logger = logging.getLogger("prompts.template")
+
+_PERSONA = """
+You are **AutoInsight**, a friendly yet knowledgeable vehicle assistant.
+Your job is to help everyday drivers understand what their car's Diagnostic Trouble Code (DTC)
+means — in clear, conversational, non-technical English.
+
+### Tone & Style
+- Write as if you are a service advisor calmly explaining to a customer.
+- Avoid mechanic jargon. If a technical term must appear, briefly define it in parentheses.
+- Be empathetic, confident, and educational.
+- Avoid lists of sensor names, voltages, or numeric readings unless essential.
+
+## Behavior & Guardrails
+- Always return **valid JSON only** (no prose outside JSON).
+- Use accurate automotive terminology (O₂ sensor, catalyst, fuel trim, misfire, etc.).
+- Tailor guidance to the given vehicle make, model, and year.
+- Be realistic and data-driven; list most likely causes first.
+- Do not over-prescribe parts replacement without confirming diagnostics.
+- Keep total text concise and useful.
+- No emojis, no markdown; numbers and units when helpful.
+""".strip()
+
+_RULES = """
+Follow these strict rules:
+- Base your answer ONLY on the following:
+  1. The exact DTC catalogue row provided.
+  2. The Reddit discussion snippets provided.
+  3. The PID snapshot and vehicle metadata provided.
+- If any information is missing, respond with "Information not available."
+- Do NOT invent, infer, or guess unknown details.
+- Output must be valid JSON and match this exact schema,If you do not have data for any key, include the key with an empty string ("") or empty list ([]).
+Never omit a key.
+""".strip()
+
+# one diagnosis object; the multi-code prompt asks for one of these per code
+_DIAGNOSIS_SCHEMA = """
+{
+  "dtc_code": "string",
+  "dtc_meaning": "string",
+  "summary": "1–2 sentence plain-English description of what the code indicates on this vehicle",
+  "severity": "LOW"|"MEDIUM"|"HIGH"|"CRITICAL",
+  "causes": ["3–6 realistic probable root causes, ordered by likelihood"],
+  "effects": ["driver-noticeable symptoms or system effects"],
+  "quick_fixes": [
+    {
+      "step": "string",
+      "location_tip": "string"
+    }
+  ],
+  "safety_advice": "short statement on drivability and urgency",
+  "technical_terms": {
+    "term1": "plain-english definition/explanation, e.g., 'PCM'",
+    "term2": "definition/explanation, e.g., 'Oxygen Sensor'"
+  }
+}
+""".strip()
+
+_FIELD_GUIDANCE = """
+### Field guidance
+- **severity**:
+  - LOW: monitor / minor impact
+  - MEDIUM: service soon / emissions impact
+  - HIGH: performance degraded / risk of damage
+  - CRITICAL: stop driving / safety risk
+- **causes**: focus on root mechanical/electrical issues; avoid vague items like "sensor failure".
+- **effects**: list observable symptoms 
+- **quick_fixes**: strictly low-risk actions (e.g., reseat connector, inspect for obvious leaks, clear ice/debris, tighten fuel cap); avoid anything unsafe or tool-intensive. For the 'location_tip', provide a clear, easy-to-understand physical location description, relative to common landmarks (e.g., "The sensor is located underneath the car, behind the engine, bolted to the exhaust pipe.").
+- **technical_terms**: Identify all key technical or component terms (e.g., PCM, O₂ sensor, Catalyst, Bank 2) used in the 'summary', 'causes', or 'quick_fixes'. The value for each term MUST be a clear, non-technical explanation that **explicitly mentions where that component is physically located in the vehicle** (e.g., "The sensor is usually screwed into the exhaust pipe before the main muffler.").
+""".strip()
+
+_MULTI_RULES = """
+Follow these strict rules:
+- Base your answer ONLY on the following:
+  1. The exact DTC catalogue rows provided.
+  2. The Reddit discussion snippets provided.
+  3. The PID snapshot and vehicle metadata provided.
+- If any information is missing, respond with "Information not available."
+- Do NOT invent, infer, or guess unknown details.
+- Output must be valid JSON and match the schema below. If you do not have data for any key, include the key with an empty string ("") or empty list ([]).
+Never omit a key.
+""".strip()
+
+_MULTI_INSTRUCTIONS = """
+### Multiple codes
+The vehicle reported several codes in the same scan. They often share one underlying fault
+(e.g. P0171 + P0174 both lean on a V6 usually point to one vacuum leak or a weak fuel pump),
+so diagnose them together and keep the answers consistent with each other.
+
+Return one JSON object:
+{
+  "joint_summary": "2–3 sentences on the most likely shared root cause, or say the codes look unrelated",
+  "results": [ one diagnosis object per code, in the order the codes are listed ]
+}
+
+Each diagnosis object in "results" uses this schema:
+""".strip()
+
+
+# Static system prompts: nothing request-specific goes in here, so every call
+# starts with the same bytes and the provider's prompt cache can reuse them.
+SYSTEM_PROMPT = f"{_PERSONA}\n\n{_RULES}\n\n{_DIAGNOSIS_SCHEMA}\n{_FIELD_GUIDANCE}"
+MULTI_SYSTEM_PROMPT = f"{_PERSONA}\n\n{_MULTI_RULES}\n\n{_MULTI_INSTRUCTIONS}\n{_DIAGNOSIS_SCHEMA}\n{_FIELD_GUIDANCE}"
+
+
+def _format_snippets(snippets: List[str]) -> str:
+    return "\n\n".join(f"[{i}] {snippet}" for i, snippet in enumerate(snippets, 1)) or "No Reddit context retrieved."
+
+
+@lru_cache(maxsize=4)
+def _static_tokens(system: str) -> int:
+    return count_tokens(system)
+
+
+def _log_tokens(codes: str, system: str, user: str, stats: dict) -> dict:
+    tokens = {"system": _static_tokens(system), "user": count_tokens(user), **stats}
+    logger.info(
+        "Prompt tokens for %s: system=%d user=%d context=%d (snippets %d -> %d, %d near-duplicates, %d truncated)",
+        codes, tokens["system"], tokens["user"], stats["context_tokens"], stats["snippets_in"],
+        stats["snippets_out"], stats["duplicates"], stats["truncated"],
+    )
+    return tokens
+
+
+def build_prompt(catalogue: dict, snippets: List[str], vehicle: dict, pid: dict) -> dict:
+
+    terms = query_terms(
+        catalogue.get("code", ""), catalogue.get("description", ""),
+        catalogue.get("probable_causes", ""), catalogue.get("symptoms", ""),
+    )
+    context, stats = fit_snippets(snippets, terms)
+
+    vehicle_info = f"{vehicle.get('make', 'Unknown')} {vehicle.get('model', '')} ({vehicle.get('year', 'N/A')})"
+
+    user_prompt = f"""
+Analyze the following diagnostic context:
+
+DTC Catalogue Entry:
+{compact_json(compact_catalogue(catalogue))}
+
+Reddit Discussions (relevant snippets):
+{_format_snippets(context)}
+
+Vehicle Information:
+{vehicle_info}
+
+Sensor Data (PID Snapshot):
+{compact_json(pid or {})}
+
+Return ONLY the JSON object described above, strictly adhering to the schema.
+Do not include any text outside the JSON object.
+    """.strip()
+
+    return {
+        "system": SYSTEM_PROMPT,
+        "user": user_prompt,
+        "tokens": _log_tokens(catalogue.get("code", "?"), SYSTEM_PROMPT, user_prompt, stats),
+    }
+
+
+def build_multi_prompt(catalogues: List[dict], snippets: List[str], vehicle: dict, pid: dict) -> dict:
+    """One prompt for several codes from the same scan; see _MULTI_INSTRUCTIONS for the output shape."""
+
+    terms = query_terms(*(f"{c.get('code', '')} {c.get('description', '')}" for c in catalogues))
+    context, stats = fit_snippets(snippets, terms)
+
+    vehicle_info = f"{vehicle.get('make', 'Unknown')} {vehicle.get('model', '')} ({vehicle.get('year', 'N/A')})"
+    codes = ", ".join(c.get("code", "") for c in catalogues)
+    entries = "\n".join(compact_json(compact_catalogue(c)) for c in catalogues)
+
+    user_prompt = f"""
+Analyze the following diagnostic context for the codes {codes}:
+
+DTC Catalogue Entries:
+{entries}
+
+Reddit Discussions (relevant snippets, shared across the codes):
+{_format_snippets(context)}
+
+Vehicle Information:
+{vehicle_info}
+
+Sensor Data (PID Snapshot):
+{compact_json(pid or {})}
+
+Return ONLY the JSON object described above, with exactly one entry in "results" per code ({codes}).
+Do not include any text outside the JSON object.
+    """.strip()
+
+    return {
+        "system": MULTI_SYSTEM_PROMPT,
+        "user": user_prompt,
+        "tokens": _log_tokens(codes, MULTI_SYSTEM_PROMPT, user_prompt, stats),
+    }
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from AI_diagnosis.db import db_engine
+from AI_diagnosis.db.catalogue_index import catalogue_index
+from AI_diagnosis.db.vector_index import VECTOR_BACKEND, vector_index
+from AI_diagnosis.services.llm_service import gateway
+from AI_diagnosis.utils import embedder
+
+logger = logging.getLogger("resources")
+
+
+class Resources:
+    """
+    Process-wide clients owned by the app lifespan:
+      db        - the shared Supabase client (utils.db and AI_diagnosis)
+      llm       - the pooled Groq gateway
+      embedder  - the embedding model (+ precomputed catalogue store)
+    plus the in-memory catalogue and vector indexes.
+
+    start() only creates clients (no I/O), so the app takes traffic right
+    away; warm() loads indexes and models in the background and ready
+    turns true once every step has finished. close() releases it all.
+    """
+
+    def __init__(self):
+        self.started_at = None
+        self.components: Dict[str, str] = {}
+        self._warm_task = None
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        db_engine.get_client()
+        gateway.client          # opens the connection pool, no request yet
+        steps = ["catalogue", "embedder"] + (["vector_index"] if VECTOR_BACKEND == "local" else [])
+        self.components = {"db": "ready", "llm": "ready", **{step: "pending" for step in steps}}
+        self._warm_task = asyncio.ensure_future(self.warm())
+
+    def _steps(self) -> List[Tuple[str, Callable[[], Awaitable[Any]]]]:
+        loop = asyncio.get_running_loop()
+        steps = [
+            ("catalogue", lambda: catalogue_index.start(db_engine.supabase)),
+            ("embedder", lambda: loop.run_in_executor(None, embedder.warmup)),
+        ]
+        if VECTOR_BACKEND == "local":
+            steps.append(("vector_index", lambda: vector_index.start(db_engine.supabase)))
+        return steps
+
+    async def warm(self) -> None:
+        for name, step in self._steps():
+            started = time.perf_counter()
+            try:
+                await step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # not fatal: every component also loads on first use
+                self.components[name] = f"failed: {e}"
+                logger.error("Warmup of %s failed: %s", name, e)
+                continue
+            self.components[name] = "ready"
+            logger.info("%s warmed in %.2fs", name, time.perf_counter() - started)
+        if self.started_at is not None:
+            logger.info("Warmup finished %.2fs after startup", time.monotonic() - self.started_at)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.components) and all(state == "ready" for state in self.components.values())
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "components": dict(self.components)}
+
+    async def close(self) -> None:
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+        await vector_index.stop()
+        await catalogue_index.stop()
+        await gateway.aclose()
+        db_engine.close_client()
+        self.components = {}
+
+
+resources = Resources()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Set
+
+from AI_diagnosis.models.request_response import LLMResponse
+from AI_diagnosis.utils.cache import SQLiteCache, TTLCache
+from AI_diagnosis.utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger("services.cache")
+
+CACHE_MAXSIZE = int(os.getenv("DIAGNOSIS_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("DIAGNOSIS_CACHE_TTL", "21600"))            # 6h in memory
+CACHE_DB_PATH = os.getenv("DIAGNOSIS_CACHE_DB", "")                     # empty = no disk tier
+CACHE_DB_TTL = float(os.getenv("DIAGNOSIS_CACHE_DB_TTL", "604800"))     # 7d on disk
+PID_SIG_DIGITS = int(os.getenv("DIAGNOSIS_CACHE_PID_SIG_DIGITS", "2"))
+
+
+def _quantize(value: float) -> float:
+    # keep only a couple of significant digits so tiny sensor jitter
+    # (e.g. 2015 rpm vs 2020 rpm) maps to the same cache entry
+    try:
+        return float(f"{float(value):.{PID_SIG_DIGITS}g}")
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def make_cache_key(dtc: str, vehicle: dict, pid: dict) -> str:
+    vehicle = vehicle or {}
+    parts = {
+        "dtc": (dtc or "").strip().upper(),
+        "make": str(vehicle.get("make") or "").strip().lower(),
+        "model": str(vehicle.get("model") or "").strip().lower(),
+        "year": vehicle.get("year"),
+        "pid": sorted((str(k).strip().lower(), _quantize(v)) for k, v in (pid or {}).items()),
+    }
+    raw = json.dumps(parts, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class DiagnosisCache:
+    """
+    Two-tier result cache for DiagnosisService.run:
+      1) in-process LRU with TTL
+      2) optional SQLite file that survives restarts (DIAGNOSIS_CACHE_DB)
+    Entries are tagged with their DTC so a changed catalogue row can
+    drop every cached diagnosis for that code.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL,
+                 db_path: str = CACHE_DB_PATH, db_ttl: float = CACHE_DB_TTL):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk: Optional[SQLiteCache] = None
+        if db_path:
+            try:
+                self.disk = SQLiteCache(db_path, ttl=db_ttl)
+            except Exception as e:
+                logger.error("Could not open diagnosis cache DB %s: %s", db_path, e)
+        self._keys_by_dtc: Dict[str, Set[str]] = {}
+        self._tracked = 0       # keys added to _keys_by_dtc since it was last pruned
+        self._lock = threading.Lock()
+
+    def get(self, dtc: str, vehicle: dict, pid: dict) -> Optional[dict]:
+        key = make_cache_key(dtc, vehicle, pid)
+        entry = self.memory.get(key)
+        tier = "memory"
+        if entry is None and self.disk is not None:
+            tier = "disk"
+            try:
+                entry = self.disk.get(key)
+            except Exception as e:
+                logger.error("Diagnosis cache DB read failed: %s", e)
+                entry = None
+            if entry is not None:
+                self._remember(key, dtc, entry)
+        if entry is None:
+            CACHE_REQUESTS.labels("miss").inc()
+            return None
+        CACHE_REQUESTS.labels(f"{tier}_hit").inc()
+        return {
+            "llm": LLMResponse.model_validate(entry["llm"]),
+            "sources": entry.get("sources", []),
+            "catalogue_links": entry.get("catalogue_links", []),
+        }
+
+    def set(self, dtc: str, vehicle: dict, pid: dict, result: dict) -> None:
+        llm = result.get("llm")
+        if llm is None:
+            # never cache failed generations
+            return
+        key = make_cache_key(dtc, vehicle, pid)
+        entry = {
+            "llm": llm.model_dump(),
+            "sources": result.get("sources", []),
+            "catalogue_links": result.get("catalogue_links", []),
+        }
+        self._remember(key, dtc, entry)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, entry, tag=dtc.strip().upper())
+            except Exception as e:
+                logger.error("Diagnosis cache DB write failed: %s", e)
+
+    def _remember(self, key: str, dtc: str, entry: dict) -> None:
+        self.memory.set(key, entry)
+        with self._lock:
+            self._keys_by_dtc.setdefault(dtc.strip().upper(), set()).add(key)
+            self._tracked += 1
+            if self._tracked > self.memory.maxsize:
+                self._prune_keys()
+
+    def _prune_keys(self) -> None:
+        # caller holds self._lock; forget keys the memory tier has since evicted or expired
+        pruned: Dict[str, Set[str]] = {}
+        for code, keys in self._keys_by_dtc.items():
+            live = {key for key in keys if key in self.memory}
+            if live:
+                pruned[code] = live
+        self._keys_by_dtc = pruned
+        self._tracked = 0
+
+    def invalidate_dtc(self, dtc: str) -> int:
+        """Drop every cached diagnosis for one DTC (e.g. after its catalogue row changed)."""
+        code = (dtc or "").strip().upper()
+        with self._lock:
+            keys = self._keys_by_dtc.pop(code, set())
+        removed = sum(1 for key in keys if self.memory.pop(key) is not None)
+        if self.disk is not None:
+            try:
+                removed += self.disk.delete_tag(code)
+            except Exception as e:
+                logger.error("Diagnosis cache DB invalidation failed: %s", e)
+        logger.info("Invalidated %s cached diagnoses for %s", removed, code)
+        return removed
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self._lock:
+            self._keys_by_dtc.clear()
+            self._tracked = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+diagnosis_cache = DiagnosisCache()
@@ -1,64 +1,320 @@
-from AI_diagnosis.db.repositories import DTCCatalogueRepo
-from AI_diagnosis.services.rag_service import RAGService
-from AI_diagnosis.services.llm_service import call_groq
-import re
-from typing import List, Dict, Any
-
-MD_LINK_RE = re.compile(r"\[([^\]]+)\]\((https?://[^)]+)\)")
-def parse_discussion_links(text: str) -> List[Dict[str, str]]:
-    """
-    Extracts [title](url) markdown-style links from the DTC catalogue
-    'discussion' column and returns a list of {title, url}.
-    """
-    links: List[Dict[str, str]] = []
-    if not text:
-        return links
-
-    for title, url in MD_LINK_RE.findall(text):
-        links.append(
-            {
-                "title": title.strip(),
-                "url": url.strip(),
-            }
-        )
-    return links
-
-class DiagnosisService:
-    def __init__(self, session):
-        self.cat = DTCCatalogueRepo(session)
-        self.rag = RAGService(session)
-
-    async def run(self, dtc: str, vehicle: dict, pid: dict) -> dict:
-        row = self.cat.get_by_code(dtc)
-        if row:
-            query_text = f"DTC {row['code']}: {row['description']}"
-            catalogue_data = {
-                **row,
-                "has_catalogue": True  
-            }
-            catalogue_discussion = row.get("discussions", "")
-            links_in_discussion = parse_discussion_links(catalogue_discussion)
-            if not links_in_discussion:
-                links_in_discussion = []
-
-        else:
-            # no entry found, only use this for context to the LLM
-            query_text = dtc
-            catalogue_data = {
-                "code": dtc,
-                "description": f"DTC {dtc} (no catalogue entry)",
-                "probable_causes": "Unknown",
-                "solutions": "Refer to retrieved discussions",
-                "symptoms": "Not provided",
-                "has_catalogue": False,  
-            }
-            links_in_discussion = []
-
-        reddit_text, sources = self.rag.retrieve(dtc, query_text, top_k=5)
-
-        llm_resp = await call_groq(catalogue_data, reddit_text, vehicle, pid)
-        return {
-            "llm": llm_resp,
-            "sources": sources,
-            "catalogue_links": links_in_discussion # 
-        }
\ No newline at end of file
+from AI_diagnosis.db.repositories import DTCCatalogueRepo
+from AI_diagnosis.services.rag_service import RAGService, build_context
+from AI_diagnosis.services.llm_service import call_groq, call_groq_multi, stream_groq
+from AI_diagnosis.services.cache_service import diagnosis_cache, make_cache_key
+from AI_diagnosis.services.fast_path import catalogue_response, policy_for
+from AI_diagnosis.models.request_response import LLMResponse, QuickFix
+from AI_diagnosis.utils.embedding_store import catalogue_query_text
+from AI_diagnosis.utils.metrics import FALLBACKS
+from AI_diagnosis.utils.singleflight import SingleFlight
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger("services.diagnosis")
+
+RAG_TOP_K = 5
+# LLM calls a single batch request may have in flight (the gateway caps the process)
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# identical diagnoses arriving together share one retrieval + LLM call
+_diagnosis_flights = SingleFlight("diagnosis")
+
+# background LLM upgrades of catalogue answers (strong refs so they aren't GC'd mid-flight)
+_upgrades: "set[asyncio.Task]" = set()
+fast_path_stats = {"served": 0, "upgrades_started": 0, "upgrades_failed": 0}
+
+
+def _upgrade_done(task: asyncio.Task) -> None:
+    _upgrades.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        fast_path_stats["upgrades_failed"] += 1
+        logger.error("Background LLM upgrade failed: %s", task.exception())
+
+
+def fallback_llm_response(dtc: str) -> LLMResponse:
+    """Answer returned when the model produced nothing usable."""
+    FALLBACKS.labels("static_answer").inc()
+    return LLMResponse(
+        dtc_code=dtc,
+        dtc_meaning="N/A",
+        summary="The AI model did not return a structured diagnosis.",
+        severity="LOW",
+        causes=["Incomplete context or model timeout."],
+        effects=["Unable to analyze current vehicle data."],
+        quick_fixes=[QuickFix( # FIX: Use QuickFix model with structured data
+            step="Try again later or verify DTC code and PID snapshot.",
+            location_tip="This is a general troubleshooting suggestion and does not apply to a specific part."
+        )],
+
+        safety_advice="If the warning light stays on or the car behaves abnormally, have it inspected by a qualified technician.",
+        technical_terms={}
+    )
+
+
+class DiagnosisService:
+    def __init__(self, session, cache=diagnosis_cache):
+        self.cat = DTCCatalogueRepo(session)
+        self.rag = RAGService(session)
+        self.cache = cache
+
+    async def run(self, dtc: str, vehicle: dict, pid: dict) -> dict:
+        if self.cache is not None:
+            cached = self.cache.get(dtc, vehicle, pid)
+            if cached is not None:
+                return cached
+
+        fast = await self._fast_path(dtc, vehicle, pid)
+        if fast is not None:
+            return fast
+
+        return await _diagnosis_flights.do(
+            make_cache_key(dtc, vehicle, pid), lambda: self._compute(dtc, vehicle, pid)
+        )
+
+    async def _compute(self, dtc: str, vehicle: dict, pid: dict) -> dict:
+        result = await self._run_pipeline(dtc, vehicle, pid)
+        if self.cache is not None:
+            self.cache.set(dtc, vehicle, pid, result)
+        return result
+
+    async def _fast_path(self, dtc: str, vehicle: dict, pid: dict) -> Optional[dict]:
+        """
+        Catalogue-only answer if the code's policy allows one and its row is
+        complete enough; under fast_then_upgrade the LLM answer is computed in
+        the background and replaces it in the cache.
+        """
+        policy = policy_for(dtc)
+        if policy == "llm":
+            return None
+        row = await self.cat.get_by_code(dtc)
+        llm_resp = catalogue_response(row)
+        if llm_resp is None:
+            return None
+
+        fast_path_stats["served"] += 1
+        if policy == "fast_then_upgrade" and self.cache is not None:
+            task = asyncio.ensure_future(_diagnosis_flights.do(
+                make_cache_key(dtc, vehicle, pid), lambda: self._compute(dtc, vehicle, pid)
+            ))
+            _upgrades.add(task)
+            task.add_done_callback(_upgrade_done)
+            fast_path_stats["upgrades_started"] += 1
+        return {
+            "llm": llm_resp,
+            "sources": [],
+            "catalogue_links": self.cat.discussion_links(row),
+            "answer_source": "catalogue",
+        }
+
+    async def _run_pipeline(self, dtc: str, vehicle: dict, pid: dict) -> dict:
+        ctx = await self.prepare(dtc)
+        llm_resp = await call_groq(ctx["catalogue"], ctx["snippets"], vehicle, pid)
+        return {
+            "llm": llm_resp,
+            "sources": ctx["sources"],
+            "catalogue_links": ctx["catalogue_links"]
+        }
+
+    async def run_batch(
+        self,
+        items: Iterable[Tuple[str, dict, dict]],
+        concurrency: int = BATCH_LLM_CONCURRENCY,
+    ) -> AsyncIterator[Tuple[int, Optional[dict]]]:
+        """
+        Diagnose many (dtc, vehicle, pid) items and yield (index, result) in
+        completion order. Catalogue lookup and retrieval run once per distinct
+        DTC, at most `concurrency` LLM calls are in flight, and an item that
+        fails yields None instead of failing the batch.
+        """
+        llm_slots = asyncio.Semaphore(concurrency)
+        contexts: Dict[str, asyncio.Task] = {}
+
+        def context(dtc: str) -> asyncio.Task:
+            if dtc not in contexts:
+                contexts[dtc] = asyncio.ensure_future(self.prepare(dtc))
+            return contexts[dtc]
+
+        async def one(index: int, dtc: str, vehicle: dict, pid: dict) -> Tuple[int, Optional[dict]]:
+            try:
+                if self.cache is not None:
+                    cached = self.cache.get(dtc, vehicle, pid)
+                    if cached is not None:
+                        return index, cached
+                fast = await self._fast_path(dtc, vehicle, pid)
+                if fast is not None:
+                    return index, fast
+
+                async def compute() -> dict:
+                    llm_resp = await call_groq(ctx["catalogue"], ctx["snippets"], vehicle, pid)
+                    result = {"llm": llm_resp, "sources": ctx["sources"], "catalogue_links": ctx["catalogue_links"]}
+                    if self.cache is not None:
+                        self.cache.set(dtc, vehicle, pid, result)
+                    return result
+
+                # context and slot are awaited here, in this item's own task, so
+                # cancelling it stops the item; only once inside the flight (its
+                # own shielded task, possibly shared with other requests) does
+                # the LLM call run to completion regardless
+                ctx = await context(dtc)
+                async with llm_slots:
+                    return index, await _diagnosis_flights.do(make_cache_key(dtc, vehicle, pid), compute)
+            except Exception as e:
+                logger.exception("Batch item %s (%s) failed: %s", index, dtc, e)
+                return index, None
+
+        tasks = [asyncio.ensure_future(one(i, dtc, vehicle, pid)) for i, (dtc, vehicle, pid) in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # client went away: stop items that haven't started their LLM call yet
+            for task in tasks:
+                task.cancel()
+            for task in contexts.values():
+                task.cancel()
+
+    async def stream(self, dtc: str, vehicle: dict, pid: dict) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Event stream for the streaming endpoint:
+          {"event": "catalogue", ...}  as soon as the catalogue lookup is done
+          {"event": "sources", ...}    after retrieval
+          {"event": "field", ...}      one per LLMResponse field while generating
+          {"event": "result", ...}     the validated result (llm may be None)
+        """
+        if self.cache is not None:
+            cached = self.cache.get(dtc, vehicle, pid)
+            if cached is not None:
+                yield {"event": "catalogue", "data": {"code": dtc.strip().upper(), "dtc_catalogue_links": cached["catalogue_links"]}}
+                yield {"event": "sources", "data": cached["sources"]}
+                yield {"event": "result", **cached}
+                return
+
+        fast = await self._fast_path(dtc, vehicle, pid)
+        if fast is not None:
+            yield {"event": "catalogue", "data": {"code": dtc.strip().upper(), "dtc_catalogue_links": fast["catalogue_links"]}}
+            yield {"event": "sources", "data": []}
+            yield {"event": "result", **fast}
+            return
+
+        ctx = await self.prepare(dtc)
+        catalogue = {k: v for k, v in ctx["catalogue"].items() if k != "discussions"}
+        yield {"event": "catalogue", "data": {**catalogue, "dtc_catalogue_links": ctx["catalogue_links"]}}
+        yield {"event": "sources", "data": ctx["sources"]}
+
+        llm_resp = None
+        async for kind, payload in stream_groq(ctx["catalogue"], ctx["snippets"], vehicle, pid):
+            if kind == "field":
+                key, value = payload
+                yield {"event": "field", "key": key, "value": value}
+            else:
+                llm_resp = payload
+
+        result = {"llm": llm_resp, "sources": ctx["sources"], "catalogue_links": ctx["catalogue_links"]}
+        if self.cache is not None:
+            self.cache.set(dtc, vehicle, pid, result)
+        yield {"event": "result", **result}
+
+    async def run_multi(self, dtcs: List[str], vehicle: dict, pid: dict) -> dict:
+        """
+        Joint diagnosis of several codes from the same scan in one LLM call.
+        Catalogue rows and retrieval for all codes are fetched in one pass and
+        snippets shared between codes are sent once. Returns
+        {"llm": {code: LLMResponse}, "joint_summary", "sources", "catalogue_links"};
+        codes the model did not answer are missing from "llm".
+        """
+        codes = list(dict.fromkeys(c.strip().upper() for c in dtcs))
+
+        async def compute() -> dict:
+            ctx = await self.prepare_multi(codes)
+            answers, joint_summary = await call_groq_multi(ctx["catalogues"], ctx["snippets"], vehicle, pid)
+            return {
+                "llm": answers,
+                "joint_summary": joint_summary,
+                "sources": ctx["sources"],
+                "catalogue_links": ctx["catalogue_links"],
+            }
+
+        return await _diagnosis_flights.do(("multi", make_cache_key(",".join(codes), vehicle, pid)), compute)
+
+    async def prepare_multi(self, codes: List[str]) -> dict:
+        rows, *keyword_rows = await asyncio.gather(
+            self.cat.get_many(codes),
+            *(self.rag.keyword_rows(code, top_k=RAG_TOP_K) for code in codes),
+        )
+        contexts = [self._catalogue_context(code, rows.get(code)) for code in codes]
+        retrieved = await asyncio.gather(*(
+            self.rag.retrieve_rows(code, query_text, top_k=RAG_TOP_K, keyword_rows=kw_rows)
+            for code, (query_text, _, _), kw_rows in zip(codes, contexts, keyword_rows)
+        ))
+
+        # related codes pull the same threads (P0171 + P0174); send each one once
+        merged, seen_ids, seen_text = [], set(), set()
+        for row in (row for rows_for_code in retrieved for row in rows_for_code):
+            text = " ".join((row.get("content") or "").split()).lower()
+            if row.get("id") in seen_ids or text in seen_text:
+                continue
+            if row.get("id") is not None:
+                seen_ids.add(row["id"])
+            seen_text.add(text)
+            merged.append(row)
+        snippets, sources = build_context(merged)
+
+        links, seen_urls = [], set()
+        for _, _, code_links in contexts:
+            for link in code_links:
+                if link.get("url") not in seen_urls:
+                    seen_urls.add(link.get("url"))
+                    links.append(link)
+
+        return {
+            "catalogues": [catalogue for _, catalogue, _ in contexts],
+            "catalogue_links": links,
+            "snippets": snippets,
+            "sources": sources,
+        }
+
+    def _catalogue_context(self, dtc: str, row: dict | None) -> Tuple[str, dict, List[dict]]:
+        """(retrieval query text, catalogue data for the prompt, discussion links) for one code."""
+        if row:
+            query_text = catalogue_query_text(row)
+            catalogue_data = {
+                **row,
+                "has_catalogue": True  
+            }
+            links_in_discussion = self.cat.discussion_links(row)
+
+        else:
+            # no entry found, only use this for context to the LLM
+            query_text = dtc
+            catalogue_data = {
+                "code": dtc,
+                "description": f"DTC {dtc} (no catalogue entry)",
+                "probable_causes": "Unknown",
+                "solutions": "Refer to retrieved discussions",
+                "symptoms": "Not provided",
+                "has_catalogue": False,  
+            }
+            links_in_discussion = []
+        return query_text, catalogue_data, links_in_discussion
+
+    async def prepare(self, dtc: str) -> dict:
+        """Catalogue lookup + retrieval: everything the prompt needs besides the vehicle."""
+        # catalogue row and keyword matches are independent, fetch them together
+        row, keyword_rows = await asyncio.gather(
+            self.cat.get_by_code(dtc),
+            self.rag.keyword_rows(dtc, top_k=RAG_TOP_K),
+        )
+        query_text, catalogue_data, links_in_discussion = self._catalogue_context(dtc, row)
+
+        snippets, sources = await self.rag.retrieve(
+            dtc, query_text, top_k=RAG_TOP_K, keyword_rows=keyword_rows
+        )
+
+        return {
+            "catalogue": catalogue_data,
+            "catalogue_links": links_in_discussion,
+            "snippets": snippets,
+            "sources": sources,
+        }
@@ -0,0 +1,184 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+from AI_diagnosis.models.request_response import LLMResponse, QuickFix
+
+# Per-code answer policy:
+#   llm                - always retrieval + LLM (the original behaviour)
+#   fast               - answer from the catalogue row when it is complete enough
+#   fast_then_upgrade  - answer from the catalogue now, compute the LLM answer in
+#                        the background and serve that from the cache afterwards
+# DIAGNOSIS_POLICY_OVERRIDES takes code or prefix rules, longest prefix wins:
+#   "P0455=fast,P044=fast,P03=llm"
+POLICIES = ("llm", "fast", "fast_then_upgrade")
+DIAGNOSIS_POLICY = os.getenv("DIAGNOSIS_POLICY", "llm")
+DIAGNOSIS_POLICY_OVERRIDES = os.getenv("DIAGNOSIS_POLICY_OVERRIDES", "")
+
+
+def _parse_overrides(raw: str) -> Dict[str, str]:
+    overrides = {}
+    for rule in raw.split(","):
+        prefix, _, policy = rule.partition("=")
+        prefix, policy = prefix.strip().upper(), policy.strip().lower()
+        if prefix and policy in POLICIES:
+            overrides[prefix] = policy
+    return overrides
+
+
+_overrides = _parse_overrides(DIAGNOSIS_POLICY_OVERRIDES)
+
+
+def policy_for(dtc: str) -> str:
+    code = (dtc or "").strip().upper()
+    for length in range(len(code), 0, -1):
+        policy = _overrides.get(code[:length])
+        if policy:
+            return policy
+    return DIAGNOSIS_POLICY if DIAGNOSIS_POLICY in POLICIES else "llm"
+
+
+# ---------- curated templates ----------
+
+# (code prefix or description keyword, severity); first match wins, codes before keywords
+_SEVERITY_BY_PREFIX = [
+    ("P0217", "CRITICAL"),   # engine over temperature
+    ("P0520", "CRITICAL"),   # oil pressure sensor/switch (P0525-P0529 are cruise servo and fan speed)
+    ("P0521", "CRITICAL"),
+    ("P0522", "CRITICAL"),
+    ("P0523", "CRITICAL"),
+    ("P0524", "CRITICAL"),   # engine oil pressure too low
+    ("P030", "HIGH"),        # misfires: can damage the catalytic converter
+    ("P07", "MEDIUM"),       # transmission
+    ("P042", "MEDIUM"),      # catalyst efficiency
+    ("P043", "MEDIUM"),
+    ("P044", "LOW"),         # EVAP system
+    ("P045", "LOW"),
+    ("P046", "LOW"),
+    ("B00", "HIGH"),         # airbag / restraints
+    ("C0", "HIGH"),          # chassis: ABS, brakes, steering
+]
+_SEVERITY_BY_KEYWORD = [
+    ("over temperature", "CRITICAL"),
+    ("overheat", "CRITICAL"),
+    ("oil pressure", "CRITICAL"),
+    ("misfire", "HIGH"),
+    ("brake", "HIGH"),
+    ("airbag", "HIGH"),
+    ("evaporative", "LOW"),
+    ("evap", "LOW"),
+]
+
+_SAFETY_ADVICE = {
+    "LOW": "Safe to drive; have it looked at during your next service.",
+    "MEDIUM": "Usually safe to drive for now, but get it checked soon to avoid further damage or failed emissions.",
+    "HIGH": "Limit driving and have the car inspected as soon as possible; continuing to drive can cause further damage.",
+    "CRITICAL": "Stop driving as soon as it is safe and have the car towed or inspected before driving again.",
+}
+
+# (description keyword, quick fix); every matching fix is offered, most specific first
+_QUICK_FIXES = [
+    ("evap", QuickFix(
+        step="Remove the fuel cap, check the rubber seal for cracks, and refit it until it clicks several times.",
+        location_tip="The fuel cap is behind the fuel door on the side of the car.")),
+    ("evaporative", QuickFix(
+        step="Remove the fuel cap, check the rubber seal for cracks, and refit it until it clicks several times.",
+        location_tip="The fuel cap is behind the fuel door on the side of the car.")),
+    ("lean", QuickFix(
+        step="With the engine off, look for cracked, split or disconnected rubber vacuum hoses and listen for a hiss at idle.",
+        location_tip="Vacuum hoses run across the top of the engine, between the air intake tube and the intake manifold.")),
+    ("misfire", QuickFix(
+        step="With the engine off, check that each ignition coil or spark plug wire is firmly seated and its connector is clipped in.",
+        location_tip="The ignition coils or plug wires sit on top of the engine, one per cylinder.")),
+    ("o2", QuickFix(
+        step="Check that the oxygen sensor connector is fully clipped in and its wiring isn't melted or touching the exhaust.",
+        location_tip="Oxygen sensors are screwed into the exhaust pipe, before and after the catalytic converter.")),
+    ("oxygen", QuickFix(
+        step="Check that the oxygen sensor connector is fully clipped in and its wiring isn't melted or touching the exhaust.",
+        location_tip="Oxygen sensors are screwed into the exhaust pipe, before and after the catalytic converter.")),
+    ("mass air", QuickFix(
+        step="Make sure the air intake tube clamps are tight and the air filter isn't clogged.",
+        location_tip="The air filter box is at the front of the engine bay; the intake tube runs from it to the engine.")),
+    ("voltage", QuickFix(
+        step="Check that the battery terminals are tight and free of white or green corrosion.",
+        location_tip="The battery is usually in a front corner of the engine bay.")),
+    ("coolant", QuickFix(
+        step="With the engine cold, check the coolant level in the overflow tank.",
+        location_tip="The coolant overflow tank is a translucent plastic bottle near the radiator, marked MIN/MAX.")),
+]
+_GENERIC_QUICK_FIX = QuickFix(
+    step="Check for loose connectors, damaged wiring or disconnected hoses around the part named in the code, then clear the code and see if it returns.",
+    location_tip="This is a general check; the related parts are usually in the engine bay.")
+
+_TERMS = {
+    "o2": ("O2 sensor", "Oxygen sensor; measures oxygen in the exhaust and is screwed into the exhaust pipe under the car."),
+    "oxygen": ("O2 sensor", "Oxygen sensor; measures oxygen in the exhaust and is screwed into the exhaust pipe under the car."),
+    "maf": ("MAF", "Mass air flow sensor; measures air entering the engine, in the intake tube right after the air filter box."),
+    "mass air": ("MAF", "Mass air flow sensor; measures air entering the engine, in the intake tube right after the air filter box."),
+    "evap": ("EVAP", "Evaporative emission system; catches fuel vapour from the tank, with parts near the fuel tank and in the engine bay."),
+    "catalyst": ("Catalytic converter", "Cleans the exhaust gases; a metal canister in the exhaust pipe under the car."),
+    "bank 1": ("Bank 1", "The side of the engine that has cylinder number 1."),
+    "bank 2": ("Bank 2", "The side of a V-shaped engine opposite cylinder number 1."),
+    "throttle": ("Throttle body", "Valve that controls air into the engine, where the intake tube meets the engine."),
+}
+
+
+def _keyword_re(keyword: str) -> re.Pattern:
+    # anchored at the start of a word: "overheat" also matches "overheating", "lean" doesn't match "clean"
+    return re.compile(r"\b" + re.escape(keyword))
+
+
+_SEVERITY_BY_KEYWORD_RE = [(_keyword_re(keyword), severity) for keyword, severity in _SEVERITY_BY_KEYWORD]
+_QUICK_FIXES_RE = [(_keyword_re(keyword), fix) for keyword, fix in _QUICK_FIXES]
+_TERMS_RE = [(_keyword_re(keyword), value) for keyword, value in _TERMS.items()]
+
+_SPLIT_RE = re.compile(r"\s*(?:\n|;|,|•|\s-\s|^\s*-\s*|\d+\.\s)\s*")
+
+
+def _split_list(text: str) -> List[str]:
+    items = [item.strip(" .-*") for item in _SPLIT_RE.split(text or "")]
+    return list(dict.fromkeys(item for item in items if len(item) > 2))
+
+
+def _severity(code: str, description: str) -> str:
+    for prefix, severity in _SEVERITY_BY_PREFIX:
+        if code.startswith(prefix):
+            return severity
+    for keyword, severity in _SEVERITY_BY_KEYWORD_RE:
+        if keyword.search(description):
+            return severity
+    return "MEDIUM"
+
+
+def catalogue_response(row: Optional[dict]) -> Optional[LLMResponse]:
+    """
+    Deterministic answer built from a catalogue row, or None when the row is
+    missing the description or the probable causes.
+    """
+    if not row:
+        return None
+    code = (row.get("code") or "").strip().upper()
+    description = (row.get("description") or "").strip()
+    causes = _split_list(row.get("probable_causes") or "")
+    if not code or not description or not causes:
+        return None
+
+    # severity is what the code means, not what might have caused it: a lean
+    # code listing "misfire" or "overheating" among its causes stays MEDIUM
+    severity = _severity(code, description.lower())
+    text = " ".join([description, row.get("probable_causes") or "", row.get("symptoms") or ""]).lower()
+
+    quick_fixes = list({fix.step: fix for keyword, fix in _QUICK_FIXES_RE if keyword.search(text)}.values())
+    terms = dict(value for keyword, value in _TERMS_RE if keyword.search(text))
+
+    return LLMResponse(
+        dtc_code=code,
+        dtc_meaning=description,
+        summary=f"{code} means \"{description}\". The most common cause is {causes[0][0].lower() + causes[0][1:]}.",
+        severity=severity,
+        causes=causes[:6],
+        effects=_split_list(row.get("symptoms") or "")[:6],
+        quick_fixes=quick_fixes[:3] or [_GENERIC_QUICK_FIX],
+        safety_advice=_SAFETY_ADVICE[severity],
+        technical_terms=terms,
+    )
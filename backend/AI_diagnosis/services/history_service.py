@@ -0,0 +1,66 @@
+import base64
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from AI_diagnosis.db.repositories import DiagnosisHistoryRepo
+
+logger = logging.getLogger("services.history")
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) from an opaque cursor; ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(row_id))
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+class HistoryService:
+    def __init__(self, session):
+        self.repo = DiagnosisHistoryRepo(session)
+
+    async def reusable(self, vehicle_id: str, dtc: str, max_age_s: int) -> Optional[Dict[str, Any]]:
+        """Stored diagnosis of `dtc` for the vehicle that is at most max_age_s old."""
+        newer_than = (datetime.now(timezone.utc) - timedelta(seconds=max_age_s)).isoformat()
+        return await self.repo.latest(vehicle_id, dtc, newer_than)
+
+    async def record(self, vehicle_id: str, dtc: str, request: dict, response: dict,
+                     model: str, answer_source: str) -> Optional[str]:
+        """Save a diagnosis; its id once stored, None if the insert failed (e.g. unknown vehicle)."""
+        row = {
+            "id": str(uuid.uuid4()),
+            "vehicle_id": vehicle_id,
+            "dtc": dtc.strip().upper(),
+            "request": request,
+            "response": response,
+            "model": model,
+            "answer_source": answer_source,
+        }
+        saved = await self.repo.insert(row)
+        return saved["id"] if saved else None
+
+    async def list(self, vehicle_id: str, limit: int = 20, cursor: Optional[str] = None,
+                   dtc: Optional[str] = None) -> Dict[str, Any]:
+        after = decode_cursor(cursor) if cursor else None
+        # one extra row tells us whether another page exists
+        rows = await self.repo.list_for_vehicle(vehicle_id, limit=limit + 1, after=after, dtc=dtc)
+        items = rows[:limit]
+        next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    async def get(self, diagnosis_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            uuid.UUID(diagnosis_id)
+        except ValueError:
+            return None     # not an id we could have issued; don't send it to Postgres
+        return await self.repo.get(diagnosis_id)
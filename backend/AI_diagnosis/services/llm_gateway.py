@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from AI_diagnosis.utils.metrics import record_usage
+
+logger = logging.getLogger("llm_gateway")
+
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# one attempt never outlives the call's deadline, whichever is shorter
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "15"))
+# whole call, retries and backoff included
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "20"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, body: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = body or {}
+
+    @property
+    def code(self) -> Optional[str]:
+        error = self.body.get("error") if isinstance(self.body, dict) else None
+        return error.get("code") if isinstance(error, dict) else None
+
+
+class LLMBadRequest(LLMError):
+    """4xx the provider will keep rejecting (e.g. json_validate_failed); never retried."""
+
+
+class LLMUnavailable(LLMError):
+    """Circuit open, or retries exhausted on 429/5xx/transport errors."""
+
+
+class LLMTimeout(LLMUnavailable):
+    """The call's deadline passed before the provider answered."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and rejects calls for
+    `cooldown` seconds; then lets a single trial call through (half-open)
+    and closes again on success.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN_S):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open":
+            # one trial per cooldown window (a cancelled trial doesn't wedge the breaker)
+            now = time.monotonic()
+            if self._trial_started is None or now - self._trial_started >= self.cooldown:
+                self._trial_started = now
+                return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_started = None
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.error("LLM circuit opened after %s consecutive failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """
+    Async client for an OpenAI-compatible chat completions API (Groq).
+
+    - one pooled HTTP/2 connection set shared by every request
+    - at most `max_concurrency` requests in flight
+    - jittered exponential backoff on 429/5xx/transport errors,
+      honouring Retry-After
+    - one deadline per call covering every attempt and backoff; a retry
+      that can't fit is not started
+    - circuit breaker that fails fast while the provider is down; only
+      calls that reached the provider count, so a hanging provider opens
+      it but a local queue that eats the deadline, or callers that go
+      away (cancellation), do not
+    """
+
+    def __init__(
+        self,
+        base_url: str = GROQ_BASE_URL,
+        api_key: str = "",
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        timeout: float = LLM_HTTP_TIMEOUT,
+        deadline: float = LLM_DEADLINE_S,
+        http2: bool = True,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.http2 = http2
+        self.breaker = CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.retries = 0
+        self.rejected = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            if not self.api_key:
+                raise RuntimeError("GROQ_API_KEY must be set")
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.http2,
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX)
+            except ValueError:
+                pass
+        # "full jitter": uniform in [0, base * 2^attempt]
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+    async def _pause_before_retry(self, attempt: int, retry_after: Optional[str], end: float,
+                                  error: LLMError, what: str) -> bool:
+        """Sleep before the next attempt; False when no attempt is left or it would not fit before `end`."""
+        if attempt >= self.max_retries:
+            return False
+        delay = self._backoff(attempt, retry_after)
+        if asyncio.get_running_loop().time() + delay >= end:
+            return False
+        logger.warning("LLM %s failed (%s), retry %s in %.2fs", what, error, attempt + 1, delay)
+        await asyncio.sleep(delay)
+        return True
+
+    async def chat(self, messages: List[Dict[str, str]], model: str,
+                   deadline: Optional[float] = None, **params: Any) -> Dict[str, Any]:
+        """
+        POST /chat/completions and return the decoded JSON body. Raises
+        LLMTimeout once `deadline` seconds (default LLM_DEADLINE_S) have
+        passed, retries included.
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailable("LLM circuit open, failing fast")
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + (self.deadline if deadline is None else deadline)
+        payload = {"model": model, "messages": messages, **params}
+        last_error: Optional[LLMError] = None
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                for attempt in range(self.max_retries + 1):
+                    if attempt:
+                        self.retries += 1
+                    retry_after = None
+                    remaining = end - loop.time()
+                    if remaining <= 0:
+                        if not attempt:
+                            # spent in our own queue: says nothing about the provider
+                            raise LLMTimeout("LLM deadline passed while queued")
+                        last_error = LLMTimeout("LLM deadline passed while waiting to retry")
+                        break
+                    try:
+                        resp = await asyncio.wait_for(
+                            self.client.post("/chat/completions", json=payload, timeout=min(self.timeout, remaining)),
+                            timeout=remaining,
+                        )
+                    except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+                        last_error = LLMTimeout(f"LLM call timed out: {e!r}")
+                    except httpx.HTTPError as e:
+                        last_error = LLMUnavailable(f"LLM transport error: {e!r}")
+                    else:
+                        if resp.status_code < 400:
+                            self.breaker.record_success()
+                            body = resp.json()
+                            record_usage(body.get("usage"))
+                            return body
+                        last_error = self._http_error(resp)
+                        retry_after = resp.headers.get("retry-after")
+
+                    if not await self._pause_before_retry(attempt, retry_after, end, last_error, "call"):
+                        break
+            finally:
+                self.in_flight -= 1
+
+        self.breaker.record_failure()
+        raise last_error
+
+    async def stream_chat(self, messages: List[Dict[str, str]], model: str,
+                          deadline: Optional[float] = None, **params: Any) -> AsyncIterator[str]:
+        """
+        POST /chat/completions with stream=true and yield the content deltas.
+        Retries only happen before the first delta has been yielded. The
+        whole stream must finish within `deadline` seconds (default
+        LLM_DEADLINE_S), else LLMTimeout is raised.
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailable("LLM circuit open, failing fast")
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + (self.deadline if deadline is None else deadline)
+
+        def remaining() -> float:
+            left = end - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+
+        payload = {"model": model, "messages": messages, **params, "stream": True}
+        last_error: Optional[LLMError] = None
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                for attempt in range(self.max_retries + 1):
+                    if attempt:
+                        self.retries += 1
+                    retry_after = None
+                    started = False
+                    if not attempt and end <= loop.time():
+                        # spent in our own queue: says nothing about the provider
+                        raise LLMTimeout("LLM deadline passed while queued")
+                    try:
+                        request = self.client.stream("POST", "/chat/completions", json=payload,
+                                                     timeout=min(self.timeout, remaining()))
+                        resp = await asyncio.wait_for(request.__aenter__(), timeout=remaining())
+                        try:
+                            if resp.status_code >= 400:
+                                await asyncio.wait_for(resp.aread(), timeout=remaining())
+                                last_error = self._http_error(resp)
+                                retry_after = resp.headers.get("retry-after")
+                            else:
+                                lines = resp.aiter_lines()
+                                while True:
+                                    try:
+                                        line = await asyncio.wait_for(lines.__anext__(), timeout=remaining())
+                                    except StopAsyncIteration:
+                                        break
+                                    if not line.startswith("data:"):
+                                        continue
+                                    data = line[5:].strip()
+                                    if data == "[DONE]":
+                                        return
+                                    chunk = json.loads(data)
+                                    if chunk.get("error"):
+                                        raise LLMBadRequest("LLM stream error", status=resp.status_code, body=chunk)
+                                    # usage arrives on the last chunk (Groq: under x_groq)
+                                    record_usage(chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage"))
+                                    choices = chunk.get("choices") or []
+                                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                                    if delta:
+                                        if not started:
+                                            # the provider is answering; later failures are ours to report
+                                            self.breaker.record_success()
+                                            started = True
+                                        yield delta
+                                return
+                        finally:
+                            await request.__aexit__(None, None, None)
+                    except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+                        if started:
+                            raise LLMTimeout(f"LLM stream timed out: {e!r}")
+                        last_error = LLMTimeout(f"LLM stream timed out: {e!r}")
+                    except httpx.HTTPError as e:
+                        if started:
+                            raise LLMUnavailable(f"LLM stream interrupted: {e!r}")
+                        last_error = LLMUnavailable(f"LLM transport error: {e!r}")
+
+                    if not await self._pause_before_retry(attempt, retry_after, end, last_error, "stream"):
+                        break
+            finally:
+                self.in_flight -= 1
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def _http_error(self, resp: httpx.Response) -> LLMError:
+        """Raise LLMBadRequest for non-retryable statuses, return the retryable error otherwise."""
+        body = _safe_json(resp)
+        if resp.status_code not in RETRYABLE_STATUS:
+            # the provider answered; it's our request that is wrong
+            self.breaker.record_success()
+            raise LLMBadRequest(f"LLM request rejected ({resp.status_code})",
+                                status=resp.status_code, body=body)
+        return LLMUnavailable(f"LLM returned {resp.status_code}", status=resp.status_code, body=body)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "breaker": self.breaker.state,
+        }
+
+
+def _safe_json(resp: httpx.Response) -> dict:
+    try:
+        body = resp.json()
+        return body if isinstance(body, dict) else {"body": body}
+    except ValueError:
+        return {"body": resp.text}
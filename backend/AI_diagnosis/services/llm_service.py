@@ -1,123 +1,299 @@
-import os,asyncio,json
-from groq import Groq,BadRequestError
-from typing import Optional
-import logging
-from AI_diagnosis.models.request_response import LLMResponse,QuickFix
-from AI_diagnosis.prompts.template import build_prompt
-from dotenv import load_dotenv
-
-logger = logging.getLogger("llm_service")
-load_dotenv()
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY", "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")
-GROQ_MODEL   = os.getenv("GROQ_MODEL",   "qwen/qwen3-32b")
-
-client = Groq(api_key=GROQ_API_KEY)
-
-REQUEST_TIMEOUT = 20
-
-async def call_groq(catalogue: dict, reddit: str, vehicle: dict, pid: dict) -> Optional[LLMResponse]:
-    try:
-
-        prompt = build_prompt(catalogue, reddit, vehicle, pid)
-        messages = [
-            {"role": "system", "content": prompt["system"]},
-            {"role": "user", "content": prompt["user"]}
-        ]
-        print(f"System prompt: {prompt['system']}")
-        print(f"User prompt: {prompt['user']}")
-
-        
-        def _do_request():
-            return client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=messages,
-                temperature=0.0,
-                max_tokens=2048,
-                presence_penalty=0.0,
-                response_format={"type": "json_object"},
-            )
-
-        try:
-            resp = await asyncio.wait_for(asyncio.to_thread(_do_request), timeout=REQUEST_TIMEOUT)
-        except asyncio.TimeoutError:
-            logger.error("Groq API timed out after %s seconds", REQUEST_TIMEOUT)
-            return None
-
-        if not resp or not resp.choices or not resp.choices[0].message:
-            logger.warning("Empty response from Groq.")
-            return None
-
-        content = resp.choices[0].message.content
-        try:
-            llm= LLMResponse.model_validate_json(content)
-            
-        except Exception as ve:
-            logger.error("Invalid JSON structure: %s", ve)
-            return None
-        has_catalogue = bool(catalogue.get("has_catalogue", True))
-        code = catalogue.get("code")
-        desc = catalogue.get("description")
-
-        # Aensure dtc_code is set to the actual code string
-        if code:
-            llm.dtc_code = code
-        else:
-            llm.dtc_code = llm.dtc_code or "UNKNOWN"
-
-        # Only force dtc_meaning from catalogue when we *really* have an entry
-        if has_catalogue and desc:
-            llm.dtc_meaning = desc
-        else:
-            # No catalogue entry: keep LLM's wording, or fall back to a generic label
-            if not llm.dtc_meaning:
-                llm.dtc_meaning = f"DTC {code or llm.dtc_code or 'Unknown code'}"
-
-        return llm
-
-    # JSON validation error, attempt fallback
-    except BadRequestError as e:
-        if "json_validate_failed" in str(e):
-            logger.warning("Groq JSON generation failed, retrying in text mode...")
-            try:
-                fallback = client.chat.completions.create(
-                    model=GROQ_MODEL,
-                    messages=messages,
-                    temperature=0.0,
-                    max_tokens=2048,
-                )
-                text = fallback.choices[0].message.content
-                cleaned_text = text.strip()
-                json_start, json_end = cleaned_text.find("{"), cleaned_text.rfind("}")
-                if json_start != -1 and json_end != -1:
-                    snippet = text[json_start:json_end + 1]
-                    llm = LLMResponse.model_validate_json(snippet)
-                    has_catalogue = bool(catalogue.get("has_catalogue", True))
-                    code = catalogue.get("code")
-                    desc = catalogue.get("description")
-
-                    # Always ensure dtc_code is set to the actual code string
-                    if code:
-                        llm.dtc_code = code
-                    else:
-                        llm.dtc_code = llm.dtc_code or "UNKNOWN"
-
-                    # Only force dtc_meaning from catalogue when we *really* have an entry
-                    if has_catalogue and desc:
-                        llm.dtc_meaning = desc
-                    else:
-                        # No catalogue entry: keep LLM's wording, or fall back to a generic label
-                        if not llm.dtc_meaning:
-                            llm.dtc_meaning = f"DTC {code or llm.dtc_code or 'Unknown code'}"
-
-                    return llm
-                            
-            except Exception as re:
-                logger.error("Retry also failed: %s", re)
-        else:
-            logger.exception("Groq BadRequestError: %s", e)
-        return None
-
-    except Exception as e:
-        logger.exception("Unexpected error in call_groq: %s", e)
-        return None
\ No newline at end of file
+import os,asyncio,json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, TypeVar
+import logging
+from AI_diagnosis.models.request_response import LLMResponse, MultiLLMResponse, QuickFix
+from AI_diagnosis.prompts.template import build_multi_prompt, build_prompt
+from AI_diagnosis.services.llm_gateway import LLMGateway, LLMBadRequest, LLMError, LLMTimeout
+from AI_diagnosis.utils.json_repair import coerce_llm_response, repair_json
+from AI_diagnosis.utils.json_stream import IncrementalObjectParser
+from AI_diagnosis.utils.metrics import FALLBACKS, LLM_TIMEOUTS, observe, sample_prompt, span
+
+logger = logging.getLogger("llm_service")
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")      # required; Resources.start() fails without it
+GROQ_MODEL   = os.getenv("GROQ_MODEL",   "qwen/qwen3-32b")
+
+T = TypeVar("T")
+
+# per LLM call, retries included; enforced inside the gateway so timeouts reach its circuit breaker
+REQUEST_TIMEOUT = float(os.getenv("LLM_DEADLINE_S", "20"))
+
+gateway = LLMGateway(api_key=GROQ_API_KEY, deadline=REQUEST_TIMEOUT)
+MULTI_MAX_TOKENS = int(os.getenv("GROQ_MULTI_MAX_TOKENS", "6144"))
+
+
+def _message_content(resp: dict) -> Optional[str]:
+    choices = (resp or {}).get("choices") or []
+    if not choices or not choices[0].get("message"):
+        return None
+    return choices[0]["message"].get("content")
+
+
+def _apply_catalogue(llm: LLMResponse, catalogue: dict) -> LLMResponse:
+    has_catalogue = bool(catalogue.get("has_catalogue", True))
+    code = catalogue.get("code")
+    desc = catalogue.get("description")
+
+    # Always ensure dtc_code is set to the actual code string
+    if code:
+        llm.dtc_code = code
+    else:
+        llm.dtc_code = llm.dtc_code or "UNKNOWN"
+
+    # Only force dtc_meaning from catalogue when we *really* have an entry
+    if has_catalogue and desc:
+        llm.dtc_meaning = desc
+    else:
+        # No catalogue entry: keep LLM's wording, or fall back to a generic label
+        if not llm.dtc_meaning:
+            llm.dtc_meaning = f"DTC {code or llm.dtc_code or 'Unknown code'}"
+
+    return llm
+
+
+# how often a json_validate_failed generation was salvaged locally instead of regenerated
+repair_stats = {"json_failures": 0, "repaired": 0, "regenerated": 0, "unrecoverable": 0}
+
+
+def _parse_single(catalogue: dict) -> Callable[[str], Optional[LLMResponse]]:
+    def parse(text: str) -> Optional[LLMResponse]:
+        try:
+            llm = LLMResponse.model_validate_json(text)
+        except ValueError:
+            llm = coerce_llm_response(repair_json(text), catalogue.get("code") or "")
+        return _apply_catalogue(llm, catalogue) if llm is not None else None
+    return parse
+
+
+def _parse_multi(catalogues: List[dict]) -> Callable[[str], Optional[MultiLLMResponse]]:
+    def parse(text: str) -> Optional[MultiLLMResponse]:
+        try:
+            return MultiLLMResponse.model_validate_json(text)
+        except ValueError:
+            pass
+        data = repair_json(text)
+        if not isinstance(data, dict):
+            return None
+        results = []
+        for position, item in enumerate(data.get("results") or []):
+            code = catalogues[position].get("code", "") if position < len(catalogues) else ""
+            llm = coerce_llm_response(item, code)
+            if llm is not None:
+                results.append(llm)
+        if not results:
+            return None
+        return MultiLLMResponse(joint_summary=str(data.get("joint_summary") or ""), results=results)
+    return parse
+
+
+async def _complete(messages: list, parse: Callable[[str], Optional[T]], max_tokens: int = 2048,
+                    deadline: Optional[float] = None) -> Optional[T]:
+    """
+    JSON-mode chat completion, parsed with `parse` (strict first, then local
+    repair). If Groq rejects the generation (json_validate_failed), the
+    rejected text it sends back is repaired locally; only when that fails
+    is the answer regenerated in text mode. Both calls together get
+    `deadline` seconds (default REQUEST_TIMEOUT).
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + (REQUEST_TIMEOUT if deadline is None else deadline)
+    try:
+        try:
+            with span("llm"):
+                resp = await gateway.chat(
+                    messages,
+                    model=GROQ_MODEL,
+                    deadline=end - loop.time(),
+                    temperature=0.0,
+                    max_tokens=max_tokens,
+                    presence_penalty=0.0,
+                    response_format={"type": "json_object"},
+                )
+        except LLMTimeout:
+            LLM_TIMEOUTS.labels("chat").inc()
+            logger.error("Groq API timed out after %s seconds", REQUEST_TIMEOUT)
+            return None
+
+        content = _message_content(resp)
+        if not content:
+            logger.warning("Empty response from Groq.")
+            return None
+        with span("validate"):
+            result = parse(content)
+        if result is None:
+            logger.error("Invalid JSON structure: %s", content[:200])
+        return result
+
+    # JSON validation error, attempt fallback
+    except LLMBadRequest as e:
+        if e.code == "json_validate_failed" or "json_validate_failed" in str(e.body):
+            repair_stats["json_failures"] += 1
+            error = e.body.get("error")
+            failed_generation = error.get("failed_generation") if isinstance(error, dict) else None
+            with span("validate"):
+                result = parse(failed_generation) if failed_generation else None
+            if result is not None:
+                repair_stats["repaired"] += 1
+                logger.info("Groq JSON generation failed, repaired locally")
+                return result
+
+            logger.warning("Groq JSON generation failed and could not be repaired, retrying in text mode...")
+            repair_stats["regenerated"] += 1
+            FALLBACKS.labels("text_mode_retry").inc()
+            try:
+                with span("fallback"):
+                    fallback = await gateway.chat(
+                        messages,
+                        model=GROQ_MODEL,
+                        deadline=end - loop.time(),
+                        temperature=0.0,
+                        max_tokens=max_tokens,
+                    )
+                with span("validate"):
+                    result = parse(_message_content(fallback) or "")
+                if result is not None:
+                    return result
+
+            except LLMTimeout:
+                LLM_TIMEOUTS.labels("chat").inc()
+                logger.error("Retry timed out after %s seconds", REQUEST_TIMEOUT)
+            except Exception as re:
+                logger.error("Retry also failed: %s", re)
+            repair_stats["unrecoverable"] += 1
+        else:
+            logger.error("Groq BadRequest (%s): %s", e.status, e.body)
+        return None
+
+    except LLMError as e:
+        # retries exhausted or circuit open
+        logger.error("Groq unavailable: %s", e)
+        return None
+
+    except Exception as e:
+        logger.exception("Unexpected error calling Groq: %s", e)
+        return None
+
+
+async def call_groq(catalogue: dict, snippets: List[str], vehicle: dict, pid: dict,
+                    deadline: Optional[float] = None) -> Optional[LLMResponse]:
+    with span("prompt"):
+        prompt = build_prompt(catalogue, snippets, vehicle, pid)
+    messages = [
+        {"role": "system", "content": prompt["system"]},
+        {"role": "user", "content": prompt["user"]}
+    ]
+    sample_prompt("single", messages)
+
+    return await _complete(messages, _parse_single(catalogue), deadline=deadline)
+
+
+async def call_groq_multi(
+    catalogues: List[dict], snippets: List[str], vehicle: dict, pid: dict
+) -> Tuple[Dict[str, LLMResponse], str]:
+    """
+    Joint diagnosis of several codes in one call. Returns the per-code
+    answers keyed by code (codes the model skipped are missing) and the
+    joint root-cause summary.
+    """
+    with span("prompt"):
+        prompt = build_multi_prompt(catalogues, snippets, vehicle, pid)
+    messages = [
+        {"role": "system", "content": prompt["system"]},
+        {"role": "user", "content": prompt["user"]}
+    ]
+    sample_prompt("multi", messages)
+    # room for one full answer per code
+    multi = await _complete(
+        messages, _parse_multi(catalogues), max_tokens=min(MULTI_MAX_TOKENS, 2048 * len(catalogues))
+    )
+    if multi is None:
+        return {}, ""
+
+    by_code = {c.get("code"): c for c in catalogues}
+    results: Dict[str, LLMResponse] = {}
+    for position, llm in enumerate(multi.results):
+        code = (llm.dtc_code or "").strip().upper()
+        if code not in by_code and position < len(catalogues):
+            # model mangled the code; fall back to the order we asked for
+            code = catalogues[position].get("code")
+        if code in by_code and code not in results:
+            results[code] = _apply_catalogue(llm, by_code[code])
+    return results, multi.joint_summary
+
+
+def _catalogue_field(key: str, value: Any, catalogue: dict) -> Any:
+    # same overrides as _apply_catalogue, applied to one streamed field
+    if key == "dtc_code" and catalogue.get("code"):
+        return catalogue["code"]
+    if key == "dtc_meaning" and catalogue.get("has_catalogue", True) and catalogue.get("description"):
+        return catalogue["description"]
+    return value
+
+
+async def stream_groq(catalogue: dict, snippets: List[str], vehicle: dict, pid: dict) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of call_groq. Yields ("field", (key, value)) for every
+    top-level LLMResponse field as soon as it is complete, then exactly one
+    ("result", LLMResponse | None). If the stream fails before any field
+    was produced, falls back to the non-streaming call_groq within what is
+    left of REQUEST_TIMEOUT, so the whole thing never takes longer.
+    """
+    with span("prompt"):
+        prompt = build_prompt(catalogue, snippets, vehicle, pid)
+    messages = [
+        {"role": "system", "content": prompt["system"]},
+        {"role": "user", "content": prompt["user"]}
+    ]
+    sample_prompt("stream", messages)
+
+    parser = IncrementalObjectParser()
+    fields = {}
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    chunks = gateway.stream_chat(
+        messages,
+        model=GROQ_MODEL,
+        deadline=REQUEST_TIMEOUT,
+        temperature=0.0,
+        max_tokens=2048,
+        presence_penalty=0.0,
+        response_format={"type": "json_object"},
+    )
+    try:
+        async for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                value = _catalogue_field(key, value, catalogue)
+                fields[key] = value
+                yield "field", (key, value)
+    except LLMTimeout:
+        LLM_TIMEOUTS.labels("stream").inc()
+        logger.error("Groq stream timed out after %s seconds", REQUEST_TIMEOUT)
+    except LLMError as e:
+        logger.warning("Groq stream failed: %s", e)
+    except Exception as e:
+        logger.exception("Unexpected error in stream_groq: %s", e)
+    finally:
+        await chunks.aclose()
+        # first request byte to last delta (or failure) of the streamed generation
+        observe("llm", loop.time() - started)
+
+    if not fields:
+        remaining = REQUEST_TIMEOUT - (loop.time() - started)
+        llm = await call_groq(catalogue, snippets, vehicle, pid, deadline=remaining) if remaining > 0 else None
+        if llm is not None:
+            for key, value in llm.model_dump().items():
+                yield "field", (key, value)
+        yield "result", llm
+        return
+
+    try:
+        with span("validate"):
+            llm = _apply_catalogue(LLMResponse.model_validate(fields), catalogue)
+    except Exception as ve:
+        # stream cut short or a field the schema rejects: keep what is usable
+        llm = coerce_llm_response(fields, catalogue.get("code") or "")
+        if llm is None:
+            logger.error("Invalid streamed JSON structure: %s", ve)
+        else:
+            llm = _apply_catalogue(llm, catalogue)
+    yield "result", llm
@@ -1,76 +1,141 @@
-from AI_diagnosis.utils.embedder import embed_text
-from AI_diagnosis.db.repositories import RedditEmbeddingRepo
-import re
-from typing import List, Dict, Any, Tuple
-class RAGService:
-    def __init__(self, session):
-        self.repo = RedditEmbeddingRepo(session)
-
-
-
-    def retrieve(self, dtc: str, query: str, top_k: int = 12) -> Tuple[str, List[Dict[str, Any]]]:
-        """
-        HYBRID STRATEGY:
-        1) First, get posts whose metadata.dtc == dtc (keyword / structured).
-        2) If fewer than top_k, call semantic similarity_search to fill the rest.
-        3) Remove duplicates by id.
-        4) Build:
-           - context_text (joined 'content' for LLM)
-           - sources [{url, subreddit, title}, ...] for the response.
-        """
-        # ---------- 1) Keyword / metadata search by DTC ----------
-        keyword_rows = self.repo.search_keyword(dtc, top_k=top_k)
-
-        rows_by_id = {}
-        for row in keyword_rows:
-            row_id = row.get("id")
-            if row_id is not None:
-                rows_by_id[row_id] = row
-            else:
-                # no id? just append using a synthetic key
-                rows_by_id[f"kw_{len(rows_by_id)}"] = row
-
-        # ---------- 2) Semantic search if we still need more ----------
-        if len(rows_by_id) < top_k:
-            embedding = embed_text(query)
-            # over-fetch so we can dedupe
-            semantic_rows = self.repo.similarity_search(embedding, top_k=top_k * 3)
-
-            for row in semantic_rows:
-                row_id = row.get("id")
-                key = row_id if row_id is not None else f"sem_{len(rows_by_id)}"
-                if key in rows_by_id:
-                    continue  # skip duplicates
-                rows_by_id[key] = row
-                if len(rows_by_id) >= top_k:
-                    break
-
-        # Final ordered list (keyword results first, then semantic)
-        final_rows: List[Dict[str, Any]] = list(rows_by_id.values())[:top_k]
-
-        # ---------- 3) Build LLM context + sources ----------
-        snippets: List[str] = []
-        sources: List[Dict[str, Any]] = []
-
-        for row in final_rows:
-            content = row.get("content", "") or ""
-            snippets.append(content)
-
-            meta = row.get("metadata") or {}
-            url = meta.get("url") or meta.get("source_url")
-            subreddit = meta.get("subreddit")
-            title = meta.get("title")
-
-            if url:
-                sources.append(
-                    {
-                        "url": url,
-                        "subreddit": subreddit,
-                        "title": title,
-                    }
-                )
-
-        context_text = "\n".join(snippets)
-        return context_text, sources
-       
-
+from AI_diagnosis.utils.embedder import aembed_text
+from AI_diagnosis.db.repositories import RedditEmbeddingRepo
+from AI_diagnosis.utils.singleflight import SingleFlight
+import os
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+# split  - keyword query, then match_reddit for the remainder, merged here
+# hybrid - one match_reddit_hybrid RPC doing both plus RRF in Postgres
+#          (needs db/sql/002_hybrid_retrieval.sql; ignored with the local vector index)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "split")
+
+_retrieval_flights = SingleFlight("retrieval")
+
+
+class RAGService:
+    def __init__(self, session):
+        self.repo = RedditEmbeddingRepo(session)
+
+    @property
+    def hybrid(self) -> bool:
+        return RETRIEVAL_MODE == "hybrid" and self.repo.index is None
+
+    async def keyword_rows(self, dtc: str, top_k: int) -> Optional[List[Dict[str, Any]]]:
+        """Step 1 on its own, for callers that overlap it with other lookups (None in hybrid mode)."""
+        if self.hybrid:
+            return None
+        return await self.repo.search_keyword(dtc, top_k=top_k)
+
+    async def retrieve(
+        self,
+        dtc: str,
+        query: str,
+        top_k: int = 12,
+        keyword_rows: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """
+        HYBRID STRATEGY:
+        1) First, get posts whose metadata.dtc == dtc (keyword / structured).
+        2) If fewer than top_k, call semantic similarity_search to fill the rest.
+        3) Remove duplicates by id.
+        4) Build:
+           - snippets (each row's 'content', best first, for the LLM prompt)
+           - sources [{url, subreddit, title}, ...] for the response.
+
+        keyword_rows can be passed in when the caller already ran step 1
+        concurrently with other lookups.
+
+        Concurrent calls for the same (dtc, query, top_k) share one retrieval.
+        """
+        return await _retrieval_flights.do(
+            (dtc.strip().upper(), query, top_k),
+            lambda: self._retrieve(dtc, query, top_k, keyword_rows),
+        )
+
+    async def _retrieve(
+        self,
+        dtc: str,
+        query: str,
+        top_k: int,
+        keyword_rows: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        rows = await self.retrieve_rows(dtc, query, top_k, keyword_rows)
+        return build_context(rows)
+
+    async def retrieve_rows(
+        self,
+        dtc: str,
+        query: str,
+        top_k: int = 12,
+        keyword_rows: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Steps 1-3 of retrieve(): the merged rows, keyword results first."""
+        if self.hybrid:
+            # keyword filter, vector search, dedupe and fusion in one round trip
+            embedding = await aembed_text(query)
+            return await self.repo.hybrid_search(dtc, embedding, top_k=top_k)
+
+        # ---------- 1) Keyword / metadata search by DTC ----------
+        if keyword_rows is None:
+            keyword_rows = await self.repo.search_keyword(dtc, top_k=top_k)
+
+        rows_by_id = {}
+        for row in keyword_rows:
+            row_id = row.get("id")
+            if row_id is not None:
+                rows_by_id[row_id] = row
+            else:
+                # no id? just append using a synthetic key
+                rows_by_id[f"kw_{len(rows_by_id)}"] = row
+
+        # ---------- 2) Semantic search if we still need more ----------
+        if len(rows_by_id) < top_k:
+            embedding = await aembed_text(query)
+            # ask only for what is missing; rows we already hold are excluded
+            semantic_rows = await self.repo.similarity_search(
+                embedding,
+                top_k=top_k - len(rows_by_id),
+                exclude_ids=list(rows_by_id),
+            )
+
+            for row in semantic_rows:
+                row_id = row.get("id")
+                key = row_id if row_id is not None else f"sem_{len(rows_by_id)}"
+                if key in rows_by_id:
+                    continue  # skip duplicates
+                rows_by_id[key] = row
+                if len(rows_by_id) >= top_k:
+                    break
+
+        # Final ordered list (keyword results first, then semantic)
+        return list(rows_by_id.values())[:top_k]
+
+
+def build_context(rows: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Step 4 of retrieve(): LLM context snippets + sources for the response."""
+    snippets: List[str] = []
+    sources: List[Dict[str, Any]] = []
+
+    for row in rows:
+        content = row.get("content", "") or ""
+        if content.strip():
+            snippets.append(content)
+
+        meta = row.get("metadata") or {}
+        url = meta.get("url") or meta.get("source_url")
+        subreddit = meta.get("subreddit")
+        title = meta.get("title")
+
+        if url:
+            sources.append(
+                {
+                    "url": url,
+                    "subreddit": subreddit,
+                    "title": title,
+                }
+            )
+
+    return snippets, sources
+       
+
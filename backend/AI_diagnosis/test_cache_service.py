@@ -0,0 +1,61 @@
+from AI_diagnosis.models.request_response import LLMResponse
+from AI_diagnosis.services.cache_service import DiagnosisCache, make_cache_key
+
+VEHICLE = {"make": "Toyota", "model": "Corolla", "year": 2012}
+
+
+def _result(code: str = "P0171") -> dict:
+    llm = LLMResponse(dtc_code=code, dtc_meaning="System too lean", summary="Lean", severity="MEDIUM")
+    return {"llm": llm, "sources": [{"url": "https://reddit.com/r/x"}], "catalogue_links": []}
+
+
+def test_sensor_jitter_maps_to_the_same_key():
+    assert make_cache_key("P0171", VEHICLE, {"rpm": 2015}) == make_cache_key("P0171", VEHICLE, {"rpm": 2020})
+    assert make_cache_key("P0171", VEHICLE, {"rpm": 2015}) != make_cache_key("P0171", VEHICLE, {"rpm": 2600})
+
+
+def test_key_ignores_case_whitespace_and_pid_order():
+    a = make_cache_key(" p0171 ", {"make": "TOYOTA ", "model": "corolla", "year": 2012}, {"rpm": 800, "MAF": 3.1})
+    b = make_cache_key("P0171", VEHICLE, {"maf": 3.1, "rpm": 800})
+    assert a == b
+    assert a != make_cache_key("P0171", {**VEHICLE, "year": 2013}, {"maf": 3.1, "rpm": 800})
+
+
+def test_disk_tier_survives_a_restart_and_promotes_to_memory(tmp_path):
+    db = str(tmp_path / "cache.db")
+    DiagnosisCache(maxsize=8, ttl=60, db_path=db).set("P0171", VEHICLE, {"rpm": 800}, _result())
+
+    fresh = DiagnosisCache(maxsize=8, ttl=60, db_path=db)
+    assert len(fresh.memory) == 0
+    hit = fresh.get("P0171", VEHICLE, {"rpm": 804})
+    assert hit["llm"].summary == "Lean" and hit["sources"] == [{"url": "https://reddit.com/r/x"}]
+    assert len(fresh.memory) == 1
+
+    fresh.disk.clear()
+    assert fresh.get("P0171", VEHICLE, {"rpm": 800}) is not None      # now served from memory
+
+
+def test_failed_generations_are_not_cached():
+    cache = DiagnosisCache(maxsize=8, ttl=60, db_path="")
+    cache.set("P0171", VEHICLE, {}, {"llm": None, "sources": []})
+    assert cache.get("P0171", VEHICLE, {}) is None
+
+
+def test_invalidate_dtc_drops_both_tiers(tmp_path):
+    cache = DiagnosisCache(maxsize=8, ttl=60, db_path=str(tmp_path / "cache.db"))
+    cache.set("P0171", VEHICLE, {"rpm": 800}, _result())
+    cache.set("P0171", VEHICLE, {"rpm": 3000}, _result())
+    cache.set("P0300", VEHICLE, {}, _result("P0300"))
+
+    assert cache.invalidate_dtc("p0171") == 4       # two memory entries + two disk rows
+    assert cache.get("P0171", VEHICLE, {"rpm": 800}) is None
+    assert cache.get("P0300", VEHICLE, {}) is not None
+
+
+def test_dtc_key_index_stays_bounded_by_the_memory_tier():
+    cache = DiagnosisCache(maxsize=4, ttl=60, db_path="")
+    for rpm in range(1000, 60000, 1000):
+        cache.set("P0171", VEHICLE, {"rpm": rpm}, _result())
+    assert len(cache._keys_by_dtc["P0171"]) <= 2 * 4
+    cache.invalidate_dtc("P0171")
+    assert len(cache.memory) == 0
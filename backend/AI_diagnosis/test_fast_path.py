@@ -0,0 +1,72 @@
+import pytest
+
+from AI_diagnosis.services.fast_path import _severity, catalogue_response
+
+
+@pytest.mark.parametrize("code, description, expected", [
+    ("P0217", "engine coolant over temperature condition", "CRITICAL"),
+    ("P0520", "engine oil pressure sensor/switch circuit", "CRITICAL"),
+    ("P0524", "engine oil pressure too low", "CRITICAL"),
+    ("P0525", "cruise control servo control circuit range/performance", "MEDIUM"),
+    ("P0526", "fan speed sensor circuit", "MEDIUM"),
+    ("P0529", "fan speed sensor circuit intermittent", "MEDIUM"),
+    ("P0301", "cylinder 1 misfire detected", "HIGH"),
+    ("P0420", "catalyst system efficiency below threshold bank 1", "MEDIUM"),
+    ("P0455", "evaporative emission system leak detected (large leak)", "LOW"),
+    ("B0001", "driver frontal stage 1 deployment control", "HIGH"),
+    ("C0035", "left front wheel speed sensor circuit", "HIGH"),
+    # no code rule: keywords decide, matched at the start of a word
+    ("P1234", "engine overheating detected", "CRITICAL"),
+    ("P1234", "low oil pressure warning", "CRITICAL"),
+    ("P1234", "random misfires under load", "HIGH"),
+    ("P1234", "brakes feel soft", "HIGH"),
+    ("P1234", "evap purge flow fault", "LOW"),
+    ("P1234", "something else entirely", "MEDIUM"),
+])
+def test_severity(code, description, expected):
+    assert _severity(code, description) == expected
+
+
+def _row(description, causes="Faulty sensor; Damaged wiring", symptoms="Check engine light"):
+    return {"code": "P1234", "description": description, "probable_causes": causes, "symptoms": symptoms}
+
+
+@pytest.mark.parametrize("description, causes, expected_location", [
+    ("System too lean bank 1", "Vacuum leak", "Vacuum hoses"),
+    ("Cylinder 2 misfire detected", "Worn spark plug", "ignition coils"),
+    ("O2 sensor circuit low voltage", "Faulty O2 sensor", "Oxygen sensors"),
+    ("EVAP system small leak", "Loose fuel cap", "fuel cap"),
+])
+def test_quick_fix_keywords(description, causes, expected_location):
+    llm = catalogue_response(_row(description, causes))
+    assert any(expected_location in fix.location_tip for fix in llm.quick_fixes)
+
+
+def test_quick_fix_lean_needs_a_word_start():
+    # "clean" contains "lean" but is no lean condition
+    llm = catalogue_response(_row("Throttle body needs a clean", "Dirty throttle body"))
+    assert not any("Vacuum hoses" in fix.location_tip for fix in llm.quick_fixes)
+
+
+def test_full_catalogue_row():
+    row = {
+        "code": "P0171",
+        "description": "System Too Lean (Bank 1)",
+        "probable_causes": "Vacuum leak; Faulty MAF sensor; Weak fuel pump; Misfire from worn spark plugs",
+        "symptoms": "Rough idle, hesitation, engine overheating under load",
+    }
+    llm = catalogue_response(row)
+    # causes and symptoms feed the quick fixes, never the severity
+    assert llm.severity == "MEDIUM"
+    assert llm.safety_advice.startswith("Usually safe")
+    assert llm.causes[0] == "Vacuum leak" and len(llm.causes) == 4
+    assert llm.effects == ["Rough idle", "hesitation", "engine overheating under load"]
+    locations = " ".join(fix.location_tip for fix in llm.quick_fixes)
+    assert "Vacuum hoses" in locations and "ignition coils" in locations
+    assert "MAF" in llm.technical_terms
+    assert llm.summary.startswith('P0171 means "System Too Lean (Bank 1)". The most common cause is vacuum leak.')
+
+
+def test_incomplete_row_has_no_fast_answer():
+    assert catalogue_response(None) is None
+    assert catalogue_response(_row("Some description", causes="")) is None
@@ -0,0 +1,59 @@
+import pytest
+
+from AI_diagnosis.utils.json_repair import coerce_llm_response, extract_json_text, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('<think>the user wants {json}</think>\n{"a": 1}', {"a": 1}),
+    ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+    ('Sure! Here it is: {"a": 1,}', {"a": 1}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    # cut off mid-way: the partial string is dropped and everything open is closed
+    ('{"summary": "Lean mixture", "causes": ["Vacuum leak", "Weak fu', {"summary": "Lean mixture", "causes": ["Vacuum leak"]}),
+    ('{"summary": "Lean mixture", "severity":', {"summary": "Lean mixture", "severity": None}),
+    ('{"a": "x \\" y", "b": "unfinished', {"a": 'x " y', "b": None}),
+    ('<think>never closed, no answer', None),
+    ('no json here', None),
+    ('', None),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+def test_extract_json_text_starts_at_the_first_brace():
+    assert extract_json_text('```json\n{"a": 1}\n```').strip() == '{"a": 1}'
+
+
+def test_coerce_fixes_severity_lists_and_quick_fixes():
+    llm = coerce_llm_response({
+        "summary": "Engine runs lean",
+        "severity": " moderate ",
+        "causes": "Vacuum leak",
+        "quick_fixes": ["Check the hoses", {"step": "Clean the MAF", "location_tip": None}, {"location_tip": "x"}],
+        "technical_terms": {"MAF": "Mass air flow sensor", "O2": ""},
+    }, dtc="P0171")
+    assert llm.dtc_code == "P0171"
+    assert llm.severity == "MEDIUM"
+    assert llm.causes == ["Vacuum leak"]
+    assert [(f.step, f.location_tip) for f in llm.quick_fixes] == [("Check the hoses", ""), ("Clean the MAF", "")]
+    assert llm.technical_terms == {"MAF": "Mass air flow sensor"}
+    assert llm.safety_advice == "No safety advice provided"
+
+
+@pytest.mark.parametrize("severity, expected", [
+    ("critical", "CRITICAL"), ("Severe", "HIGH"), ("minor", "LOW"), ("urgent", "CRITICAL"), ("whatever", "MEDIUM"), (None, "MEDIUM"),
+])
+def test_coerce_severity(severity, expected):
+    assert coerce_llm_response({"summary": "s", "severity": severity}).severity == expected
+
+
+@pytest.mark.parametrize("data", [None, [], "text", {}, {"severity": "HIGH", "effects": ["x"]}])
+def test_coerce_gives_up_without_summary_or_causes(data):
+    assert coerce_llm_response(data) is None
+
+
+def test_truncated_answer_round_trip():
+    text = '{"dtc_code": "P0301", "summary": "Cylinder 1 misfire", "severity": "HIGH", "causes": ["Worn plug", "Bad co'
+    llm = coerce_llm_response(repair_json(text))
+    assert (llm.dtc_code, llm.severity, llm.causes) == ("P0301", "HIGH", ["Worn plug"])
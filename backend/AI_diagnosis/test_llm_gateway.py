@@ -0,0 +1,178 @@
+import asyncio
+
+import httpx
+import pytest
+
+from AI_diagnosis.services import llm_gateway
+from AI_diagnosis.services.llm_gateway import CircuitBreaker, LLMBadRequest, LLMGateway, LLMTimeout, LLMUnavailable
+
+MESSAGES = [{"role": "user", "content": "P0301"}]
+OK = {"choices": [{"message": {"content": "{}"}}]}
+
+
+def _gateway(handler, **kwargs) -> LLMGateway:
+    gateway = LLMGateway(base_url="http://llm.test", api_key="test", http2=False, **kwargs)
+    gateway._client = httpx.AsyncClient(base_url="http://llm.test", transport=httpx.MockTransport(handler))
+    return gateway
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_BASE", 0.0)
+
+
+# ---------- circuit breaker ----------
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 10
+    assert breaker.state == "half_open"
+    assert breaker.allow()          # the single trial call
+    assert not breaker.allow()
+    breaker.record_failure()        # trial failed: open for another cooldown
+    assert breaker.state == "open"
+
+    now[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_backoff_honours_retry_after_and_caps_it():
+    gateway = LLMGateway(api_key="test")
+    assert gateway._backoff(0, "2") == 2.0
+    assert gateway._backoff(0, "3600") == llm_gateway.LLM_BACKOFF_MAX
+    assert 0 <= gateway._backoff(10, None) <= llm_gateway.LLM_BACKOFF_MAX
+    assert 0 <= gateway._backoff(1, "soon") <= 2 * llm_gateway.LLM_BACKOFF_BASE
+
+
+def test_client_needs_an_api_key():
+    with pytest.raises(RuntimeError, match="GROQ_API_KEY"):
+        LLMGateway(api_key="").client
+
+
+# ---------- chat ----------
+
+def test_retries_retryable_statuses_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) < 3 else 200, json=OK)
+
+    gateway = _gateway(handler)
+    assert asyncio.run(gateway.chat(MESSAGES, model="m")) == OK
+    assert len(calls) == 3 and gateway.retries == 2 and gateway.breaker.failures == 0
+
+
+def test_bad_request_is_not_retried_and_not_a_provider_failure():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": {"code": "json_validate_failed"}})
+
+    gateway = _gateway(handler)
+    with pytest.raises(LLMBadRequest) as e:
+        asyncio.run(gateway.chat(MESSAGES, model="m"))
+    assert e.value.code == "json_validate_failed"
+    assert len(calls) == 1 and gateway.breaker.failures == 0
+
+
+def test_exhausted_retries_count_one_breaker_failure():
+    gateway = _gateway(lambda request: httpx.Response(500), max_retries=2)
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(gateway.chat(MESSAGES, model="m"))
+    assert gateway.breaker.failures == 1
+
+
+def test_open_breaker_fails_fast_without_a_request():
+    calls = []
+    gateway = _gateway(lambda request: calls.append(request) or httpx.Response(200, json=OK))
+    gateway.breaker.opened_at = llm_gateway.time.monotonic()
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(gateway.chat(MESSAGES, model="m"))
+    assert not calls and gateway.rejected == 1
+
+
+def test_hanging_provider_times_out_and_counts_against_the_breaker():
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json=OK)
+
+    gateway = _gateway(handler, deadline=0.1)
+    with pytest.raises(LLMTimeout):
+        asyncio.run(gateway.chat(MESSAGES, model="m"))
+    assert gateway.breaker.failures == 1
+
+
+def test_deadline_spent_in_the_local_queue_is_not_a_provider_failure():
+    async def handler(request):
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json=OK)
+
+    async def burst():
+        gateway = _gateway(handler, max_concurrency=1)
+        results = await asyncio.gather(
+            gateway.chat(MESSAGES, model="m", deadline=1.0),
+            gateway.chat(MESSAGES, model="m", deadline=0.1),   # waits behind the first one
+            return_exceptions=True,
+        )
+        return gateway, results
+
+    gateway, (first, queued) = asyncio.run(burst())
+    assert first == OK and isinstance(queued, LLMTimeout)
+    assert gateway.breaker.failures == 0
+
+
+def test_cancelled_calls_are_not_provider_failures():
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json=OK)
+
+    async def cancel_all():
+        gateway = _gateway(handler)
+        for _ in range(gateway.breaker.threshold):
+            task = asyncio.ensure_future(gateway.chat(MESSAGES, model="m"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return gateway
+
+    gateway = asyncio.run(cancel_all())
+    assert gateway.breaker.state == "closed" and gateway.breaker.failures == 0
+
+
+# ---------- stream_chat ----------
+
+def _sse(*deltas: str) -> bytes:
+    import json
+
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': d}}]})}" for d in deltas]
+    return ("\n\n".join(lines + ["data: [DONE]"]) + "\n\n").encode()
+
+
+def test_stream_yields_deltas_and_retries_before_the_first_one():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "0"})
+        return httpx.Response(200, content=_sse("{\"a\":", " 1}"))
+
+    async def collect(gateway):
+        return [delta async for delta in gateway.stream_chat(MESSAGES, model="m")]
+
+    gateway = _gateway(handler)
+    assert asyncio.run(collect(gateway)) == ["{\"a\":", " 1}"]
+    assert len(calls) == 2 and gateway.breaker.failures == 0
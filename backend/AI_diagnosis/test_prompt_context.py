@@ -0,0 +1,70 @@
+from AI_diagnosis.prompts.context import (
+    best_sentences, compact_catalogue, dedupe_snippets, fit_snippets, query_terms,
+)
+from AI_diagnosis.prompts.template import SYSTEM_PROMPT, build_prompt
+from AI_diagnosis.utils.tokens import count_tokens
+
+LEAN = "Had P0171 on my Corolla. Turned out to be a cracked vacuum hose behind the intake. Replaced it and the code cleared."
+
+
+def test_dedupe_drops_near_copies_and_keeps_order():
+    snippets = [
+        LEAN,
+        LEAN.replace("Corolla", "Corolla!!") + " Thanks all.",      # repost with a small edit
+        "P0300 random misfire was a bad coil pack on cylinder 3.",
+        "   ",
+    ]
+    assert dedupe_snippets(snippets) == [snippets[0], snippets[2]]
+
+
+def test_dedupe_keeps_different_posts_on_the_same_code():
+    other = "P0171 again: my MAF sensor was dirty, cleaned it with MAF cleaner and the lean code went away."
+    assert dedupe_snippets([LEAN, other]) == [LEAN, other]
+
+
+def test_query_terms_skip_stopwords_and_short_words():
+    assert query_terms("P0171 System Too Lean", "", None) == {"p0171", "system", "too", "lean"}
+    assert "the" not in query_terms("the code is on the car")
+
+
+def test_best_sentences_keeps_short_text_as_is():
+    assert best_sentences(f"  {LEAN}  ", {"vacuum"}, max_tokens=1000) == LEAN
+
+
+def test_best_sentences_prefers_on_topic_sentences_in_original_order():
+    text = (
+        "I bought this car last spring from a dealer in town. "
+        "The vacuum hose was cracked. "
+        "We went camping for two weeks and it rained every single day. "
+        "A new vacuum hose fixed the lean code."
+    )
+    trimmed = best_sentences(text, {"vacuum", "hose", "lean"}, max_tokens=20)
+    assert trimmed == "The vacuum hose was cracked. … A new vacuum hose fixed the lean code."
+    assert count_tokens(trimmed) <= 25
+
+
+def test_best_sentences_hard_cuts_one_huge_sentence():
+    trimmed = best_sentences("word " * 400, {"word"}, max_tokens=10)
+    assert trimmed.endswith(" …") and len(trimmed) <= 10 * 4 + 2
+
+
+def test_fit_snippets_respects_the_budget_and_reports_counters():
+    snippets = [LEAN, LEAN, "x " * 300, "P0171 fixed by cleaning the MAF sensor."]
+    kept, stats = fit_snippets(snippets, {"vacuum", "maf"}, budget=40, per_snippet=30)
+    assert kept[0] == LEAN
+    assert sum(count_tokens(s) for s in kept) == stats["context_tokens"] <= 40
+    assert stats["snippets_in"] == 4 and stats["duplicates"] == 1
+    assert stats["snippets_out"] == len(kept)
+
+
+def test_compact_catalogue_drops_bulky_and_empty_columns():
+    row = {"id": 7, "code": "P0171", "description": "Lean", "discussions": "[a](b)", "symptoms": "", "embedding": [0.1]}
+    assert compact_catalogue(row) == {"code": "P0171", "description": "Lean"}
+
+
+def test_system_prompt_is_static_across_requests():
+    one = build_prompt({"code": "P0171", "description": "Lean"}, [LEAN], {"make": "Toyota"}, {"rpm": 800})
+    two = build_prompt({"code": "P0300", "description": "Misfire"}, [], {"make": "Honda"}, {})
+    assert one["system"] == two["system"] == SYSTEM_PROMPT
+    assert "P0171" in one["user"] and "No Reddit context retrieved." in two["user"]
+    assert one["tokens"]["system"] == count_tokens(SYSTEM_PROMPT)
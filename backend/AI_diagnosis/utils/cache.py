@@ -0,0 +1,178 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU with a per-entry time-to-live.
+    Expired entries are dropped lazily on read; the least recently
+    used entry is evicted once maxsize is reached.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        # no LRU bump and no hit/miss count: for bookkeeping, not lookups
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """
+    Persistent key/value tier backed by a single SQLite file.
+    Values are stored as JSON together with an optional tag
+    (used to invalidate every entry belonging to one DTC).
+    invalidate() also records when each key/tag was dropped, so a process
+    that loaded a value before another one's write can tell and skip
+    storing it (set_unless_invalidated).
+    """
+
+    def __init__(self, path: str, ttl: float = 86400.0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                tag TEXT,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_tag_idx ON cache(tag)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS invalidations (name TEXT PRIMARY KEY, at REAL NOT NULL)")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, tag: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, tag, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, tag, payload, expires_at),
+            )
+
+    def set_unless_invalidated(self, key: str, value: Any, since: float, tag: Optional[str] = None,
+                               ttl: Optional[float] = None) -> bool:
+        """set() unless key or tag was invalidated (by any process) at or after `since`; True if stored."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            # IMMEDIATE: no other process can invalidate between the check and the write
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = self._conn.execute(
+                    "SELECT 1 FROM invalidations WHERE name IN (?, ?) AND at >= ?", (key, tag, since)
+                ).fetchone()
+                if stale is None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, tag, value, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, tag, payload, expires_at),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return stale is None
+
+    def invalidate(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        """Delete these keys and every entry under these tags, and note when (see set_unless_invalidated)."""
+        keys, tags = list(keys), list(tags)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", ((k,) for k in keys))
+                self._conn.executemany("DELETE FROM cache WHERE tag = ?", ((t,) for t in tags))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO invalidations (name, at) VALUES (?, ?)", ((n, now) for n in keys + tags)
+                )
+                # a load still running after a whole ttl is long gone; older marks can't matter
+                self._conn.execute("DELETE FROM invalidations WHERE at < ?", (now - self.ttl,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_tag(self, tag: str) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM cache WHERE tag = ?", (tag,))
+        return cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"size": size, "hits": self.hits, "misses": self.misses}
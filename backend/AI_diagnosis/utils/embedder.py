@@ -1,12 +1,167 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-_model = None
-
-def get_embedder():
-    global _model
-    if _model is None:
-        _model = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-    return _model
-
-def embed_text(text: str) -> list[float]:
-    return get_embedder().embed_query(text)
\ No newline at end of file
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Protocol
+from AI_diagnosis.utils.cache import TTLCache
+from AI_diagnosis.utils.embedding_store import catalogue_store
+from AI_diagnosis.utils.embedding_server import EMBEDDER_SOCKET, RemoteBackend
+from AI_diagnosis.utils.metrics import timed
+from AI_diagnosis.utils.singleflight import SingleFlight
+
+logger = logging.getLogger("utils.embedder")
+
+# "sentence-transformers" (PyTorch) or "onnx" (ONNX Runtime, no torch import)
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "sentence-transformers")
+EMBEDDER_MODEL = os.getenv("EMBEDDER_MODEL", "all-MiniLM-L6-v2")
+# directory with model.onnx (or model_quantized.onnx) and tokenizer.json,
+# produced by python -m AI_diagnosis.utils.onnx_export
+EMBEDDER_ONNX_DIR = os.getenv("EMBEDDER_ONNX_DIR", "models/all-MiniLM-L6-v2-onnx")
+EMBEDDER_MAX_TOKENS = int(os.getenv("EMBEDDER_MAX_TOKENS", "256"))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# query texts are "DTC {code}: {description}", so a small LRU covers most traffic
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+_query_cache = TTLCache(maxsize=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL)
+
+# torch releases the GIL during the forward pass, so a couple of threads
+# are enough to keep embedding off the event loop.
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+_embed_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+_embed_flights = SingleFlight("embedding")
+
+
+class EmbedderBackend(Protocol):
+    name: str
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+
+class SentenceTransformerBackend:
+    """The original all-MiniLM-L6-v2 model on PyTorch (normalized output)."""
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = EMBEDDER_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, show_progress_bar=False).tolist()
+
+
+class OnnxBackend:
+    """
+    Same MiniLM graph exported to ONNX (optionally int8-quantized) and run
+    with onnxruntime + the tokenizers library: mean pooling over the
+    attention mask followed by L2 normalization, matching the
+    sentence-transformers pipeline so vectors stay comparable with the
+    ones already stored in reddit_embeddings.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir: str = EMBEDDER_ONNX_DIR, max_tokens: int = EMBEDDER_MAX_TOKENS):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._np = np
+        model_path = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, "model.onnx")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("EMBEDDER_ONNX_THREADS", "1"))
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+
+def create_backend(name: str = EMBEDDER_BACKEND) -> EmbedderBackend:
+    if name == "onnx":
+        return OnnxBackend()
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend()
+    raise ValueError(f"Unknown EMBEDDER_BACKEND: {name}")
+
+
+def get_embedder() -> EmbedderBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                # with a shared embedding server configured, workers hold no model
+                _backend = RemoteBackend(EMBEDDER_SOCKET) if EMBEDDER_SOCKET else create_backend()
+                logger.info("Embedder backend loaded: %s", _backend.name)
+    return _backend
+
+
+def warmup() -> None:
+    """Load the model and run one forward pass so the first request doesn't pay for it."""
+    catalogue_store.load()
+    get_embedder().embed_many(["DTC P0300: Random/Multiple Cylinder Misfire Detected"])
+
+
+def _lookup(text: str) -> list[float] | None:
+    vector = _query_cache.get(text)
+    if vector is None:
+        vector = catalogue_store.lookup(text)
+        if vector is not None:
+            _query_cache.set(text, vector)
+    return vector
+
+def embed_text(text: str) -> list[float]:
+    vector = _lookup(text)
+    if vector is None:
+        # unknown code / free text: run the model
+        vector = get_embedder().embed_many([text])[0]
+        _query_cache.set(text, vector)
+    return vector
+
+
+def embed_many(texts: List[str]) -> List[List[float]]:
+    """Embed a batch; cached/precomputed texts are skipped, the rest go in one forward pass."""
+    vectors: List[list[float] | None] = [_lookup(t) for t in texts]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        fresh = get_embedder().embed_many([texts[i] for i in missing])
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+            _query_cache.set(texts[i], vector)
+    return vectors
+
+
+@timed("embed")
+async def aembed_text(text: str) -> list[float]:
+    vector = _lookup(text)
+    if vector is not None:
+        return vector
+    loop = asyncio.get_running_loop()
+    return await _embed_flights.do(text, lambda: loop.run_in_executor(_embed_executor, embed_text, text))
+
+
+@timed("embed")
+async def aembed_many(texts: List[str]) -> List[List[float]]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_embed_executor, embed_many, texts)
@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+logger = logging.getLogger("utils.embedding_server")
+
+EMBEDDER_SOCKET = os.getenv("EMBEDDER_SOCKET", "")          # e.g. /tmp/vroom-embed.sock
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "4"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_CLIENT_TIMEOUT = float(os.getenv("EMBED_CLIENT_TIMEOUT", "10"))
+
+# Wire format (both directions): 4-byte big-endian length + payload.
+# request payload : JSON {"texts": [...]}
+# response payload: status byte 0 + uint32 count + uint32 dim + float32[count*dim]
+#                   status byte 1 + utf-8 error message
+_HEADER = struct.Struct(">I")
+_SHAPE = struct.Struct(">II")
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks, remaining = [], size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            raise ConnectionError("embedding server closed the connection")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class _MicroBatcher:
+    """
+    Collects embed requests for up to EMBED_BATCH_WAIT_MS (or EMBED_MAX_BATCH
+    texts) and runs them through the model in a single forward pass.
+    """
+
+    def __init__(self, backend, max_wait_ms: float = EMBED_BATCH_WAIT_MS, max_batch: int = EMBED_MAX_BATCH):
+        self.backend = backend
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self.queue: "asyncio.Queue[Tuple[List[str], asyncio.Future]]" = asyncio.Queue()
+        # one model, one inference thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-batch")
+
+    async def submit(self, texts: List[str]) -> List[List[float]]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            batch = [text for texts, _ in pending for text in texts]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.backend.embed_many, batch)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for texts, future in pending:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+
+async def _handle(batcher: _MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    import numpy as np
+
+    try:
+        while True:
+            try:
+                (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                request = json.loads(await reader.readexactly(length))
+            except asyncio.IncompleteReadError:
+                break
+            try:
+                texts = [str(t) for t in request.get("texts", [])]
+                vectors = await batcher.submit(texts) if texts else []
+                matrix = np.asarray(vectors, dtype=np.float32)
+                dim = matrix.shape[1] if matrix.ndim == 2 else 0
+                payload = b"\x00" + _SHAPE.pack(len(vectors), dim) + matrix.tobytes()
+            except Exception as e:
+                logger.exception("Embedding request failed: %s", e)
+                payload = b"\x01" + str(e).encode("utf-8")
+            writer.write(_HEADER.pack(len(payload)) + payload)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(path: str = EMBEDDER_SOCKET, backend_name: str = None) -> None:
+    from AI_diagnosis.utils.embedder import EMBEDDER_BACKEND, create_backend
+
+    backend = create_backend(backend_name or EMBEDDER_BACKEND)
+    backend.embed_many(["warmup"])
+    batcher = _MicroBatcher(backend)
+    batch_task = asyncio.create_task(batcher.run())
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(lambda r, w: _handle(batcher, r, w), path=path)
+    logger.info("Embedding server (%s) listening on %s", backend.name, path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class RemoteBackend:
+    """
+    EmbedderBackend that forwards to the shared embedding server over a
+    Unix socket. Each calling thread keeps its own persistent connection.
+    """
+    name = "remote"
+
+    def __init__(self, path: str = EMBEDDER_SOCKET, timeout: float = EMBED_CLIENT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._local.sock = sock
+        return sock
+
+    def _roundtrip(self, sock: socket.socket, body: bytes) -> bytes:
+        sock.sendall(_HEADER.pack(len(body)) + body)
+        (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+        return _recv_exact(sock, length)
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        body = json.dumps({"texts": texts}).encode("utf-8")
+        sock = getattr(self._local, "sock", None)
+        try:
+            payload = self._roundtrip(sock or self._connect(), body)
+        except (OSError, ConnectionError):
+            # stale connection (server restarted); reconnect once
+            if sock is not None:
+                sock.close()
+            payload = self._roundtrip(self._connect(), body)
+
+        if payload[:1] != b"\x00":
+            raise RuntimeError(f"embedding server error: {payload[1:].decode('utf-8', 'replace')}")
+        count, dim = _SHAPE.unpack(payload[1:1 + _SHAPE.size])
+        matrix = np.frombuffer(payload, dtype=np.float32, offset=1 + _SHAPE.size, count=count * dim)
+        return matrix.reshape(count, dim).tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared MiniLM embedding server (Unix socket)")
+    parser.add_argument("--socket", default=EMBEDDER_SOCKET or "/tmp/vroom-embed.sock")
+    parser.add_argument("--backend", default=None, help="sentence-transformers | onnx")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.socket, args.backend))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("utils.embedding_store")
+
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", ".embedding_store")
+
+
+def catalogue_query_text(row: dict) -> str:
+    """The retrieval query DiagnosisService builds for a catalogued code."""
+    return f"DTC {row['code']}: {row['description']}"
+
+
+class CatalogueEmbeddingStore:
+    """
+    Precomputed query embeddings for every DTC_Catalogue code.
+
+    Built offline (python -m AI_diagnosis.utils.embedding_store) into
+      embeddings.npy - float32 matrix, one row per query text
+      texts.json     - the query texts, same order
+    and opened with np.load(mmap_mode="r"), so loading costs no copy.
+    Entries are keyed by the full query text, which means an edited
+    catalogue description simply misses and falls back to the model.
+    """
+
+    def __init__(self, path: str = EMBED_STORE_DIR):
+        self.path = path
+        self._vectors: Optional[np.ndarray] = None
+        self._positions: Dict[str, int] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(os.path.join(self.path, "texts.json"), encoding="utf-8") as f:
+                    texts = json.load(f)
+                vectors = np.load(os.path.join(self.path, "embeddings.npy"), mmap_mode="r")
+            except FileNotFoundError:
+                logger.info("No precomputed catalogue embeddings in %s", self.path)
+                return
+            if len(texts) != vectors.shape[0]:
+                logger.error("Embedding store is inconsistent (%s texts, %s vectors)", len(texts), vectors.shape[0])
+                return
+            self._positions = {text: i for i, text in enumerate(texts)}
+            self._vectors = vectors
+            logger.info("Loaded %s precomputed catalogue embeddings", len(texts))
+
+    def lookup(self, text: str) -> Optional[List[float]]:
+        if not self._loaded:
+            self.load()
+        pos = self._positions.get(text)
+        if pos is None or self._vectors is None:
+            return None
+        return self._vectors[pos].tolist()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+
+def build_store(rows: Iterable[dict], embed_many: Callable[[List[str]], List[List[float]]],
+                path: str = EMBED_STORE_DIR, batch_size: int = 256) -> int:
+    """Embed the query text of every catalogue row and write the store files."""
+    texts = sorted({catalogue_query_text(row) for row in rows if row.get("code") and row.get("description")})
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embed_many(texts[start:start + batch_size]))
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "embeddings.npy.tmp"), "wb") as f:
+        np.save(f, np.asarray(vectors, dtype=np.float32))
+    os.replace(os.path.join(path, "embeddings.npy.tmp"), os.path.join(path, "embeddings.npy"))
+    with open(os.path.join(path, "texts.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+    os.replace(os.path.join(path, "texts.json.tmp"), os.path.join(path, "texts.json"))
+    return len(texts)
+
+
+catalogue_store = CatalogueEmbeddingStore()
+
+
+if __name__ == "__main__":
+    # offline build:  python -m AI_diagnosis.utils.embedding_store
+    from AI_diagnosis.db.catalogue_index import DTCCatalogueIndex
+    from AI_diagnosis.db.db_engine import supabase
+    from AI_diagnosis.utils.embedder import get_embedder
+
+    logging.basicConfig(level=logging.INFO)
+    catalogue_rows = DTCCatalogueIndex().fetch_rows(supabase)
+    count = build_store(catalogue_rows, get_embedder().embed_many)
+    print(f"Wrote {count} catalogue embeddings to {EMBED_STORE_DIR}")
@@ -0,0 +1,132 @@
+import json
+import re
+from typing import Any, Optional
+
+from AI_diagnosis.models.request_response import LLMResponse
+
+_THINK_RE = re.compile(r"<think>.*?(</think>|$)", re.DOTALL | re.IGNORECASE)
+_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+_SEVERITY_ALIASES = {
+    "MINOR": "LOW",
+    "MODERATE": "MEDIUM",
+    "MED": "MEDIUM",
+    "SEVERE": "HIGH",
+    "URGENT": "CRITICAL",
+}
+
+# give up after cutting back this many members from a truncated answer
+_MAX_CUTS = 64
+
+
+def extract_json_text(text: str) -> str:
+    """Drop <think> blocks and code fences; return from the first '{' on."""
+    text = _FENCE_RE.sub("", _THINK_RE.sub("", text or ""))
+    start = text.find("{")
+    return text[start:] if start != -1 else ""
+
+
+def _close(text: str) -> str:
+    """
+    Make a truncated document parseable: drop a string cut off mid-way (no
+    half words in the answer), a dangling key gets null, and every open
+    array/object is closed.
+    """
+    stack, in_string, escape, string_start = [], False, False, 0
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string, string_start = True, i
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text = text[:string_start]
+    text = text.rstrip()
+    if text.endswith(":"):
+        text += " null"      # key without a value
+    text = text.rstrip(",")
+    return _TRAILING_COMMA_RE.sub(r"\1", text + "".join(reversed(stack)))
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Best-effort parse of a model answer that is not valid JSON: think tags,
+    fences, trailing commas, and output cut off mid-way (the last partial
+    member is dropped and the open arrays/objects are closed).
+    """
+    text = extract_json_text(text)
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    for _ in range(_MAX_CUTS):
+        try:
+            return json.loads(_close(text))
+        except ValueError:
+            cut = text.rfind(",")
+            if cut <= 0:
+                return None
+            text = text[:cut]
+    return None
+
+
+def _as_list(value: Any) -> list:
+    if value is None or value == "":
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def coerce_llm_response(data: Any, dtc: str = "") -> Optional[LLMResponse]:
+    """
+    Turn a repaired (possibly incomplete) answer into an LLMResponse:
+    severity casing/aliases fixed, scalars wrapped in lists, missing keys
+    filled with defaults. Returns None when there is nothing worth showing
+    (no summary and no causes).
+    """
+    if not isinstance(data, dict):
+        return None
+    if not data.get("summary") and not data.get("causes"):
+        return None
+
+    severity = str(data.get("severity") or "").strip().upper()
+    severity = _SEVERITY_ALIASES.get(severity, severity)
+    if severity not in ("LOW", "MEDIUM", "HIGH", "CRITICAL"):
+        severity = "MEDIUM"
+
+    quick_fixes = []
+    for fix in _as_list(data.get("quick_fixes")):
+        if isinstance(fix, dict) and fix.get("step"):
+            quick_fixes.append({"step": str(fix["step"]), "location_tip": str(fix.get("location_tip") or "")})
+        elif isinstance(fix, str) and fix.strip():
+            quick_fixes.append({"step": fix, "location_tip": ""})
+
+    terms = data.get("technical_terms")
+    technical_terms = {str(k): str(v) for k, v in terms.items() if v} if isinstance(terms, dict) else {}
+
+    try:
+        return LLMResponse.model_validate({
+            "dtc_code": str(data.get("dtc_code") or dtc),
+            "dtc_meaning": str(data.get("dtc_meaning") or ""),
+            "summary": str(data.get("summary") or ""),
+            "severity": severity,
+            "causes": [str(c) for c in _as_list(data.get("causes")) if c],
+            "effects": [str(e) for e in _as_list(data.get("effects")) if e],
+            "quick_fixes": quick_fixes,
+            "safety_advice": str(data.get("safety_advice") or "No safety advice provided"),
+            "technical_terms": technical_terms,
+        })
+    except ValueError:
+        return None
@@ -0,0 +1,73 @@
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalObjectParser:
+    """
+    Feed a JSON object in arbitrary chunks; get each top-level member back
+    as soon as its value is complete.
+
+        parser = IncrementalObjectParser()
+        parser.feed('{"summary": "Lean mix')        -> []
+        parser.feed('ture", "severity": "LOW",')     -> [("summary", "Lean mixture"), ("severity", "LOW")]
+
+    Anything before the first '{' (think tags, code fences) is skipped.
+    Only the nesting depth and string/escape state are tracked, so every
+    chunk is scanned once.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = -1
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed: List[Tuple[str, Any]] = []
+        if self.done or not chunk:
+            return completed
+        self.buffer += chunk
+        buf = self.buffer
+
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buf[self._member_start:self._pos], completed)
+                    self.done = True
+                    self._pos += 1
+                    break
+            elif ch == "," and self._depth == 1:
+                self._emit(buf[self._member_start:self._pos], completed)
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return completed
+
+    @staticmethod
+    def _emit(member: str, completed: List[Tuple[str, Any]]) -> None:
+        if not member.strip():
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except ValueError:
+            return
+        completed.extend(parsed.items())
@@ -0,0 +1,21 @@
+import re
+from typing import List, Dict
+
+MD_LINK_RE = re.compile(r"\[([^\]]+)\]\((https?://[^)]+)\)")
+def parse_discussion_links(text: str) -> List[Dict[str, str]]:
+    """
+    Extracts [title](url) markdown-style links from the DTC catalogue
+    'discussion' column and returns a list of {title, url}.
+    """
+    links: List[Dict[str, str]] = []
+    if not text:
+        return links
+
+    for title, url in MD_LINK_RE.findall(text):
+        links.append(
+            {
+                "title": title.strip(),
+                "url": url.strip(),
+            }
+        )
+    return links
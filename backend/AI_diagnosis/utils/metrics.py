@@ -0,0 +1,168 @@
+import contextvars
+import functools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+
+logger = logging.getLogger("utils.metrics")
+prompt_logger = logging.getLogger("llm_service.prompts")
+
+# fraction of LLM prompts written to the "llm_service.prompts" log (0 = none, 1 = all)
+PROMPT_LOG_SAMPLE = float(os.getenv("PROMPT_LOG_SAMPLE", "0.01"))
+PROMPT_LOG_QUEUE = int(os.getenv("PROMPT_LOG_QUEUE", "1000"))
+# set by the process manager when several workers share one /metrics (prometheus_client multiprocess mode)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# stage latencies go from sub-millisecond (index lookups) to tens of seconds (LLM)
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+
+STAGE_SECONDS = Histogram(
+    "diagnosis_stage_seconds",
+    "Time spent per diagnosis stage (catalogue, keyword, embed, vector, hybrid, prompt, llm, validate, fallback)",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+CACHE_REQUESTS = Counter("diagnosis_cache_requests_total", "Diagnosis cache lookups", ["result"])
+FALLBACKS = Counter("diagnosis_fallbacks_total", "Answers that were not a validated LLM answer", ["kind"])
+LLM_TIMEOUTS = Counter("llm_timeouts_total", "LLM calls abandoned at the request deadline", ["call"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM provider", ["kind"])
+
+# per-request (stage, seconds) list read by ServerTimingMiddleware; None outside a request
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "diagnosis_timings", default=None
+)
+
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one `stage` (also around awaits; failures are timed too)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def timed(stage: str) -> Callable:
+    """Decorator form of span() for coroutine functions."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """Count the provider's `usage` block ({"prompt_tokens", "completion_tokens", ...})."""
+    if not usage:
+        return
+    LLM_TOKENS.labels("prompt").inc(usage.get("prompt_tokens") or 0)
+    LLM_TOKENS.labels("completion").inc(usage.get("completion_tokens") or 0)
+
+
+# ---------- Server-Timing ----------
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Header value: one entry per stage (durations of a repeated stage summed), plus total."""
+    by_stage: Dict[str, float] = {}
+    for stage, seconds in timings:
+        by_stage[stage] = by_stage.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in by_stage.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware buffering, so streamed
+    responses pass through untouched): collects the spans recorded while
+    handling a request and sends them in a Server-Timing header. For a
+    streamed response the header only carries what finished before the
+    first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings: List[Tuple[str, float]] = []
+        token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                value = server_timing(timings, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """Prometheus text exposition of every metric in this process (or all workers in multiprocess mode)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# ---------- sampled prompt logging ----------
+
+_prompt_queue: "queue.Queue[Tuple[str, list]]" = queue.Queue(maxsize=PROMPT_LOG_QUEUE)
+_prompt_thread: Optional[threading.Thread] = None
+_prompt_thread_lock = threading.Lock()
+prompt_log_stats = {"sampled": 0, "dropped": 0}
+
+
+def _write_prompts() -> None:
+    while True:
+        kind, messages = _prompt_queue.get()
+        for message in messages:
+            prompt_logger.info("%s %s prompt:\n%s", kind, message.get("role"), message.get("content"))
+
+
+def sample_prompt(kind: str, messages: list) -> None:
+    """
+    Log a PROMPT_LOG_SAMPLE fraction of prompts. The request only pays for
+    a random() and a queue put; formatting and I/O happen on a background
+    thread, and prompts are dropped rather than queued once it falls behind.
+    """
+    if PROMPT_LOG_SAMPLE <= 0 or random.random() >= PROMPT_LOG_SAMPLE:
+        return
+    if not prompt_logger.isEnabledFor(logging.INFO):
+        return
+    global _prompt_thread
+    if _prompt_thread is None:
+        with _prompt_thread_lock:
+            if _prompt_thread is None:
+                _prompt_thread = threading.Thread(target=_write_prompts, name="prompt-log", daemon=True)
+                _prompt_thread.start()
+    try:
+        _prompt_queue.put_nowait((kind, messages))
+        prompt_log_stats["sampled"] += 1
+    except queue.Full:
+        prompt_log_stats["dropped"] += 1
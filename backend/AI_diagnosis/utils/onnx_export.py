@@ -0,0 +1,49 @@
+"""
+Offline export of the MiniLM embedder for EMBEDDER_BACKEND=onnx.
+
+    python -m AI_diagnosis.utils.onnx_export [out_dir]
+
+Writes model.onnx, an int8 dynamically-quantized model_quantized.onnx and
+tokenizer.json. Needs torch/transformers/onnxruntime at export time only;
+the serving side just needs onnxruntime and tokenizers.
+"""
+import os
+import sys
+
+from AI_diagnosis.utils.embedder import EMBEDDER_MODEL, EMBEDDER_ONNX_DIR
+
+
+def export(out_dir: str = EMBEDDER_ONNX_DIR, model_name: str = EMBEDDER_MODEL) -> None:
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(out_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, "tokenizer.json"))
+
+    model = AutoModel.from_pretrained(repo).eval()
+    sample = tokenizer(["DTC P0171: System Too Lean (Bank 1)"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            fp32_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=17,
+        )
+    quantize_dynamic(fp32_path, os.path.join(out_dir, "model_quantized.onnx"), weight_type=QuantType.QInt8)
+    print(f"Exported {repo} to {out_dir}")
+
+
+if __name__ == "__main__":
+    export(sys.argv[1] if len(sys.argv) > 1 else EMBEDDER_ONNX_DIR)
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+logger = logging.getLogger("utils.singleflight")
+
+
+class SingleFlight:
+    """
+    Request coalescing: while a call for `key` is in flight, further calls
+    with the same key await the same result instead of starting their own.
+
+    The work runs as its own task, so a caller that disconnects (and gets
+    cancelled) does not cancel it for the others still waiting. Nothing is
+    kept once the call finishes; this is not a cache.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        _groups.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # retrieve the exception so an unobserved failure isn't logged as "never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+
+
+_groups: List[SingleFlight] = []
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    return {group.name: group.stats() for group in _groups}
@@ -0,0 +1,39 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger("utils.tokens")
+
+# tokenizer.json of the served model (e.g. Qwen3's from the HF hub); without it
+# counts are estimated at ~4 characters per token, which is close for English BPE
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            if PROMPT_TOKENIZER:
+                try:
+                    from tokenizers import Tokenizer
+
+                    _tokenizer = Tokenizer.from_file(PROMPT_TOKENIZER)
+                except Exception as e:
+                    logger.warning("Could not load tokenizer %s, estimating tokens: %s", PROMPT_TOKENIZER, e)
+            _tokenizer_loaded = True
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
@@ -0,0 +1,126 @@
+"""
+Compare embedder backends: latency, peak RSS and cosine agreement.
+
+    python -m bench.embedder_bench                       # sentence-transformers vs onnx
+    python -m bench.embedder_bench --backends onnx --n 500
+
+Each backend runs in its own subprocess so RSS numbers are not polluted by
+the other runtime. Vectors are written to a temp dir and compared in the
+parent against the first backend listed (the reference).
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SAMPLE_TEXTS = [
+    "DTC P0171: System Too Lean (Bank 1)",
+    "DTC P0174: System Too Lean (Bank 2)",
+    "DTC P0300: Random/Multiple Cylinder Misfire Detected",
+    "DTC P0301: Cylinder 1 Misfire Detected",
+    "DTC P0420: Catalyst System Efficiency Below Threshold (Bank 1)",
+    "DTC P0442: Evaporative Emission Control System Leak Detected (small leak)",
+    "DTC P0128: Coolant Thermostat (Coolant Temperature Below Thermostat Regulating Temperature)",
+    "DTC P0455: Evaporative Emission Control System Leak Detected (large leak)",
+    "DTC P0507: Idle Air Control System RPM Higher Than Expected",
+    "DTC P0700: Transmission Control System Malfunction",
+    "rough idle and check engine light after fuel cap replaced",
+    "car hesitates on acceleration, lean codes on both banks",
+]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(backend: str, n: int, batch: int, out_dir: str) -> None:
+    import numpy as np
+    from AI_diagnosis.utils.embedder import create_backend
+
+    texts = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + ("" if i < len(SAMPLE_TEXTS) else f" #{i}") for i in range(n)]
+
+    start = time.perf_counter()
+    model = create_backend(backend)
+    model.embed_many(texts[:1])
+    load_s = time.perf_counter() - start
+
+    single = []
+    for text in texts:
+        t0 = time.perf_counter()
+        model.embed_many([text])
+        single.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    vectors = []
+    for i in range(0, n, batch):
+        vectors.extend(model.embed_many(texts[i:i + batch]))
+    batch_s = time.perf_counter() - t0
+
+    np.save(os.path.join(out_dir, f"{backend}.npy"), np.asarray(vectors, dtype=np.float32))
+    stats = {
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "single_p50_ms": round(statistics.median(single), 3),
+        "single_p95_ms": round(_percentile(single, 95), 3),
+        "batch_texts_per_s": round(n / batch_s, 1),
+        "peak_rss_mb": round(_rss_mb(), 1),
+    }
+    with open(os.path.join(out_dir, f"{backend}.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="sentence-transformers,onnx")
+    parser.add_argument("--n", type=int, default=200, help="texts to embed")
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.n, args.batch, args.out)
+        return
+
+    import numpy as np
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    out_dir = tempfile.mkdtemp(prefix="embedder_bench_")
+    results = []
+    for backend in backends:
+        subprocess.run(
+            [sys.executable, "-m", "bench.embedder_bench", "--child", backend,
+             "--n", str(args.n), "--batch", str(args.batch), "--out", out_dir],
+            check=True,
+        )
+        with open(os.path.join(out_dir, f"{backend}.json"), encoding="utf-8") as f:
+            results.append(json.load(f))
+
+    reference = np.load(os.path.join(out_dir, f"{backends[0]}.npy"))
+    for stats in results:
+        vectors = np.load(os.path.join(out_dir, f"{stats['backend']}.npy"))
+        cosine = (reference * vectors).sum(axis=1)
+        stats["cosine_vs_ref_min"] = round(float(cosine.min()), 5)
+        stats["cosine_vs_ref_mean"] = round(float(cosine.mean()), 5)
+
+    columns = list(results[0].keys())
+    print("  ".join(f"{c:>20}" for c in columns))
+    for stats in results:
+        print("  ".join(f"{str(stats[c]):>20}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
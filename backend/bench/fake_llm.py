@@ -0,0 +1,154 @@
+"""
+Local stand-in for the Groq OpenAI-compatible API, for tests and benchmarks.
+
+    python -m bench.fake_llm --port 8900 --latency-ms 800 --error-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8900/openai/v1 uvicorn main:app
+
+Answers POST /openai/v1/chat/completions (and /v1/chat/completions) with a
+schema-valid LLMResponse for the DTC found in the prompt (or one per code
+plus a joint summary for multi-code prompts), as one body or as
+an SSE stream when "stream": true. Latency, 5xx/429
+rates and the rate of json_validate_failed rejections are configurable.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DTC_RE = re.compile(r"\b([PCBU]\d{3}[0-9A-Z])\b")
+
+
+class FakeLLMConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, json_fail_rate: float = 0.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.json_fail_rate = json_fail_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+
+
+def fake_diagnosis(dtc: str) -> dict:
+    return {
+        "dtc_code": dtc,
+        "dtc_meaning": f"Fake meaning for {dtc}",
+        "summary": f"{dtc} was reported by the engine computer; this is a canned benchmark answer.",
+        "severity": "MEDIUM",
+        "causes": ["Vacuum leak after the mass air flow sensor", "Dirty mass air flow sensor", "Weak fuel pump"],
+        "effects": ["Rough idle", "Check engine light on"],
+        "quick_fixes": [
+            {"step": "Check that the fuel cap clicks shut.", "location_tip": "Behind the fuel door on the side of the car."}
+        ],
+        "safety_advice": "Safe to drive short distances; have it checked soon.",
+        "technical_terms": {"MAF": "Mass air flow sensor, in the intake tube right after the air filter box."},
+    }
+
+
+def _completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 900, "completion_tokens": 350, "total_tokens": 1250},
+    }
+
+
+async def _stream(model: str, content: str, config: FakeLLMConfig, chunk_chars: int = 12):
+    # spread the remaining latency budget over the chunks, like a real token stream
+    pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+    per_chunk = (config.latency_ms / 1000.0) / max(1, len(pieces))
+    for piece in pieces:
+        chunk = {
+            "id": "chatcmpl-stream",
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        if per_chunk:
+            await asyncio.sleep(per_chunk)
+    yield "data: [DONE]\n\n"
+
+
+def create_app(config: FakeLLMConfig = None) -> FastAPI:
+    config = config or FakeLLMConfig()
+    app = FastAPI(title="Fake Groq")
+    app.state.config = config
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        config.requests += 1
+        delay = config.latency_ms + config.random.uniform(0, config.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000.0)
+
+        roll = config.random.random()
+        if roll < config.error_rate:
+            return JSONResponse({"error": {"message": "upstream exploded", "type": "server_error"}}, status_code=503)
+        roll -= config.error_rate
+        if roll < config.rate_limit_rate:
+            return JSONResponse({"error": {"message": "rate limited", "type": "rate_limit"}},
+                                status_code=429, headers={"retry-after": "0.05"})
+
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+        system = " ".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system")
+        if "joint_summary" in system:
+            # multi-code prompt: the codes are listed on its first line
+            codes = list(dict.fromkeys(DTC_RE.findall(prompt.splitlines()[0] if prompt else ""))) or ["P0000"]
+            content = json.dumps({
+                "joint_summary": f"{', '.join(codes)} most likely share one root cause (canned benchmark answer).",
+                "results": [fake_diagnosis(code) for code in codes],
+            })
+        else:
+            match = DTC_RE.search(prompt)
+            content = json.dumps(fake_diagnosis(match.group(1) if match else "P0000"))
+
+        wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+        if wants_json and config.random.random() < config.json_fail_rate:
+            return JSONResponse(
+                {"error": {"message": "Failed to generate JSON", "type": "invalid_request_error",
+                           "code": "json_validate_failed", "failed_generation": content[: len(content) // 2]}},
+                status_code=400,
+            )
+        if body.get("stream"):
+            return StreamingResponse(_stream(body.get("model", "fake"), content, config),
+                                     media_type="text/event-stream")
+        return _completion(body.get("model", "fake"), content)
+
+    app.add_api_route("/openai/v1/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/stats", lambda: {"requests": config.requests}, methods=["GET"])
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--json-fail-rate", type=float, default=0.0, help="fraction of json_validate_failed")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(args.latency_ms, args.jitter_ms, args.error_rate,
+                           args.rate_limit_rate, args.json_fail_rate, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""
+Local stand-in for the Supabase REST API (PostgREST), for tests and benchmarks.
+
+    python -m bench.fake_supabase --port 8901 --latency-ms 15
+    SUPABASE_URL=http://127.0.0.1:8901 SUPABASE_ANON_KEY=bench.bench.bench uvicorn main:app
+
+Serves /rest/v1/{table} (GET/POST/PATCH/DELETE with the filters, select
+lists, JSON paths, order/limit/offset and upsert the backend uses) and the
+match_reddit / match_reddit_hybrid RPCs from in-memory fixtures:
+
+    DTC_Catalogue      a few dozen common codes
+    reddit_embeddings  synthetic posts with seeded random unit vectors
+    user, vehicles     bench users (password "benchpass") with vehicles
+    diagnosis_history  empty, filled by the app
+
+--fixtures DIR loads {table}.json files instead of the generated rows.
+"""
+import argparse
+import asyncio
+import json
+import operator
+import os
+import random
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+BENCH_PASSWORD = "benchpass"
+EMBEDDING_DIM = 384
+
+CATALOGUE = [
+    ("P0101", "Mass Air Flow Circuit Range/Performance", "Dirty MAF sensor; intake leak; clogged air filter", "Hesitation; poor fuel economy"),
+    ("P0113", "Intake Air Temperature Sensor Circuit High", "Unplugged IAT sensor; open circuit", "Hard starting; check engine light"),
+    ("P0128", "Coolant Thermostat Below Regulating Temperature", "Thermostat stuck open; faulty coolant temp sensor", "Slow warm-up; weak heater"),
+    ("P0171", "System Too Lean (Bank 1)", "Vacuum leak; dirty MAF sensor; weak fuel pump", "Rough idle; hesitation"),
+    ("P0172", "System Too Rich (Bank 1)", "Leaking injector; faulty O2 sensor; high fuel pressure", "Black smoke; fuel smell"),
+    ("P0174", "System Too Lean (Bank 2)", "Vacuum leak; dirty MAF sensor; clogged fuel filter", "Rough idle; misfires"),
+    ("P0300", "Random/Multiple Cylinder Misfire Detected", "Worn spark plugs; bad ignition coil; vacuum leak", "Shaking; flashing check engine light"),
+    ("P0301", "Cylinder 1 Misfire Detected", "Bad spark plug; bad ignition coil; injector fault", "Rough idle; loss of power"),
+    ("P0302", "Cylinder 2 Misfire Detected", "Bad spark plug; bad ignition coil; low compression", "Rough idle; loss of power"),
+    ("P0335", "Crankshaft Position Sensor A Circuit", "Failed crank sensor; damaged wiring", "Stalling; no start"),
+    ("P0401", "Exhaust Gas Recirculation Flow Insufficient", "Clogged EGR passages; stuck EGR valve", "Pinging; failed emissions"),
+    ("P0420", "Catalyst System Efficiency Below Threshold (Bank 1)", "Worn catalytic converter; faulty O2 sensor; exhaust leak", "Failed emissions; sulfur smell"),
+    ("P0430", "Catalyst System Efficiency Below Threshold (Bank 2)", "Worn catalytic converter; faulty O2 sensor", "Failed emissions"),
+    ("P0440", "Evaporative Emission System Malfunction", "Loose fuel cap; cracked EVAP hose", "Fuel smell"),
+    ("P0442", "Evaporative Emission System Leak Detected (small leak)", "Loose fuel cap; cracked EVAP hose; purge valve", "Fuel smell"),
+    ("P0455", "Evaporative Emission System Leak Detected (large leak)", "Missing fuel cap; disconnected EVAP hose", "Fuel smell"),
+    ("P0456", "Evaporative Emission System Leak Detected (very small leak)", "Fuel cap seal; EVAP hose pinhole", "None"),
+    ("P0500", "Vehicle Speed Sensor Malfunction", "Failed speed sensor; wiring fault", "Erratic speedometer; harsh shifts"),
+    ("P0505", "Idle Air Control System Malfunction", "Dirty throttle body; faulty IAC valve", "Unstable idle; stalling"),
+    ("P0507", "Idle Air Control System RPM Higher Than Expected", "Vacuum leak; dirty throttle body", "High idle"),
+    ("P0562", "System Voltage Low", "Weak battery; failing alternator; corroded terminals", "Dim lights; hard starting"),
+    ("P0700", "Transmission Control System Malfunction", "TCM fault stored; wiring fault", "Harsh shifts; limp mode"),
+    ("P0715", "Input/Turbine Speed Sensor Circuit", "Failed speed sensor; low fluid", "Harsh shifts"),
+    ("P0741", "Torque Converter Clutch Circuit Performance", "Worn torque converter clutch; low fluid", "Shudder; poor fuel economy"),
+    ("P1128", "Closed Loop Fueling Not Achieved", "Faulty O2 sensor; vacuum leak", "Rough idle"),
+    ("C0035", "Left Front Wheel Speed Sensor Circuit", "Damaged wheel speed sensor; wiring fault", "ABS light on"),
+    ("B0001", "Driver Frontal Stage 1 Deployment Control", "Clock spring fault; connector under seat", "Airbag light on"),
+    ("U0100", "Lost Communication With ECM/PCM A", "CAN bus wiring; weak battery; failed ECM", "No start; multiple warning lights"),
+]
+
+_SUBREDDITS = ["MechanicAdvice", "Cartalk", "AskMechanics", "Toyota", "Honda"]
+_POST_TEMPLATES = [
+    "Got {code} on my {car}. Turned out to be {cause}. Fixed it for cheap and the light stayed off.",
+    "{code} keeps coming back after clearing it. Shop says {cause}, anyone had the same on a {car}?",
+    "Had {code} and {symptom}. Checked everything, in the end it was {cause}.",
+    "My {car} threw {code} last week. Mechanic replaced parts twice before finding {cause}.",
+]
+_CARS = ["2012 Civic", "2015 Corolla", "2009 Camry", "2017 Accord", "2011 F-150", "2014 Golf"]
+
+
+def _row_id(kind: str, key: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"vroom-bench/{kind}/{key}"))
+
+
+def bench_user(index: int) -> Dict[str, str]:
+    """Credentials and id of generated bench user `index` (for load generators)."""
+    email = f"bench{index}@example.com"
+    return {"id": _row_id("user", email), "email": email, "password": BENCH_PASSWORD}
+
+
+def build_fixtures(users: int = 100, posts: int = 2000, seed: int = 7) -> Dict[str, List[dict]]:
+    from passlib.context import CryptContext
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).isoformat()
+    catalogue = [
+        {"code": code, "description": desc, "probable_causes": causes, "symptoms": symptoms,
+         "solutions": "Inspect the listed causes in order, cheapest first.",
+         "discussions": f"[{code} thread](https://www.reddit.com/r/MechanicAdvice/{code.lower()})"}
+        for code, desc, causes, symptoms in CATALOGUE
+    ]
+
+    vectors = np.random.default_rng(seed).standard_normal((posts, EMBEDDING_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    embeddings = []
+    for i in range(posts):
+        code, _, causes, symptoms = CATALOGUE[i % len(CATALOGUE)]
+        content = rng.choice(_POST_TEMPLATES).format(
+            code=code, car=rng.choice(_CARS), cause=rng.choice(causes.split("; ")).lower(),
+            symptom=symptoms.split("; ")[0].lower(),
+        )
+        embeddings.append({
+            "id": i + 1,
+            "content": content,
+            "metadata": {"dtc": code, "subreddit": rng.choice(_SUBREDDITS), "title": f"{code} help",
+                         "url": f"https://www.reddit.com/r/bench/comments/{i + 1}"},
+            "embedding": vectors[i].tolist(),
+        })
+
+    # one bcrypt hash shared by every bench user: same cost as a real one, computed once
+    password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+    user_rows, vehicles = [], []
+    for i in range(users):
+        user = bench_user(i)
+        user_rows.append({"id": user["id"], "name": f"Bench User {i}", "email": user["email"],
+                          "password_hash": password_hash, "created_at": now})
+        for j in range(3):
+            vehicles.append({
+                "id": _row_id("vehicle", f"{i}/{j}"), "user_id": user["id"], "make": "Toyota",
+                "model": rng.choice(["Corolla", "Camry", "Yaris"]), "variant": None,
+                "year": 2008 + rng.randrange(15), "vin": None, "is_primary": j == 0, "created_at": now,
+            })
+
+    return {"DTC_Catalogue": catalogue, "reddit_embeddings": embeddings, "user": user_rows,
+            "vehicles": vehicles, "diagnosis_history": []}
+
+
+# ---------- PostgREST query subset ----------
+
+_JSON_PATH_RE = re.compile(r"(->>?)")
+
+
+def _path_value(row: dict, path: str) -> Any:
+    """Value of a column or JSON path (col->key->0->>leaf)."""
+    parts = _JSON_PATH_RE.split(path.strip())
+    value = row.get(parts[0].strip())
+    as_text = False
+    for i in range(1, len(parts), 2):
+        key, as_text = parts[i + 1].strip(), parts[i] == "->>"
+        if isinstance(value, list) and key.lstrip("-").isdigit():
+            index = int(key)
+            value = value[index] if -len(value) <= index < len(value) else None
+        elif isinstance(value, dict):
+            value = value.get(key)
+        else:
+            value = None
+    if as_text and value is not None and not isinstance(value, str):
+        value = json.dumps(value) if isinstance(value, (dict, list)) else str(value).lower() if isinstance(value, bool) else str(value)
+    return value
+
+
+def _literal(arg: str, like: Any) -> Any:
+    arg = arg.strip()
+    if len(arg) >= 2 and arg[0] == arg[-1] == '"':
+        arg = arg[1:-1]
+    if isinstance(like, bool):
+        return arg.lower() == "true"
+    if isinstance(like, (int, float)):
+        try:
+            return type(like)(arg)
+        except ValueError:
+            return arg
+    return arg
+
+
+def _split_top(text: str) -> List[str]:
+    """Split on commas outside parentheses and double quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+_COMPARE = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt,
+            "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def _check(row: dict, column: str, expr: str) -> bool:
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, arg = expr.partition(".")
+    value = _path_value(row, column)
+    if op in _COMPARE:
+        if value is None:
+            result = False
+        else:
+            try:
+                result = _COMPARE[op](value, _literal(arg, value))
+            except TypeError:
+                result = _COMPARE[op](str(value), arg)
+    elif op == "in":
+        result = value is not None and value in {_literal(a, value) for a in _split_top(arg.strip("()"))}
+    elif op in ("like", "ilike"):
+        pattern = "^" + ".*".join(re.escape(p) for p in re.split(r"[*%]", arg)) + "$"
+        result = value is not None and re.match(pattern, str(value), re.IGNORECASE if op == "ilike" else 0) is not None
+    elif op == "is":
+        result = (value is None) if arg == "null" else (value is (arg == "true"))
+    else:
+        raise ValueError(f"unsupported operator {op!r}")
+    return result != negate
+
+
+def _logic(row: dict, kind: str, body: str) -> bool:
+    results = []
+    for term in _split_top(body.strip()[1:-1]):
+        if term.startswith(("and(", "or(")):
+            name, _, rest = term.partition("(")
+            results.append(_logic(row, name, "(" + rest))
+        else:
+            column, _, expr = term.partition(".")
+            results.append(_check(row, column, expr))
+    return all(results) if kind == "and" else any(results)
+
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _filter(rows: List[dict], params: List[Tuple[str, str]]) -> List[dict]:
+    for key, value in params:
+        if key in _RESERVED:
+            continue
+        if key in ("or", "and"):
+            rows = [r for r in rows if _logic(r, key, value)]
+        else:
+            rows = [r for r in rows if _check(r, key, value)]
+    return rows
+
+
+def _project(rows: List[dict], select: Optional[str]) -> List[dict]:
+    if not select or select.strip() == "*":
+        return rows
+    columns = []
+    for item in _split_top(select):
+        alias, _, path = item.rpartition(":") if ":" in item else ("", "", item)
+        name = alias.strip() or _JSON_PATH_RE.split(path)[-1].strip()
+        columns.append((name, path.strip()))
+    return [{name: _path_value(row, path) for name, path in columns} for row in rows]
+
+
+def _order(rows: List[dict], order: Optional[str]) -> List[dict]:
+    if not order:
+        return rows
+    for term in reversed(order.split(",")):
+        column, *mods = term.strip().split(".")
+        desc = "desc" in mods
+        present = [r for r in rows if _path_value(r, column) is not None]
+        missing = [r for r in rows if _path_value(r, column) is None]
+        present.sort(key=lambda r: _path_value(r, column), reverse=desc)
+        rows = present + missing
+    return rows
+
+
+class FakeStore:
+    def __init__(self, tables: Dict[str, List[dict]]):
+        self.tables = tables
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._matrix: Optional[np.ndarray] = None
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) != len(self.tables.get("reddit_embeddings", [])):
+            rows = self.tables.get("reddit_embeddings", [])
+            vectors = [r["embedding"] if not isinstance(r["embedding"], str) else json.loads(r["embedding"])
+                       for r in rows]
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True) if len(rows) else 1.0
+            self._matrix = matrix / np.clip(norms, 1e-12, None)
+        return self._matrix
+
+    def nearest(self, embedding: Any, count: int,
+                where: Optional[Callable[[dict], bool]] = None) -> List[Tuple[dict, float]]:
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        matrix = self.matrix()
+        if not len(matrix):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query
+        rows = self.tables["reddit_embeddings"]
+        order = np.argsort(-scores)
+        if where is not None:
+            order = [i for i in order if where(rows[i])]
+        top = order[:count]
+        return [(rows[i], float(scores[i])) for i in top]
+
+
+def _slim(row: dict) -> dict:
+    return {"id": row.get("id"), "content": row.get("content"), "metadata": row.get("metadata")}
+
+
+def create_app(store: FakeStore = None, latency_ms: float = 0.0) -> FastAPI:
+    store = store or FakeStore(build_fixtures())
+    app = FastAPI(title="Fake Supabase")
+    app.state.store = store
+
+    async def _delay():
+        store.requests += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000.0)
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        await _delay()
+        params = list(request.query_params.multi_items())
+        query = dict(params)
+        rows = _order(_filter(store.tables.get(table, []), params), query.get("order"))
+        offset = int(query.get("offset", 0))
+        if "limit" in query:
+            rows = rows[offset:offset + int(query["limit"])]
+        else:
+            rows = rows[offset:]
+        return _project(rows, query.get("select"))
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        await _delay()
+        body = await request.json()
+        new_rows = body if isinstance(body, list) else [body]
+        prefer = request.headers.get("prefer", "")
+        conflict = [c.strip() for c in (request.query_params.get("on_conflict") or "id").split(",")]
+        now = datetime.now(timezone.utc).isoformat()
+        with store.lock:
+            rows = store.tables.setdefault(table, [])
+            written = []
+            for new in new_rows:
+                new = dict(new)
+                if "id" not in new:
+                    new["id"] = max((r["id"] for r in rows if isinstance(r.get("id"), int)), default=0) + 1
+                new.setdefault("created_at", now)
+                existing = None
+                if "merge-duplicates" in prefer or "ignore-duplicates" in prefer:
+                    key = tuple(new.get(c) for c in conflict)
+                    existing = next((r for r in rows if tuple(r.get(c) for c in conflict) == key), None)
+                if existing is not None:
+                    if "merge-duplicates" in prefer:
+                        existing.update(new)
+                    written.append(existing)
+                else:
+                    rows.append(new)
+                    written.append(new)
+        if "return=minimal" in prefer:
+            return Response(status_code=201)
+        return JSONResponse(written, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        await _delay()
+        changes = await request.json()
+        with store.lock:
+            rows = _filter(store.tables.get(table, []), list(request.query_params.multi_items()))
+            for row in rows:
+                row.update(changes)
+        return rows
+
+    @app.delete("/rest/v1/{table}")
+    async def delete(table: str, request: Request):
+        await _delay()
+        with store.lock:
+            rows = store.tables.get(table, [])
+            doomed = _filter(rows, list(request.query_params.multi_items()))
+            ids = {id(r) for r in doomed}
+            store.tables[table] = [r for r in rows if id(r) not in ids]
+        if "return=minimal" in request.headers.get("prefer", ""):
+            return Response(status_code=204)
+        return doomed
+
+    @app.post("/rest/v1/rpc/match_reddit")
+    async def match_reddit(request: Request):
+        await _delay()
+        body = await request.json()
+        return [{**_slim(row), "similarity": score}
+                for row, score in store.nearest(body["query_embedding"], int(body.get("match_count", 5)))]
+
+    @app.post("/rest/v1/rpc/match_reddit_hybrid")
+    async def match_reddit_hybrid(request: Request):
+        # same fusion as db/sql/002_hybrid_retrieval.sql
+        await _delay()
+        body = await request.json()
+        count, rrf_k = int(body.get("match_count", 5)), int(body.get("rrf_k", 60))
+        # both branches ranked by vector distance, match_count rows each
+        dtc = body.get("dtc")
+        keyword = [row for row, _ in store.nearest(body["query_embedding"], count,
+                                                   where=lambda r: (r.get("metadata") or {}).get("dtc") == dtc)]
+        semantic = [row for row, _ in store.nearest(body["query_embedding"], count)]
+        scores: Dict[Any, float] = {}
+        by_id = {}
+        for ranked in (keyword, semantic):
+            for rank, row in enumerate(ranked, start=1):
+                scores[row["id"]] = scores.get(row["id"], 0.0) + 1.0 / (rrf_k + rank)
+                by_id[row["id"]] = row
+        best = sorted(scores, key=lambda i: (-scores[i], i))[:count]
+        out = []
+        for row_id in best:
+            row, meta = by_id[row_id], by_id[row_id].get("metadata") or {}
+            out.append({"id": row_id, "content": row.get("content"), "score": scores[row_id],
+                        "metadata": {"url": meta.get("url") or meta.get("source_url"),
+                                     "subreddit": meta.get("subreddit"), "title": meta.get("title")}})
+        return out
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": store.requests, "tables": {t: len(rows) for t, rows in store.tables.items()}}
+
+    return app
+
+
+def load_fixtures(path: str) -> Dict[str, List[dict]]:
+    tables = {}
+    for name in os.listdir(path):
+        if name.endswith(".json"):
+            with open(os.path.join(path, name), encoding="utf-8") as f:
+                tables[name[:-5]] = json.load(f)
+    return tables
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="added to every request (network + Postgres)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--fixtures", help="directory of {table}.json files to serve instead")
+    args = parser.parse_args()
+
+    tables = load_fixtures(args.fixtures) if args.fixtures else build_fixtures(args.users, args.posts, args.seed)
+    uvicorn.run(create_app(FakeStore(tables), args.latency_ms), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
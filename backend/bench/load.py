@@ -0,0 +1,334 @@
+"""
+Open-loop load test of the backend app against local Supabase/Groq stand-ins.
+
+    python -m bench.load                                  # 30s, default mix
+    python -m bench.load --rps diagnose=10,login=5,vehicles=50 --duration 60 --out after.json
+    python -m bench.load --baseline before.json           # print the change vs a saved run
+    python -m bench.load --target http://127.0.0.1:8000   # an app you started yourself
+
+Without --target it starts bench.fake_supabase, bench.fake_llm and
+`uvicorn main:app` as subprocesses on local ports, so everything runs
+offline (the embedder model must already be on disk: the Hugging Face
+cache, or EMBEDDER_BACKEND=onnx with an exported model).
+
+Requests are sent on a fixed schedule per scenario, whether or not earlier
+ones have finished, and latency is measured from the scheduled send time,
+so a stalled server shows up in the percentiles instead of slowing the
+generator down. Reports p50/p95/p99/max, throughput and errors per
+scenario plus the app's RSS (start, peak, end).
+
+The local app runs with AUTH_REQUIRED on and diagnose/vehicles requests
+carry a bearer token signed with --jwt-secret (pass the app's
+AUTH_JWT_SECRET when using --target), so token checks are measured too.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import jwt
+
+from bench.fake_supabase import CATALOGUE, bench_user
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RPS = "diagnose=5,login=5,vehicles=20"
+BENCH_JWT_SECRET = "bench-only-jwt-secret-0123456789abcdef"
+
+_VEHICLES = [
+    {"make": "Toyota", "model": "Corolla", "year": 2015},
+    {"make": "Honda", "model": "Civic", "year": 2012},
+    {"make": "Ford", "model": "F-150", "year": 2011},
+]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Current resident set size of a process (Linux /proc, else ps)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        out = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True, check=True)
+        return int(out.stdout.strip()) / 1024
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------- scenarios ----------
+
+def bench_token(user_id: str, secret: str, ttl: int = 24 * 3600) -> str:
+    """An access token as /auth/login issues it (utils/access_tokens.py), minted without the bcrypt round."""
+    now = int(time.time())
+    return jwt.encode({"sub": user_id, "jti": f"bench-{user_id}", "iat": now, "exp": now + ttl}, secret, algorithm="HS256")
+
+
+def make_scenarios(users: int, unique: bool, seed: int,
+                   jwt_secret: str = BENCH_JWT_SECRET) -> Dict[str, Callable[[int], Tuple[str, str, dict]]]:
+    """name -> fn(i) returning (method, path, kwargs for httpx) for the i-th request."""
+    rng = random.Random(seed)
+    codes = [code for code, *_ in CATALOGUE]
+    auth = [{"Authorization": f"Bearer {bench_token(bench_user(u)['id'], jwt_secret)}"} for u in range(users)]
+
+    def diagnose(i: int):
+        # a handful of rpm values per code gives a realistic cache hit rate; --unique makes every call a miss
+        rpm = 800 + i if unique else rng.choice((800, 2000, 3000))
+        body = {"dtc": codes[i % len(codes)], "vehicle": {**_VEHICLES[i % len(_VEHICLES)], "pid_snapshot": {"rpm": rpm}}}
+        return "POST", "/AI_diagnosis/dtc_diagnose", {"json": body, "headers": auth[i % users]}
+
+    def login(i: int):
+        user = bench_user(i % users)
+        return "POST", "/auth/login", {"json": {"email": user["email"], "password": user["password"]}}
+
+    def vehicles(i: int):
+        return "GET", "/vehicles/", {"params": {"user_id": bench_user(i % users)["id"]}, "headers": auth[i % users]}
+
+    return {"diagnose": diagnose, "login": login, "vehicles": vehicles}
+
+
+async def _drive(client: httpx.AsyncClient, name: str, build, rps: float, duration: float,
+                 warmup: float, max_in_flight: int, results: dict) -> None:
+    loop = asyncio.get_running_loop()
+    stats = results[name] = {"latencies": [], "errors": 0, "statuses": {}, "skipped": 0, "sent": 0}
+    in_flight = 0
+    tasks = []
+
+    async def one(i: int, scheduled: float):
+        nonlocal in_flight
+        method, path, kwargs = build(i)
+        try:
+            resp = await client.request(method, path, **kwargs)
+            status = str(resp.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finally:
+            in_flight -= 1
+        elapsed = loop.time() - scheduled
+        if scheduled - start < warmup:
+            return
+        stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+        if status.isdigit() and int(status) < 400:
+            stats["latencies"].append(elapsed)
+        else:
+            stats["errors"] += 1
+
+    start = loop.time()
+    total = int((warmup + duration) * rps)
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if in_flight >= max_in_flight:
+            # the generator, not the server, would become the bottleneck
+            stats["skipped"] += 1
+            continue
+        in_flight += 1
+        stats["sent"] += 1
+        tasks.append(asyncio.ensure_future(one(i, scheduled)))
+    await asyncio.gather(*tasks)
+
+
+async def run_load(target: str, rps: Dict[str, float], duration: float, warmup: float,
+                   users: int, unique: bool, max_in_flight: int, pid: Optional[int], seed: int,
+                   jwt_secret: str = BENCH_JWT_SECRET) -> dict:
+    scenarios = make_scenarios(users, unique, seed, jwt_secret)
+    results: dict = {}
+    rss = {"start": rss_mb(pid) if pid else None, "peak": None, "end": None}
+    done = asyncio.Event()
+
+    async def sample_rss():
+        while not done.is_set():
+            value = rss_mb(pid)
+            if value is not None:
+                rss["peak"] = max(rss["peak"] or 0.0, value)
+            try:
+                await asyncio.wait_for(done.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=target, timeout=60.0, limits=limits) as client:
+        sampler = asyncio.ensure_future(sample_rss()) if pid else None
+        await asyncio.gather(*(
+            _drive(client, name, scenarios[name], value, duration, warmup, max_in_flight, results)
+            for name, value in rps.items() if value > 0
+        ))
+        done.set()
+        if sampler is not None:
+            await sampler
+    rss["end"] = rss_mb(pid) if pid else None
+
+    report = {"target": target, "duration_s": duration, "warmup_s": warmup, "rps": rps,
+              "rss_mb": rss, "scenarios": {}}
+    for name, stats in results.items():
+        lat = stats["latencies"]
+        report["scenarios"][name] = {
+            "sent": stats["sent"],
+            "ok": len(lat),
+            "errors": stats["errors"],
+            "skipped": stats["skipped"],
+            "statuses": stats["statuses"],
+            "throughput_rps": len(lat) / duration,
+            **({f"p{p}_ms": _percentile(lat, p) * 1000 for p in (50, 95, 99)} if lat else {}),
+            "max_ms": max(lat) * 1000 if lat else None,
+        }
+    return report
+
+
+# ---------- local stack ----------
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def start_stack(args) -> Tuple[str, int, List[subprocess.Popen]]:
+    """fake Supabase + fake Groq + the app; returns (app url, app pid, processes)."""
+    py = sys.executable
+    procs = []
+    supabase_url = f"http://127.0.0.1:{args.supabase_port}"
+    llm_url = f"http://127.0.0.1:{args.llm_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    try:
+        procs.append(subprocess.Popen(
+            [py, "-m", "bench.fake_supabase", "--port", str(args.supabase_port),
+             "--latency-ms", str(args.db_latency_ms), "--users", str(args.users)],
+            cwd=BACKEND_DIR))
+        _wait_ready(f"{supabase_url}/stats", procs[-1])
+        procs.append(subprocess.Popen(
+            [py, "-m", "bench.fake_llm", "--port", str(args.llm_port), "--latency-ms", str(args.llm_latency_ms),
+             "--jitter-ms", str(args.llm_jitter_ms), "--error-rate", str(args.llm_error_rate), "--seed", "1"],
+            cwd=BACKEND_DIR))
+        _wait_ready(f"{llm_url}/stats", procs[-1])
+
+        env = {
+            **os.environ,
+            "SUPABASE_URL": supabase_url,
+            "SUPABASE_ANON_KEY": "bench.bench.bench",
+            "GROQ_BASE_URL": f"{llm_url}/openai/v1",
+            "GROQ_API_KEY": "bench",
+            "AUTH_JWT_SECRET": args.jwt_secret,
+            "AUTH_REQUIRED": "true",
+            "HF_HUB_OFFLINE": os.environ.get("HF_HUB_OFFLINE", "1"),
+        }
+        procs.append(subprocess.Popen(
+            [py, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning",
+             "--workers", str(args.workers)],
+            cwd=BACKEND_DIR, env=env))
+        _wait_ready(f"{app_url}/", procs[-1])
+    except Exception:
+        stop_stack(procs)
+        raise
+    return app_url, procs[-1].pid, procs
+
+
+def stop_stack(procs: List[subprocess.Popen]) -> None:
+    for proc in reversed(procs):
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ---------- output ----------
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    print(f"{'scenario':<10} {'ok':>6} {'err':>5} {'skip':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in report["scenarios"].items():
+        cells = [f"{s.get(k):9.1f}" if s.get(k) is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:<10} {s['ok']:>6} {s['errors']:>5} {s['skipped']:>5} {s['throughput_rps']:>8.1f} {' '.join(cells)}")
+        base = (baseline or {}).get("scenarios", {}).get(name)
+        if base:
+            deltas = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if base.get(key) and s.get(key) is not None:
+                    deltas.append(f"{key} {100 * (s[key] - base[key]) / base[key]:+.1f}%")
+            print(f"{'':<10} vs baseline: {', '.join(deltas)}")
+    rss = report["rss_mb"]
+    if rss.get("peak") is not None:
+        print(f"app RSS MB: start {rss['start']:.0f}, peak {rss['peak']:.0f}, end {rss['end']:.0f}")
+
+
+def _parse_rps(text: str) -> Dict[str, float]:
+    rps = {}
+    for part in text.split(","):
+        name, _, value = part.partition("=")
+        rps[name.strip()] = float(value)
+    return rps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="base URL of a running app (skips starting the local stack)")
+    parser.add_argument("--pid", type=int, help="app process id for RSS when using --target")
+    parser.add_argument("--rps", default=DEFAULT_RPS, help=f"requests/s per scenario (default {DEFAULT_RPS})")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds sent but not measured")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--unique", action="store_true", help="never repeat a diagnosis request (no cache hits)")
+    parser.add_argument("--max-in-flight", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--jwt-secret", default=BENCH_JWT_SECRET, help="AUTH_JWT_SECRET the bench tokens are signed with")
+    parser.add_argument("--out", help="write the report as JSON")
+    parser.add_argument("--baseline", help="report JSON from an earlier run to compare against")
+    stack = parser.add_argument_group("local stack")
+    stack.add_argument("--app-port", type=int, default=8800)
+    stack.add_argument("--supabase-port", type=int, default=8801)
+    stack.add_argument("--llm-port", type=int, default=8802)
+    stack.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    stack.add_argument("--db-latency-ms", type=float, default=10.0)
+    stack.add_argument("--llm-latency-ms", type=float, default=800.0)
+    stack.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    stack.add_argument("--llm-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    procs: List[subprocess.Popen] = []
+    if args.target:
+        target, pid = args.target.rstrip("/"), args.pid
+    else:
+        target, pid, procs = start_stack(args)
+    try:
+        report = asyncio.run(run_load(target, _parse_rps(args.rps), args.duration, args.warmup,
+                                      args.users, args.unique, args.max_in_flight, pid, args.seed,
+                                      args.jwt_secret))
+    finally:
+        stop_stack(procs)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
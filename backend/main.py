@@ -1,33 +1,70 @@
-from fastapi import FastAPI
-
-from routes import auth, vehicles, scans, livekit_auth
-from dotenv import load_dotenv
-load_dotenv()
-
-
-from AI_diagnosis.api.router import router as ai_diagnosis_router
-
-
-app = FastAPI(title="VROOM Backend API")
-
-from fastapi.middleware.cors import CORSMiddleware
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.get("/")
-def root():
-    return 10
-
-
-app.include_router(auth.router)
-app.include_router(vehicles.router)
-app.include_router(scans.router)
-app.include_router(ai_diagnosis_router)
-app.include_router(livekit_auth.router)
+from dotenv import load_dotenv
+# the only load_dotenv: modules read their settings from os.environ at import
+load_dotenv()
+
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import Depends, FastAPI
+
+from routes import auth, vehicles, scans, livekit_auth
+from utils.access_tokens import optional_user, revocation_list
+from utils.db import supabase
+from utils.passwords import password_hasher
+
+
+from AI_diagnosis.api.router import router as ai_diagnosis_router, vehicle_access
+from AI_diagnosis.api.health import router as health_router
+from AI_diagnosis.api.metrics import router as metrics_router
+from AI_diagnosis.lifecycle import lifespan
+from AI_diagnosis.utils.metrics import ServerTimingMiddleware
+
+
+@asynccontextmanager
+async def app_lifespan(app: FastAPI):
+    # bcrypt worker processes and the token revocation list live alongside
+    # the AI_diagnosis resources; the list loads in the background like their warmup
+    password_hasher.start()
+    try:
+        async with lifespan(app):
+            loading = asyncio.ensure_future(revocation_list.start(supabase))
+            try:
+                yield
+            finally:
+                loading.cancel()
+                with suppress(asyncio.CancelledError):
+                    await loading
+                await revocation_list.stop()
+    finally:
+        password_hasher.close()
+
+
+app = FastAPI(title="VROOM Backend API", lifespan=app_lifespan)
+
+from fastapi.middleware.cors import CORSMiddleware
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag"],
+)
+app.add_middleware(ServerTimingMiddleware)
+
+
+@app.get("/")
+def root():
+    return 10
+
+
+app.include_router(auth.router)
+app.include_router(vehicles.router)
+app.include_router(scans.router)
+# AI_diagnosis knows nothing about accounts; the token and ownership checks are added here
+app.include_router(ai_diagnosis_router, dependencies=[Depends(optional_user)])
+app.dependency_overrides[vehicle_access] = vehicles.vehicle_access
+app.include_router(livekit_auth.router)
+app.include_router(metrics_router)
+app.include_router(health_router)
@@ -1,61 +1,89 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, EmailStr
-from utils.auth import signup_user, login_user,update_user, delete_user,get_user_by_id
-from utils.db import supabase
-router = APIRouter(prefix="/auth", tags=["auth"])
-
-class AuthSignupRequest(BaseModel):
-    email: EmailStr
-    password: str
-    name:str
-
-class AuthLoginRequest(BaseModel):
-    email: EmailStr
-    password: str
-
-class AuthUpdateRequest(BaseModel):
-    name: str | None = None
-    email: EmailStr | None = None
-
-
-@router.post("/signup")
-def signup(request: AuthSignupRequest):
-    result = signup_user(request.email, request.password,request.name)
-    if not result["success"]:
-        raise HTTPException(status_code=400, detail=result["error"])
-    return {"message": "Signup successful", "user": result["user"]}
-
-@router.post("/login")
-def login(request: AuthLoginRequest):
-    result = login_user(request.email, request.password)
-    if not result["success"]:
-        raise HTTPException(status_code=401, detail=result["error"])
-    return {"message": "Login successful", "session": result["session"]}
-
-
-
-
-@router.put("/update/{user_id}")
-def update(user_id: str, request: AuthUpdateRequest):
-    result = update_user(user_id, request.name, request.email)
-    if not result["success"]:
-        raise HTTPException(status_code=400, detail=result["error"])
-    return result
-
-
-@router.delete("/delete/{user_id}")
-def delete(user_id: str):
-    result = delete_user(user_id)
-    if not result["success"]:
-        raise HTTPException(status_code=400, detail=result["error"])
-    return result
-
-@router.get("/user/{user_id}")
-def get_user(user_id: str):
-    result = get_user_by_id(user_id)
-    if not result["success"]:
-        raise HTTPException(status_code=404, detail=result["error"])
-    return result["user"]
-
-
-
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from pydantic import BaseModel, EmailStr
+from utils.auth import signup_user, login_user,update_user, delete_user,get_user_by_id
+from utils.passwords import PasswordHasherBusy
+from utils.access_tokens import check_owner, optional_user, require_user, revocation_list
+from utils.etag import etag_matches, not_modified, set_etag
+from utils.db import supabase
+router = APIRouter(prefix="/auth", tags=["auth"])
+
+class AuthSignupRequest(BaseModel):
+    email: EmailStr
+    password: str
+    name:str
+
+class AuthLoginRequest(BaseModel):
+    email: EmailStr
+    password: str
+
+class AuthUpdateRequest(BaseModel):
+    name: str | None = None
+    email: EmailStr | None = None
+
+
+def _busy() -> HTTPException:
+    # password hashing is saturated: shed the request instead of queueing it
+    return HTTPException(status_code=503, detail="Too many sign-ins, try again shortly", headers={"Retry-After": "1"})
+
+
+@router.post("/signup")
+async def signup(request: AuthSignupRequest):
+    try:
+        result = await signup_user(request.email, request.password,request.name)
+    except PasswordHasherBusy:
+        raise _busy()
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return {"message": "Signup successful", "user": result["user"]}
+
+@router.post("/login")
+async def login(request: AuthLoginRequest):
+    try:
+        result = await login_user(request.email, request.password)
+    except PasswordHasherBusy:
+        raise _busy()
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["error"])
+    return {"message": "Login successful", "session": result["session"]}
+
+
+@router.post("/logout")
+async def logout(claims: dict = Depends(require_user)):
+    # the token stays signed and unexpired, so it has to be listed as revoked
+    await revocation_list.revoke(supabase, claims)
+    return {"message": "Logout successful"}
+
+
+
+
+@router.put("/update/{user_id}")
+def update(user_id: str, request: AuthUpdateRequest, claims: dict | None = Depends(optional_user)):
+    check_owner(claims, user_id)
+    result = update_user(user_id, request.name, request.email)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@router.delete("/delete/{user_id}")
+def delete(user_id: str, claims: dict | None = Depends(optional_user)):
+    check_owner(claims, user_id)
+    result = delete_user(user_id)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/user/{user_id}")
+def get_user(user_id: str, response: Response, claims: dict | None = Depends(optional_user),
+             if_none_match: str | None = Header(None)):
+    check_owner(claims, user_id)
+    result = get_user_by_id(user_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["error"])
+    if etag_matches(if_none_match, result["etag"]):
+        return not_modified(result["etag"])
+    set_etag(response, result["etag"])
+    return result["user"]
+
+
+
@@ -1,40 +1,40 @@
-import os
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from livekit import api
-from dotenv import load_dotenv
-
-load_dotenv()
-
-router = APIRouter(prefix="/livekit", tags=["livekit"])
-
-LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
-LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
-LIVEKIT_URL = os.getenv("LIVEKIT_URL")
-
-class TokenRequest(BaseModel):
-    room_name: str
-    participant_name: str
-
-@router.post("/token")
-async def get_token(req: TokenRequest):
-    if not LIVEKIT_API_KEY or not LIVEKIT_API_SECRET:
-        raise HTTPException(status_code=500, detail="LiveKit credentials not configured")
-
-    try:
-        token = api.AccessToken(LIVEKIT_API_KEY, LIVEKIT_API_SECRET) \
-            .with_identity(req.participant_name) \
-            .with_name(req.participant_name) \
-            .with_grants(api.VideoGrants(
-                room_join=True,
-                room=req.room_name,
-            ))
-        
-        jwt_token = token.to_jwt()
-        
-        return {
-            "token": jwt_token,
-            "url": LIVEKIT_URL
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from utils.access_tokens import optional_user
+
+router = APIRouter(prefix="/livekit", tags=["livekit"], dependencies=[Depends(optional_user)])
+
+LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
+LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+
+class TokenRequest(BaseModel):
+    room_name: str
+    participant_name: str
+
+@router.post("/token")
+async def get_token(req: TokenRequest):
+    if not LIVEKIT_API_KEY or not LIVEKIT_API_SECRET:
+        raise HTTPException(status_code=500, detail="LiveKit credentials not configured")
+
+    try:
+        # livekit pulls in its protobuf bindings; only pay for them when a token is issued
+        from livekit import api
+
+        token = api.AccessToken(LIVEKIT_API_KEY, LIVEKIT_API_SECRET) \
+            .with_identity(req.participant_name) \
+            .with_name(req.participant_name) \
+            .with_grants(api.VideoGrants(
+                room_join=True,
+                room=req.room_name,
+            ))
+        
+        jwt_token = token.to_jwt()
+        
+        return {
+            "token": jwt_token,
+            "url": LIVEKIT_URL
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,7 @@
-from fastapi import APIRouter
-router = APIRouter(prefix="/scans", tags=["scans"])
-
-@router.get("/")
-def scans_index():
-    return {"message": "Scans route working"}
-
+from fastapi import APIRouter
+router = APIRouter(prefix="/scans", tags=["scans"])
+
+@router.get("/")
+def scans_index():
+    return {"message": "Scans route working"}
+
@@ -1,147 +1,206 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
-from utils.db import supabase
-import uuid
-
-router = APIRouter(prefix="/vehicles", tags=["vehicles"])
-
-
-
-
-class VehicleCreateRequest(BaseModel):
-    user_id: str
-    make: str
-    model: str
-    variant: str | None = None
-    year: int
-    vin: str | None = None
-    is_primary: bool | None = False
-
-
-class VehicleUpdateRequest(BaseModel):
-    make: str | None = None
-    model: str | None = None
-    variant: str | None = None
-    year: int | None = None
-    vin: str | None = None
-    is_primary: bool | None = None
-
-
-
-
-@router.post("/")
-def create_vehicle(request: VehicleCreateRequest):
-    try:
-        new_vehicle = {
-            "id": str(uuid.uuid4()),
-            "user_id": request.user_id,
-            "make": request.make,
-            "model": request.model,
-            "variant": getattr(request, "variant", None),
-            "year": request.year,
-            "vin": request.vin,
-            "is_primary": getattr(request, "is_primary", None),
-        }
-
-        response = supabase.table("vehicles").insert(new_vehicle).execute()
-
-       
-        if not response.data:
-            raise Exception("Vehicle insert failed (no data returned).")
-
-        return {"success": True, "vehicle": response.data[0]}
-
-    except Exception as e:
-        print(" Create vehicle error:", e)
-        raise HTTPException(status_code=400, detail=str(e))
-
-@router.get("/")
-def get_vehicles(
-    user_id: str = Query(..., description="User ID to fetch vehicles for"),
-    limit: int = Query(50, ge=1),
-    offset: int = Query(0, ge=0),
-):
-    try:
-        response = (
-            supabase.table("vehicles")
-            .select("*")
-            .eq("user_id", user_id)
-            .range(offset, offset + limit - 1)
-            .execute()
-        )
-
-        # check if data exists
-        if not response.data:
-            return {"success": True, "vehicles": []}
-
-        return {"success": True, "vehicles": response.data}
-
-    except Exception as e:
-        print(" Get vehicles error:", e)
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-@router.get("/{vehicle_id}")
-def get_vehicle(vehicle_id: str):
-    try:
-        response = (
-            supabase.table("vehicles")
-            .select("*")
-            .eq("id", vehicle_id)
-            .execute()
-        )
-
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Vehicle not found")
-
-        return {"success": True, "vehicle": response.data[0]}
-
-    except Exception as e:
-        print(" Get vehicle error:", e)
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-
-@router.put("/{vehicle_id}")
-def update_vehicle(vehicle_id: str, request: VehicleUpdateRequest):
-    try:
-        update_data = request.model_dump(exclude_none=True)
-        if not update_data:
-            raise HTTPException(status_code=400, detail="No fields to update")
-
-        response = (
-            supabase.table("vehicles")
-            .update(update_data)
-            .eq("id", vehicle_id)
-            .execute()
-        )
-
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Vehicle not found or not updated")
-
-        return {"success": True, "vehicle": response.data[0]}
-
-    except Exception as e:
-        print("Update vehicle error:", e)
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-
-@router.delete("/{vehicle_id}")
-def delete_vehicle(vehicle_id: str):
-    try:
-        response = (
-            supabase.table("vehicles")
-            .delete()
-            .eq("id", vehicle_id)
-            .execute()
-        )
-
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Vehicle not found")
-
-        return {"success": True, "message": "Vehicle deleted successfully"}
-
-    except Exception as e:
-        print(" Delete vehicle error:", e)
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from pydantic import BaseModel
+from AI_diagnosis.db.db_engine import run_io
+from utils.db import supabase
+from utils.access_tokens import check_owner, optional_user
+from utils.cache import VEHICLE_COLUMNS, record_cache, vehicle_key, vehicle_list_key, vehicle_list_tag
+from utils.etag import etag_matches, not_modified, set_etag
+import uuid
+
+router = APIRouter(prefix="/vehicles", tags=["vehicles"], dependencies=[Depends(optional_user)])
+
+
+
+
+class VehicleCreateRequest(BaseModel):
+    user_id: str
+    make: str
+    model: str
+    variant: str | None = None
+    year: int
+    vin: str | None = None
+    is_primary: bool | None = False
+
+
+class VehicleUpdateRequest(BaseModel):
+    make: str | None = None
+    model: str | None = None
+    variant: str | None = None
+    year: int | None = None
+    vin: str | None = None
+    is_primary: bool | None = None
+
+
+
+
+@router.post("/")
+def create_vehicle(request: VehicleCreateRequest, claims: dict | None = Depends(optional_user)):
+    check_owner(claims, request.user_id)
+    try:
+        new_vehicle = {
+            "id": str(uuid.uuid4()),
+            "user_id": request.user_id,
+            "make": request.make,
+            "model": request.model,
+            "variant": getattr(request, "variant", None),
+            "year": request.year,
+            "vin": request.vin,
+            "is_primary": getattr(request, "is_primary", None),
+        }
+
+        response = supabase.table("vehicles").insert(new_vehicle).execute()
+
+       
+        if not response.data:
+            raise Exception("Vehicle insert failed (no data returned).")
+        record_cache.invalidate(tags=[vehicle_list_tag(request.user_id)])
+
+        return {"success": True, "vehicle": response.data[0]}
+
+    except Exception as e:
+        print(" Create vehicle error:", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/")
+def get_vehicles(
+    response: Response,
+    user_id: str = Query(..., description="User ID to fetch vehicles for"),
+    limit: int = Query(50, ge=1),
+    offset: int = Query(0, ge=0),
+    claims: dict | None = Depends(optional_user),
+    if_none_match: str | None = Header(None),
+):
+    check_owner(claims, user_id)
+
+    def load():
+        response = (
+            supabase.table("vehicles")
+            .select(VEHICLE_COLUMNS)
+            .eq("user_id", user_id)
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return response.data or []
+
+    try:
+        entry = record_cache.get_or_load(
+            "vehicles", vehicle_list_key(user_id, offset, limit), load, tag=vehicle_list_tag(user_id)
+        )
+        if etag_matches(if_none_match, entry["etag"]):
+            return not_modified(entry["etag"])
+        set_etag(response, entry["etag"])
+        return {"success": True, "vehicles": entry["data"]}
+
+    except Exception as e:
+        print(" Get vehicles error:", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _cached_vehicle(vehicle_id: str):
+    """Cache entry of the vehicle row ({"data", "etag"}), None if there is no such vehicle."""
+    try:
+        uuid.UUID(vehicle_id)
+    except ValueError:
+        return None     # not an id we could have issued; don't send it to Postgres
+
+    def load():
+        response = (
+            supabase.table("vehicles")
+            .select(VEHICLE_COLUMNS)
+            .eq("id", vehicle_id)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    # tagged with the owner's garage, so deleting the user drops it as well
+    return record_cache.get_or_load(
+        "vehicle", vehicle_key(vehicle_id), load, tag=lambda row: vehicle_list_tag(row["user_id"])
+    )
+
+
+def _owned_vehicle(vehicle_id: str, claims: dict | None):
+    entry = _cached_vehicle(vehicle_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    check_owner(claims, entry["data"]["user_id"])
+    return entry
+
+
+def vehicle_access(claims: dict | None = Depends(optional_user)):
+    """Ownership check for the AI_diagnosis history routes (installed in main.py)."""
+    async def check(vehicle_id: str) -> None:
+        if claims is not None:
+            await run_io(_owned_vehicle, vehicle_id, claims)
+    return check
+
+
+@router.get("/{vehicle_id}")
+def get_vehicle(vehicle_id: str, response: Response, claims: dict | None = Depends(optional_user),
+                if_none_match: str | None = Header(None)):
+    try:
+        entry = _owned_vehicle(vehicle_id, claims)
+        if etag_matches(if_none_match, entry["etag"]):
+            return not_modified(entry["etag"])
+        set_etag(response, entry["etag"])
+
+        return {"success": True, "vehicle": entry["data"]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(" Get vehicle error:", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+
+@router.put("/{vehicle_id}")
+def update_vehicle(vehicle_id: str, request: VehicleUpdateRequest, claims: dict | None = Depends(optional_user)):
+    try:
+        update_data = request.model_dump(exclude_none=True)
+        if not update_data:
+            raise HTTPException(status_code=400, detail="No fields to update")
+        _owned_vehicle(vehicle_id, claims)
+
+        response = (
+            supabase.table("vehicles")
+            .update(update_data)
+            .eq("id", vehicle_id)
+            .execute()
+        )
+
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Vehicle not found or not updated")
+        record_cache.invalidate(keys=[vehicle_key(vehicle_id)], tags=[vehicle_list_tag(response.data[0]["user_id"])])
+
+        return {"success": True, "vehicle": response.data[0]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Update vehicle error:", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+
+@router.delete("/{vehicle_id}")
+def delete_vehicle(vehicle_id: str, claims: dict | None = Depends(optional_user)):
+    try:
+        _owned_vehicle(vehicle_id, claims)
+        response = (
+            supabase.table("vehicles")
+            .delete()
+            .eq("id", vehicle_id)
+            .execute()
+        )
+
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+        record_cache.invalidate(keys=[vehicle_key(vehicle_id)], tags=[vehicle_list_tag(response.data[0]["user_id"])])
+
+        return {"success": True, "message": "Vehicle deleted successfully"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(" Delete vehicle error:", e)
+        raise HTTPException(status_code=400, detail=str(e))
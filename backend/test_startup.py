@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+# Cold `import main` must stay well under a second so new pods can take
+# traffic straight away; models and indexes load in the lifespan instead.
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "1.0"))
+
+HEAVY_MODULES = [
+    "torch", "sentence_transformers", "transformers", "onnxruntime",
+    "langchain", "groq", "sqlalchemy", "supabase", "livekit",
+]
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _import_main():
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("SUPABASE_", "GROQ_", "LIVEKIT_"))}
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_import_main_within_budget():
+    result = _import_main()
+    assert result["seconds"] < IMPORT_BUDGET_S, f"import main took {result['seconds']:.2f}s"
+
+
+def test_import_main_defers_heavy_modules():
+    modules = set(_import_main()["modules"])
+    loaded = [name for name in HEAVY_MODULES if name in modules]
+    assert not loaded, f"imported at startup: {loaded}"
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional, Set, Tuple
+
+import jwt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from AI_diagnosis.db.db_engine import run_io
+from AI_diagnosis.utils.cache import TTLCache
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("utils.access_tokens")
+
+AUTH_JWT_SECRET = os.getenv("AUTH_JWT_SECRET", "")
+AUTH_JWT_ALGORITHM = os.getenv("AUTH_JWT_ALGORITHM", "HS256")
+AUTH_TOKEN_TTL_S = int(os.getenv("AUTH_TOKEN_TTL_S", "3600"))
+# off: requests without a (valid) token still go through, so clients can move over first
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "false").lower() in ("1", "true", "yes")
+AUTH_CLAIMS_CACHE_SIZE = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "10000"))
+AUTH_REVOCATION_REFRESH_S = float(os.getenv("AUTH_REVOCATION_REFRESH_S", "60"))
+REVOKED_TABLE = "revoked_tokens"
+
+if not AUTH_JWT_SECRET:
+    if AUTH_REQUIRED:
+        # each worker would sign with its own secret and refuse the others' tokens
+        raise RuntimeError("AUTH_REQUIRED is on but AUTH_JWT_SECRET is not set")
+    # tokens then only verify in the process that issued them
+    logger.warning("AUTH_JWT_SECRET is not set; using a random per-process secret")
+    AUTH_JWT_SECRET = secrets.token_urlsafe(32)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def issue_token(user_id: str, ttl: int = AUTH_TOKEN_TTL_S, secret: Optional[str] = None) -> Tuple[str, int]:
+    """Signed access token for user_id; returns (token, seconds until it expires)."""
+    now = int(time.time())
+    claims = {"sub": user_id, "jti": uuid.uuid4().hex, "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, secret or AUTH_JWT_SECRET, algorithm=AUTH_JWT_ALGORITHM), ttl
+
+
+class RevocationList:
+    """
+    jti of every revoked, not yet expired token, mirrored from the
+    revoked_tokens table every AUTH_REVOCATION_REFRESH_S seconds. Tokens
+    revoked by this process are added locally at once; other workers see
+    them after their next refresh.
+    """
+
+    def __init__(self, refresh_interval: float = AUTH_REVOCATION_REFRESH_S):
+        self.refresh_interval = refresh_interval
+        self._jtis: Set[str] = set()
+        self._client: Optional["Client"] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._jtis
+
+    def fetch_jtis(self, client: "Client") -> Set[str]:
+        now = datetime.now(timezone.utc).isoformat()
+        resp = client.table(REVOKED_TABLE).select("jti").gt("expires_at", now).execute()
+        return {row["jti"] for row in resp.data or []}
+
+    async def refresh(self) -> None:
+        if self._client is None:
+            raise RuntimeError("RevocationList.start() has not been called")
+        self._jtis = await run_io(self.fetch_jtis, self._client)
+
+    async def revoke(self, client: "Client", claims: dict) -> None:
+        self._jtis.add(claims["jti"])
+        row = {
+            "jti": claims["jti"],
+            "user_id": claims["sub"],
+            "expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc).isoformat(),
+        }
+        await run_io(client.table(REVOKED_TABLE).upsert(row).execute)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Revocation list refresh failed: %s", e)
+
+    async def start(self, client: "Client") -> None:
+        self._client = client
+        try:
+            await self.refresh()
+        except Exception as e:
+            # not fatal: tokens revoked by this process are still refused
+            logger.error("Initial revocation list load failed: %s", e)
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class TokenVerifier:
+    """
+    Checks access tokens in-process: signature and expiry once per token
+    (the decoded claims are cached until the token expires), then a set
+    lookup against the revocation list on every call.
+    """
+
+    def __init__(self, revoked: RevocationList, cache_size: int = AUTH_CLAIMS_CACHE_SIZE):
+        self.revoked = revoked
+        self._claims = TTLCache(maxsize=cache_size, ttl=AUTH_TOKEN_TTL_S)
+
+    def verify(self, token: str) -> dict:
+        claims = self._claims.get(token)
+        if claims is None:
+            try:
+                claims = jwt.decode(
+                    token, AUTH_JWT_SECRET, algorithms=[AUTH_JWT_ALGORITHM], options={"require": ["exp", "sub", "jti"]}
+                )
+            except jwt.PyJWTError as e:
+                raise InvalidToken(str(e))
+            self._claims.set(token, claims, ttl=claims["exp"] - time.time())
+        elif claims["exp"] <= time.time():
+            raise InvalidToken("Signature has expired")
+        if claims["jti"] in self.revoked:
+            raise InvalidToken("Token has been revoked")
+        return claims
+
+
+revocation_list = RevocationList()
+token_verifier = TokenVerifier(revocation_list)
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+async def optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[dict]:
+    """Claims of a valid bearer token, else None (or 401 when AUTH_REQUIRED is on)."""
+    if credentials is None:
+        if AUTH_REQUIRED:
+            raise _unauthorized("Not authenticated")
+        return None
+    try:
+        return token_verifier.verify(credentials.credentials)
+    except InvalidToken as e:
+        if not AUTH_REQUIRED:
+            return None
+        raise _unauthorized(f"Invalid token: {e}")
+
+
+async def require_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> dict:
+    """Claims of a valid bearer token; 401 otherwise, whatever AUTH_REQUIRED says."""
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    try:
+        return token_verifier.verify(credentials.credentials)
+    except InvalidToken as e:
+        raise _unauthorized(f"Invalid token: {e}")
+
+
+def check_owner(claims: Optional[dict], user_id: str) -> None:
+    """403 when an authenticated caller asks for another user's data."""
+    if claims is not None and claims["sub"] != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed for this user")
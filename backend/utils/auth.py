@@ -1,89 +1,122 @@
-from utils.db import supabase
-from passlib.context import CryptContext
-import uuid
-from datetime import datetime
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def signup_user(email: str, password: str, name: str):
-    try:
-        
-        existing = supabase.table("user").select("*").eq("email", email).execute()
-        if existing.data:
-            return {"success": False, "error": "User already exists"}
-
-        hashed_password = pwd_context.hash(password)
-        new_user = {
-            "id": str(uuid.uuid4()),  # generate UUID manually to avoid NOT NULL issue
-            "name": name,
-            "email": email,
-            "password_hash": hashed_password,
-            "created_at": datetime.utcnow().isoformat()
-        }
-
-        supabase.table("user").insert(new_user).execute()
-        return {"success": True, "user": new_user}
-
-    except Exception as e:
-        print(" Signup error:", e)
-        return {"success": False, "error": str(e)}
-
-
-
-def login_user(email: str, password: str):
-    try:
-        user = supabase.table("user").select("*").eq("email", email).execute()
-        if not user.data:
-            return {"success": False, "error": "Invalid email or password"}
-
-        user = user.data[0]
-        if not pwd_context.verify(password, user["password_hash"]):
-            return {"success": False, "error": "Invalid email or password"}
-
-   
-        session = {
-            "token": str(uuid.uuid4()),
-            "user_id": user["id"]
-        }
-
-        return {"success": True, "session": session}
-    except Exception as e:
-        print(" Login error:", e)
-        return {"success": False, "error": str(e)}
-
-
-
-def update_user(user_id: str, name: str = None, email: str = None):
-    try:
-        update_data = {}
-        if name:
-            update_data["name"] = name
-        if email:
-            update_data["email"] = email
-        if not update_data:
-            return {"success": False, "error": "No fields to update"}
-
-        supabase.table("user").update(update_data).eq("id", user_id).execute()
-        return {"success": True, "message": "User updated successfully"}
-    except Exception as e:
-        print(" Update error:", e)
-        return {"success": False, "error": str(e)}
-
-
-def delete_user(user_id: str):
-    try:
-        supabase.table("user").delete().eq("id", user_id).execute()
-        return {"success": True, "message": "User deleted successfully"}
-    except Exception as e:
-        print(" Delete error:", e)
-        return {"success": False, "error": str(e)}
-    
-def get_user_by_id(user_id: str):
-    try:
-        response = supabase.table("user").select("*").eq("id", user_id).execute()
-        if not response.data:
-            return {"success": False, "error": "User not found"}
-        return {"success": True, "user": response.data[0]}
-    except Exception as e:
-        print(" Get user by ID error:", e)
+from utils.db import supabase
+from utils.passwords import PasswordHasherBusy, password_hasher
+from utils.access_tokens import issue_token
+from utils.cache import USER_COLUMNS, record_cache, user_key, vehicle_list_tag
+from AI_diagnosis.db.db_engine import run_io
+import asyncio
+import uuid
+from datetime import datetime
+
+# strong refs to background rehash tasks (the loop only keeps weak ones)
+_rehash_tasks = set()
+
+async def signup_user(email: str, password: str, name: str):
+    try:
+        
+        existing = await run_io(supabase.table("user").select("id").eq("email", email).execute)
+        if existing.data:
+            return {"success": False, "error": "User already exists"}
+
+        hashed_password = await password_hasher.hash(password)
+        new_user = {
+            "id": str(uuid.uuid4()),  # generate UUID manually to avoid NOT NULL issue
+            "name": name,
+            "email": email,
+            "password_hash": hashed_password,
+            "created_at": datetime.utcnow().isoformat()
+        }
+
+        await run_io(supabase.table("user").insert(new_user).execute)
+        return {"success": True, "user": new_user}
+
+    except PasswordHasherBusy:
+        raise
+    except Exception as e:
+        print(" Signup error:", e)
+        return {"success": False, "error": str(e)}
+
+
+
+async def _rehash(user_id: str, password: str):
+    try:
+        password_hash = await password_hasher.hash(password)
+        await run_io(supabase.table("user").update({"password_hash": password_hash}).eq("id", user_id).execute)
+    except Exception as e:
+        # best effort: the old hash still verifies, the next login tries again
+        print(" Rehash error:", e)
+
+
+async def login_user(email: str, password: str):
+    try:
+        user = await run_io(supabase.table("user").select("id,password_hash").eq("email", email).execute)
+        if not user.data:
+            return {"success": False, "error": "Invalid email or password"}
+
+        user = user.data[0]
+        if not await password_hasher.verify(password, user["password_hash"]):
+            return {"success": False, "error": "Invalid email or password"}
+
+        # stored with an old cost factor: upgrade it without delaying this login
+        if password_hasher.needs_update(user["password_hash"]):
+            task = asyncio.create_task(_rehash(user["id"], password))
+            _rehash_tasks.add(task)
+            task.add_done_callback(_rehash_tasks.discard)
+
+   
+        token, expires_in = issue_token(user["id"])
+        session = {
+            "token": token,
+            "user_id": user["id"],
+            "expires_in": expires_in
+        }
+
+        return {"success": True, "session": session}
+    except PasswordHasherBusy:
+        raise
+    except Exception as e:
+        print(" Login error:", e)
+        return {"success": False, "error": str(e)}
+
+
+
+def update_user(user_id: str, name: str = None, email: str = None):
+    try:
+        update_data = {}
+        if name:
+            update_data["name"] = name
+        if email:
+            update_data["email"] = email
+        if not update_data:
+            return {"success": False, "error": "No fields to update"}
+
+        supabase.table("user").update(update_data).eq("id", user_id).execute()
+        record_cache.invalidate(keys=[user_key(user_id)])
+        return {"success": True, "message": "User updated successfully"}
+    except Exception as e:
+        print(" Update error:", e)
+        return {"success": False, "error": str(e)}
+
+
+def delete_user(user_id: str):
+    try:
+        supabase.table("user").delete().eq("id", user_id).execute()
+        record_cache.invalidate(keys=[user_key(user_id)], tags=[vehicle_list_tag(user_id)])
+        return {"success": True, "message": "User deleted successfully"}
+    except Exception as e:
+        print(" Delete error:", e)
+        return {"success": False, "error": str(e)}
+    
+def _load_user(user_id: str):
+    response = supabase.table("user").select(USER_COLUMNS).eq("id", user_id).execute()
+    return response.data[0] if response.data else None
+
+
+def get_user_by_id(user_id: str):
+    try:
+        entry = record_cache.get_or_load("user", user_key(user_id), lambda: _load_user(user_id))
+        if entry is None:
+            return {"success": False, "error": "User not found"}
+        return {"success": True, "user": entry["data"], "etag": entry["etag"]}
+    except Exception as e:
+        print(" Get user by ID error:", e)
         return {"success": False, "error": str(e)}
\ No newline at end of file
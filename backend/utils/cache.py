@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Union
+
+from prometheus_client import Counter
+
+from AI_diagnosis.utils.cache import SQLiteCache, TTLCache
+from utils.etag import make_etag
+
+logger = logging.getLogger("utils.cache")
+
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", "10000"))
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "60"))            # in memory, per worker
+RECORD_CACHE_DB = os.getenv("RECORD_CACHE_DB", "")                       # empty = no shared tier
+RECORD_CACHE_DB_TTL = float(os.getenv("RECORD_CACHE_DB_TTL", "600"))
+
+# columns the API returns; password_hash and anything added later stay in the database
+USER_COLUMNS = "id,name,email,created_at"
+VEHICLE_COLUMNS = "id,user_id,make,model,variant,year,vin,is_primary,created_at"
+
+RECORD_CACHE_REQUESTS = Counter("record_cache_requests_total", "User/vehicle cache lookups", ["kind", "result"])
+
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def vehicle_key(vehicle_id: str) -> str:
+    return f"vehicle:{vehicle_id}"
+
+
+def vehicle_list_key(user_id: str, offset: int, limit: int) -> str:
+    return f"vehicles:{user_id}:{offset}:{limit}"
+
+
+def vehicle_list_tag(user_id: str) -> str:
+    # every page of one user's garage and each of its vehicles; dropped together on any write to it
+    return f"vehicles:{user_id}"
+
+
+class RecordCache:
+    """
+    Read-through cache for user and vehicle rows:
+      1) in-process LRU with TTL (RECORD_CACHE_TTL)
+      2) optional SQLite file shared by the workers on one host (RECORD_CACHE_DB)
+    Entries are {"data": rows, "etag": strong ETag of rows}, so conditional
+    GETs are answered without hashing or serializing anything.
+    Writers call invalidate() with the exact keys/tags they touched. A read
+    that was loading while an invalidation ran returns its result without
+    storing it, since it may predate the write: any invalidation in this
+    worker, or one of its key/tag in any worker sharing the SQLite file.
+    Other workers' memory tiers catch up within RECORD_CACHE_TTL.
+    """
+
+    def __init__(self, maxsize: int = RECORD_CACHE_SIZE, ttl: float = RECORD_CACHE_TTL,
+                 db_path: str = RECORD_CACHE_DB, db_ttl: float = RECORD_CACHE_DB_TTL):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared: Optional[SQLiteCache] = None
+        if db_path:
+            try:
+                self.shared = SQLiteCache(db_path, ttl=db_ttl)
+            except Exception as e:
+                logger.error("Could not open record cache DB %s: %s", db_path, e)
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+        self._tagged = 0        # keys added to _keys_by_tag since it was last pruned
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, kind: str, key: str, load: Callable[[], Any],
+                    tag: Union[str, Callable[[Any], str], None] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cached entry for key, else one built from load() (blocking); None when
+        load() finds nothing. tag may be a function of the loaded record
+        (e.g. its owner), for records whose tag isn't known before loading.
+        """
+        entry = self.memory.get(key)
+        if entry is not None:
+            RECORD_CACHE_REQUESTS.labels(kind, "memory_hit").inc()
+            return entry
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                logger.error("Record cache DB read failed: %s", e)
+            if entry is not None:
+                RECORD_CACHE_REQUESTS.labels(kind, "shared_hit").inc()
+                with self._lock:
+                    self._remember(key, entry, tag(entry["data"]) if callable(tag) else tag)
+                return entry
+        RECORD_CACHE_REQUESTS.labels(kind, "miss").inc()
+
+        started = time.time()
+        invalidations = self._invalidations
+        value = load()
+        if value is None:
+            return None
+        entry = {"data": value, "etag": make_etag(value)}
+        if callable(tag):
+            tag = tag(value)
+        if self.shared is not None:
+            try:
+                if not self.shared.set_unless_invalidated(key, entry, since=started, tag=tag):
+                    return entry
+            except Exception as e:
+                logger.error("Record cache DB write failed: %s", e)
+        with self._lock:
+            if self._invalidations == invalidations:
+                self._remember(key, entry, tag)
+        return entry
+
+    def _remember(self, key: str, entry: Dict[str, Any], tag: Optional[str]) -> None:
+        # caller holds self._lock
+        self.memory.set(key, entry)
+        if tag:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+            self._tagged += 1
+            if self._tagged > self.memory.maxsize:
+                self._prune_tags()
+
+    def _prune_tags(self) -> None:
+        # caller holds self._lock; forget keys the memory tier has since evicted or expired
+        pruned: Dict[str, Set[str]] = {}
+        for tag, keys in self._keys_by_tag.items():
+            live = {key for key in keys if key in self.memory}
+            if live:
+                pruned[tag] = live
+        self._keys_by_tag = pruned
+        self._tagged = 0
+
+    def invalidate(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        """Drop exactly these keys and every key stored under these tags, in both tiers."""
+        keys, tags = list(keys), list(tags)
+        with self._lock:
+            self._invalidations += 1
+            tagged = [key for tag in tags for key in self._keys_by_tag.pop(tag, set())]
+        for key in keys + tagged:
+            self.memory.pop(key)
+        if self.shared is not None:
+            try:
+                self.shared.invalidate(keys, tags)
+            except Exception as e:
+                logger.error("Record cache DB invalidation failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"memory": self.memory.stats()}
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+
+record_cache = RecordCache()
@@ -1,10 +1,3 @@
-from supabase import create_client, Client
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# One Supabase client per process, shared with AI_diagnosis: created on first
+# use and closed by the app lifespan (AI_diagnosis/resources.py).
+from AI_diagnosis.db.db_engine import supabase
@@ -0,0 +1,34 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Response
+
+# clients may keep the body but must revalidate it (If-None-Match) before every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(value: Any) -> str:
+    """Strong ETag: a hash of the record's canonical JSON, so any write that changes it changes the tag."""
+    raw = json.dumps(value, separators=(",", ":"), sort_keys=True, default=str)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (RFC 9110: weak comparison, "*" matches anything)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("utils.passwords")
+
+# bcrypt cost factor; hashes made with any other cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# processes doing bcrypt (each ~250ms of CPU per call at cost 12)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# calls allowed to wait for a worker; past that, auth answers 503 instead of queueing
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+HASH_SECONDS = Histogram(
+    "auth_password_hash_seconds",
+    "bcrypt time inside a hashing worker",
+    ["op"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4),
+)
+HASH_WAIT_SECONDS = Histogram(
+    "auth_password_hash_wait_seconds",
+    "Time a hash/verify call waited for a free worker",
+    ["op"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HASH_QUEUE_DEPTH = Gauge(
+    "auth_password_hash_queue_depth",
+    "Hash/verify calls admitted and not finished (running + waiting)",
+    multiprocess_mode="livesum",
+)
+HASH_REJECTED = Counter("auth_password_hash_rejected_total", "Hash/verify calls refused because the queue was full", ["op"])
+
+
+class PasswordHasherBusy(Exception):
+    """Every worker is busy and the admission queue is full."""
+
+
+# ---------- worker side (runs in the pool processes) ----------
+
+def _hash(password: str) -> Tuple[str, float]:
+    started = time.perf_counter()
+    return pwd_context.hash(password), time.perf_counter() - started
+
+
+def _verify(password: str, password_hash: str) -> Tuple[bool, float]:
+    started = time.perf_counter()
+    return pwd_context.verify(password, password_hash), time.perf_counter() - started
+
+
+def _ping() -> None:
+    pass
+
+
+# ---------- API side ----------
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small process pool so hashing neither holds the GIL
+    nor takes Starlette's thread pool away from other routes. At most
+    PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE calls are admitted at once;
+    the rest fail fast with PasswordHasherBusy.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue: int = PASSWORD_HASH_QUEUE):
+        self.workers = workers
+        self.limit = workers + queue
+        self.inflight = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn, not fork: the API process already runs threads (db-io, prompt log)
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    def start(self) -> None:
+        """Spawn the workers now so the first logins don't pay for process startup."""
+        pool = self._executor()
+        for _ in range(self.workers):
+            pool.submit(_ping)
+
+    def _reset(self, broken: ProcessPoolExecutor) -> None:
+        # a worker died (OOM, segfault): the pool refuses every later call, so replace it
+        with self._lock:
+            if self._pool is broken:
+                logger.error("Password hashing pool broke; starting a new one")
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, op: str, fn, *args):
+        if self.inflight >= self.limit:
+            HASH_REJECTED.labels(op).inc()
+            raise PasswordHasherBusy(f"{self.inflight} password {op} calls already in flight")
+        self.inflight += 1
+        HASH_QUEUE_DEPTH.inc()
+        started = time.perf_counter()
+        try:
+            pool = self._executor()
+            try:
+                result, seconds = await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                self._reset(pool)
+                result, seconds = await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        finally:
+            self.inflight -= 1
+            HASH_QUEUE_DEPTH.dec()
+        HASH_SECONDS.labels(op).observe(seconds)
+        HASH_WAIT_SECONDS.labels(op).observe(max(0.0, time.perf_counter() - started - seconds))
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run("verify", _verify, password, password_hash)
+
+    @staticmethod
+    def needs_update(password_hash: str) -> bool:
+        """True when the hash was made with another cost factor (cheap: parses the hash only)."""
+        return pwd_context.needs_update(password_hash)
+
+
+password_hasher = PasswordHasher()